@@ -0,0 +1,196 @@
+"""Scripted chat sessions replaying the calls of the chat frontend"""
+
+import time
+import uuid
+from logging import getLogger
+from typing import Optional
+
+import requests
+from opengpts_client.cache import CacheTTL, MemoryCache
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.pool import OpenGPTsClientPool
+from opengpts_client.schema import Message
+
+from load_test.stats import Sample
+
+logger = getLogger(__name__)
+
+
+class ChatSession:
+    """Chat session of one user as the frontend runs it
+
+    Each turn repeats what a Streamlit rerun does before the prompt is sent
+    (list assistants, list threads, load the open thread), then streams
+    the run with the "latest" prefetch policy. The pool and its response
+    cache are shared by every session like the frontend's cache_resource.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        assistant_id: str,
+        turns: int = 3,
+        think_time: float = 1.0,
+        expected_answer: Optional[str] = None,
+        pool: Optional[OpenGPTsClientPool] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            url (str): OpenGPTs URL
+            assistant_id (str): assistant id
+            turns (int, optional): prompts per session. Defaults to 3.
+            think_time (float, optional): \
+                seconds between turns. Defaults to 1.0.
+            expected_answer (Optional[str], optional): answers differing \
+                from this count as errors. Defaults to None (not checked).
+            pool (Optional[OpenGPTsClientPool], optional): \
+                client pool. Defaults to None (a frontend-like pool).
+        """
+        self.url = url
+        self.assistant_id = assistant_id
+        self.turns = turns
+        self.think_time = think_time
+        self.expected_answer = expected_answer
+        self.pool = pool or OpenGPTsClientPool(
+            cache=MemoryCache(),
+            cache_ttl=CacheTTL(),
+        )
+
+    def __call__(self, scheduled_at: float) -> list[Sample]:
+        """Run a session
+
+        Args:
+            scheduled_at (float): perf counter the session was due at
+
+        Returns:
+            list[Sample]: one sample per turn
+        """
+        client = self.pool.client(
+            url=self.url,
+            opengpts_user_id=str(uuid.uuid4()),
+        )
+        samples: list[Sample] = []
+        thread_id: Optional[str] = None
+        started_at = scheduled_at
+        for turn in range(self.turns):
+            if turn > 0:
+                time.sleep(self.think_time)
+                started_at = time.perf_counter()
+            sample, thread_id = self.turn(
+                client,
+                thread_id,
+                f"question {turn}",
+                started_at,
+            )
+            samples.append(sample)
+            if sample.error is not None:
+                break
+        return samples
+
+    def turn(
+        self,
+        client: OpenGPTsClient,
+        thread_id: Optional[str],
+        prompt: str,
+        started_at: float,
+    ) -> tuple[Sample, Optional[str]]:
+        """Send one prompt
+
+        Args:
+            client (OpenGPTsClient): client of the user
+            thread_id (Optional[str]): open thread. None for a new one
+            prompt (str): prompt
+            started_at (float): perf counter the turn started at
+
+        Returns:
+            tuple[Sample, Optional[str]]: sample and the thread id
+        """
+        latencies: dict[str, float] = {}
+        answer = ""
+        try:
+            client.get_assistant_list()
+            client.get_thread_list()
+            if thread_id is None:
+                thread_id = client.create_thread(
+                    name=prompt,
+                    assistant_id=self.assistant_id,
+                ).thread_id
+            else:
+                client.get_messages(thread_id)
+            latencies["prepare"] = time.perf_counter() - started_at
+
+            message = Message(type="human", content=prompt)
+            with client.run_stream(
+                assistant_id=self.assistant_id,
+                thread_id=thread_id,
+                messages=[message],
+                prefetch="latest",
+            ) as response:
+                for messages in response:
+                    if len(messages) == 0 or messages[-1].type != "ai":
+                        continue
+                    answer = str(messages[-1].content)
+                    if "ttft" not in latencies and answer != "":
+                        latencies["ttft"] = time.perf_counter() - started_at
+        except requests.HTTPError as e:
+            return self._failed(started_at, _status(e), latencies), thread_id
+        except Exception as e:
+            return self._failed(started_at, type(e).__name__), thread_id
+
+        finished_at = time.perf_counter()
+        latencies["total"] = finished_at - started_at
+        error = None
+        if answer == "":
+            # the client does not raise on a rejected stream, it is empty
+            error = "no_answer"
+        elif self.expected_answer not in (None, answer):
+            error = "unexpected_answer"
+        return (
+            Sample(
+                started_at=started_at,
+                finished_at=finished_at,
+                latencies=latencies,
+                error=error,
+            ),
+            thread_id,
+        )
+
+    def _failed(
+        self,
+        started_at: float,
+        error: str,
+        latencies: Optional[dict[str, float]] = None,
+    ) -> Sample:
+        """Sample of a failed turn
+
+        Args:
+            started_at (float): perf counter the turn started at
+            error (str): error kind
+            latencies (Optional[dict[str, float]], optional): \
+                latencies measured before the failure. Defaults to None.
+
+        Returns:
+            Sample: sample
+        """
+        logger.debug("chat turn failed: %s", error)
+        return Sample(
+            started_at=started_at,
+            finished_at=time.perf_counter(),
+            latencies=latencies or {},
+            error=error,
+        )
+
+
+def _status(error: requests.HTTPError) -> str:
+    """Error kind of an HTTP error
+
+    Args:
+        error (requests.HTTPError): error
+
+    Returns:
+        str: e.g. "http_503", or "stream_error" for SSE error events
+    """
+    if error.response is None:
+        return "stream_error"
+    return f"http_{error.response.status_code}"
@@ -0,0 +1,248 @@
+"""Bytes on the wire and latency with and without transport compression"""
+
+import random
+import tempfile
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.compression import CompressionConfig, Encoding
+from opengpts_client.schema import Message
+from pydantic import BaseModel, Field
+
+from load_test.mock_server import MockServer
+from load_test.stats import LatencySummary, summarize
+
+WORDS = (
+    "the assistant answered thread message retrieval document search "
+    "context question user slack channel reply summary token stream "
+    "ingest chunk overlap separator embedding vector result source page"
+).split()
+
+
+class CompressionCase(BaseModel):
+    """Compression setting of the client under test"""
+
+    name: str = Field(..., title="case name")
+    accept_encodings: list[Encoding] = Field(
+        [],
+        title="accepted response encodings. Empty is identity",
+    )
+    request_encoding: Optional[Encoding] = Field(
+        None,
+        title="request body encoding",
+    )
+
+    def config(self) -> CompressionConfig:
+        """Client compression setting
+
+        Returns:
+            CompressionConfig: setting
+        """
+        return CompressionConfig(
+            accept_encodings=self.accept_encodings,
+            request_encoding=self.request_encoding,
+        )
+
+
+DEFAULT_CASES = [
+    CompressionCase(name="identity"),
+    CompressionCase(
+        name="gzip",
+        accept_encodings=["gzip"],
+        request_encoding="gzip",
+    ),
+    CompressionCase(
+        name="zstd",
+        accept_encodings=["zstd"],
+        request_encoding="zstd",
+    ),
+]
+
+
+class TransferReport(BaseModel):
+    """Result of one operation with one compression setting"""
+
+    case: str = Field(..., title="case name")
+    operation: str = Field(..., title="client operation")
+    requests: int = Field(..., title="repetitions")
+    sent_bytes: int = Field(..., title="request body bytes per request")
+    received_bytes: int = Field(..., title="response body bytes per request")
+    latency: LatencySummary = Field(..., title="latency per request")
+
+
+def sample_text(rng: random.Random, words: int) -> str:
+    """Text looking like chat content
+
+    Args:
+        rng (random.Random): random source
+        words (int): number of words
+
+    Returns:
+        str: text
+    """
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+class CompressionBenchmark:
+    """Compare compression settings against the mock OpenGPTs
+
+    Every operation is repeated sequentially so the byte counters of the
+    mock belong to that operation only. The thread read and streamed by
+    each case holds the same seeded messages.
+    """
+
+    def __init__(
+        self,
+        mock: MockServer,
+        messages: int = 200,
+        message_words: int = 80,
+        ingest_bytes: int = 1_000_000,
+        repeat: int = 20,
+        seed: int = 0,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            mock (MockServer): running mock server
+            messages (int, optional): \
+                messages of the benchmark thread. Defaults to 200.
+            message_words (int, optional): \
+                words per message. Defaults to 80.
+            ingest_bytes (int, optional): \
+                size of the uploaded file. Defaults to 1_000_000.
+            repeat (int, optional): \
+                repetitions per operation. Defaults to 20.
+            seed (int, optional): random seed. Defaults to 0.
+        """
+        self.mock = mock
+        self.repeat = repeat
+        rng = random.Random(seed)  # noqa: S311
+        self.history = [
+            {
+                "type": "human" if i % 2 == 0 else "ai",
+                "content": sample_text(rng, message_words),
+                "id": str(uuid.uuid4()),
+            }
+            for i in range(messages)
+        ]
+        words = max(1, ingest_bytes // 8)
+        self.ingest_text = sample_text(rng, words)[:ingest_bytes]
+
+    def _thread(self, user_id: str) -> str:
+        """Create a thread holding the seeded messages
+
+        Args:
+            user_id (str): opengpts user id
+
+        Returns:
+            str: thread id
+        """
+        opengpts = self.mock.opengpts
+        thread = opengpts.create_thread(user_id, {"name": "benchmark"})
+        opengpts.add_messages(thread["thread_id"], self.history)
+        return str(thread["thread_id"])
+
+    def _measure(
+        self,
+        case: CompressionCase,
+        operation: str,
+        call: Callable[[], Any],
+    ) -> TransferReport:
+        """Repeat an operation and count its transfer
+
+        Args:
+            case (CompressionCase): compression setting
+            operation (str): operation name
+            call (Callable[[], Any]): one request
+
+        Returns:
+            TransferReport: result
+        """
+        received_before, sent_before = self.mock.transferred()
+        latencies = []
+        for _ in range(self.repeat):
+            started_at = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - started_at)
+        received_after, sent_after = self.mock.transferred()
+        return TransferReport(
+            case=case.name,
+            operation=operation,
+            requests=self.repeat,
+            sent_bytes=(received_after - received_before) // self.repeat,
+            received_bytes=(sent_after - sent_before) // self.repeat,
+            latency=summarize(latencies),
+        )
+
+    def run_case(self, case: CompressionCase) -> list[TransferReport]:
+        """Measure every operation with one setting
+
+        Args:
+            case (CompressionCase): compression setting
+
+        Returns:
+            list[TransferReport]: one report per operation
+        """
+        user_id = f"benchmark-{case.name}"
+        client = OpenGPTsClient(
+            url=self.mock.url,
+            opengpts_user_id=user_id,
+            compression=case.config(),
+        )
+        assistant_id = self.mock.opengpts.config.assistant_id
+        thread_id = self._thread(user_id)
+        prompt = Message(type="human", content="benchmark", example=False)
+
+        def stream() -> None:
+            # a fresh thread per run keeps every run the same size
+            for _ in client.run_stream(
+                assistant_id,
+                self._thread(user_id),
+                [prompt],
+            ):
+                pass
+
+        with tempfile.TemporaryDirectory() as directory:
+            upload = Path(directory) / "benchmark.txt"
+            upload.write_text(self.ingest_text)
+            try:
+                return [
+                    self._measure(
+                        case,
+                        "get_messages",
+                        lambda: client.get_messages(thread_id),
+                    ),
+                    self._measure(case, "run_stream", stream),
+                    self._measure(
+                        case,
+                        "ingest",
+                        lambda: client.ingest_retrivers_files(
+                            [upload],
+                            assistant_id,
+                        ),
+                    ),
+                ]
+            finally:
+                client.close()
+
+    def run(
+        self,
+        cases: Optional[list[CompressionCase]] = None,
+    ) -> list[TransferReport]:
+        """Measure every setting
+
+        Args:
+            cases (Optional[list[CompressionCase]], optional): \
+                settings. Defaults to None (DEFAULT_CASES).
+
+        Returns:
+            list[TransferReport]: reports
+        """
+        return [
+            report
+            for case in cases or DEFAULT_CASES
+            for report in self.run_case(case)
+        ]
@@ -0,0 +1,308 @@
+"""Load test of the chat frontend and slack bot against a mock OpenGPTs
+
+Usage:
+    python -m load_test.main mock-server --port 8100 --token-rate 30
+    python -m load_test.main chat --rate 2 --duration 30
+    python -m load_test.main slack --ramp 1,2,4,8 --slo-p95-ms 10000
+    python -m load_test.main compression --messages 200 --repeat 20
+"""
+
+import argparse
+import logging
+import sys
+from typing import Optional
+
+import orjson
+
+from load_test.chat import ChatSession
+from load_test.compression import CompressionBenchmark, TransferReport
+from load_test.mock_server import MockConfig, MockServer, answer_text
+from load_test.slack import (
+    DEFAULT_SIGNING_SECRET,
+    SlackSession,
+    configure_bot,
+    http_target,
+    in_process_target,
+)
+from load_test.stats import SLO, Session, StageReport, ramp, run_stage
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments
+
+    Args:
+        argv (Optional[list[str]], optional): \
+            arguments. Defaults to None (sys.argv).
+
+    Returns:
+        argparse.Namespace: arguments
+    """
+    mock = argparse.ArgumentParser(add_help=False)
+    mock.add_argument("--host", default="127.0.0.1")
+    mock.add_argument("--port", type=int, default=0)
+    mock.add_argument(
+        "--token-rate",
+        type=float,
+        default=50.0,
+        help="tokens per second streamed by the mock",
+    )
+    mock.add_argument("--answer-tokens", type=int, default=40)
+    mock.add_argument("--first-token-delay", type=float, default=0.2)
+    mock.add_argument(
+        "--error-rate",
+        type=float,
+        default=0.0,
+        help="fraction of mock runs failing",
+    )
+    mock.add_argument(
+        "--max-runs",
+        type=int,
+        default=0,
+        help="concurrent mock runs before 503 (0: unlimited)",
+    )
+
+    load = argparse.ArgumentParser(add_help=False)
+    load.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="sessions started per second",
+    )
+    load.add_argument(
+        "--ramp",
+        help="comma separated rates; stops at the first one breaking the SLO",
+    )
+    load.add_argument("--duration", type=float, default=30.0)
+    load.add_argument("--concurrency", type=int, default=256)
+    load.add_argument("--turns", type=int, default=1)
+    load.add_argument("--think-time", type=float, default=1.0)
+    load.add_argument(
+        "--slo-metric",
+        default="total",
+        choices=["ttft", "total", "ack"],
+    )
+    load.add_argument("--slo-p95-ms", type=float, default=10000.0)
+    load.add_argument("--slo-error-rate", type=float, default=0.01)
+    load.add_argument("--json", action="store_true", help="print JSON")
+
+    parser = argparse.ArgumentParser(prog="load-test")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser(
+        "mock-server",
+        parents=[mock],
+        help="serve the mock OpenGPTs / Slack Web API",
+    )
+    chat = commands.add_parser(
+        "chat",
+        parents=[mock, load],
+        help="scripted chat sessions through the OpenGPTs client",
+    )
+    chat.add_argument(
+        "--opengpts-url",
+        help="test a running OpenGPTs instead of the mock",
+    )
+    chat.add_argument("--assistant-id")
+    slack = commands.add_parser(
+        "slack",
+        parents=[mock, load],
+        help="synthetic app_mention events into the slack bot",
+    )
+    slack.add_argument(
+        "--slack-url",
+        help="POST to a running slack bot instead of calling it in process "
+        "(the bot has to use the mock as OPENGPTS_URL and SLACK_API_URL)",
+    )
+    slack.add_argument("--signing-secret", default=DEFAULT_SIGNING_SECRET)
+    slack.add_argument("--workspaces", type=int, default=1)
+    slack.add_argument("--timeout", type=float, default=120.0)
+    compression = commands.add_parser(
+        "compression",
+        parents=[mock],
+        help="bytes on the wire and latency per compression setting",
+    )
+    compression.add_argument(
+        "--messages",
+        type=int,
+        default=200,
+        help="messages of the thread read and streamed",
+    )
+    compression.add_argument("--message-words", type=int, default=80)
+    compression.add_argument("--ingest-bytes", type=int, default=1_000_000)
+    compression.add_argument("--repeat", type=int, default=20)
+    compression.add_argument("--json", action="store_true", help="print JSON")
+    return parser.parse_args(argv)
+
+
+def mock_config(args: argparse.Namespace) -> MockConfig:
+    """Mock behaviour from arguments
+
+    Args:
+        args (argparse.Namespace): arguments
+
+    Returns:
+        MockConfig: mock behaviour
+    """
+    return MockConfig(
+        token_rate=args.token_rate,
+        answer_tokens=args.answer_tokens,
+        first_token_delay=args.first_token_delay,
+        error_rate=args.error_rate,
+        max_runs=args.max_runs,
+    )
+
+
+def print_stage(stage: StageReport) -> None:
+    """Print a stage as a table row
+
+    Args:
+        stage (StageReport): stage report
+    """
+    latency = " ".join(
+        f"{name}[p50={s.p50_ms:.0f} p95={s.p95_ms:.0f} p99={s.p99_ms:.0f}]"
+        for name, s in stage.latency.items()
+    )
+    print(
+        f"rate={stage.rate:g}/s requests={stage.requests} "
+        f"errors={stage.error_rate:.2%} {stage.error_kinds or ''} "
+        f"throughput={stage.throughput:.2f}/s {latency}",
+    )
+
+
+def print_transfers(reports: list[TransferReport]) -> None:
+    """Print compression results as a table
+
+    Args:
+        reports (list[TransferReport]): reports
+    """
+    print(
+        f"{'case':<10}{'operation':<14}{'sent B':>12}{'received B':>12}"
+        f"{'p50 ms':>10}{'p95 ms':>10}",
+    )
+    for r in reports:
+        print(
+            f"{r.case:<10}{r.operation:<14}{r.sent_bytes:>12}"
+            f"{r.received_bytes:>12}{r.latency.p50_ms:>10.1f}"
+            f"{r.latency.p95_ms:>10.1f}",
+        )
+
+
+def run(args: argparse.Namespace, session: Session) -> None:
+    """Run one stage or a ramp and print the result
+
+    Args:
+        args (argparse.Namespace): arguments
+        session (Session): scripted session
+    """
+    if args.ramp is None:
+        stage = run_stage(session, args.rate, args.duration, args.concurrency)
+        if args.json:
+            print(stage.model_dump_json(indent=2))
+        else:
+            print_stage(stage)
+        return
+
+    slo = SLO(
+        metric=args.slo_metric,
+        p95_ms=args.slo_p95_ms,
+        max_error_rate=args.slo_error_rate,
+    )
+    stages, sustainable = ramp(
+        session,
+        rates=[float(rate) for rate in args.ramp.split(",")],
+        duration=args.duration,
+        concurrency=args.concurrency,
+        slo=slo,
+        on_stage=None if args.json else print_stage,
+    )
+    if args.json:
+        print(
+            orjson.dumps(
+                {
+                    "slo": slo.model_dump(),
+                    "stages": [stage.model_dump() for stage in stages],
+                    "max_sustainable": (
+                        None if sustainable is None else sustainable.rate
+                    ),
+                },
+                option=orjson.OPT_INDENT_2,
+            ).decode(),
+        )
+    elif sustainable is None:
+        print("no rate met the SLO")
+    else:
+        print(
+            f"max sustainable: {sustainable.rate:g} sessions/s "
+            f"({sustainable.throughput:.2f} requests/s)",
+        )
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Entry point
+
+    Args:
+        argv (Optional[list[str]], optional): \
+            arguments. Defaults to None (sys.argv).
+    """
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, stream=sys.stderr)
+
+    mock = MockServer(mock_config(args), host=args.host, port=args.port)
+    if args.command == "mock-server":
+        print(f"OPENGPTS_URL={mock.url}")
+        print(f"SLACK_API_URL={mock.slack_api_url}")
+        mock.serve_forever()
+        return
+
+    if args.command == "compression":
+        with mock:
+            reports = CompressionBenchmark(
+                mock,
+                messages=args.messages,
+                message_words=args.message_words,
+                ingest_bytes=args.ingest_bytes,
+                repeat=args.repeat,
+            ).run()
+        if args.json:
+            print(
+                orjson.dumps(
+                    [report.model_dump() for report in reports],
+                    option=orjson.OPT_INDENT_2,
+                ).decode(),
+            )
+        else:
+            print_transfers(reports)
+        return
+
+    expected = answer_text(args.answer_tokens)
+    with mock:
+        if args.command == "chat":
+            session: Session = ChatSession(
+                url=args.opengpts_url or mock.url,
+                assistant_id=(
+                    args.assistant_id or mock.opengpts.config.assistant_id
+                ),
+                turns=args.turns,
+                think_time=args.think_time,
+                expected_answer=None if args.opengpts_url else expected,
+            )
+        else:
+            configure_bot(mock, args.signing_secret)
+            session = SlackSession(
+                target=(
+                    in_process_target()
+                    if args.slack_url is None
+                    else http_target(args.slack_url)
+                ),
+                mock=mock,
+                signing_secret=args.signing_secret,
+                turns=args.turns,
+                think_time=args.think_time,
+                workspaces=args.workspaces,
+                timeout=args.timeout,
+                expected_answer=expected,
+            )
+        run(args, session)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,770 @@
+"""Mock OpenGPTs and Slack Web API server"""
+
+import gzip
+import itertools
+import random
+import threading
+import time
+import uuid
+import zlib
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qs, urlparse
+
+import orjson
+from pydantic import BaseModel, Field
+
+try:
+    import zstandard
+
+    HAS_ZSTANDARD = True
+except ImportError:  # zstandard is only needed to serve zstd
+    HAS_ZSTANDARD = False
+
+logger = getLogger(__name__)
+
+MOCK_MIN_COMPRESS_SIZE = 500
+"""responses smaller than this are sent uncompressed (like GZipMiddleware)"""
+
+MOCK_BOT_USER_ID = "UMOCKBOT"
+MOCK_ASSISTANT_ID = "mock-assistant"
+
+
+class MockConfig(BaseModel):
+    """Mock server behaviour"""
+
+    token_rate: float = Field(50.0, title="streamed tokens per second")
+    answer_tokens: int = Field(40, title="tokens of every answer")
+    first_token_delay: float = Field(
+        0.2,
+        title="seconds before the first token (retrieval, prompt, etc.)",
+    )
+    error_rate: float = Field(
+        0.0,
+        title="fraction of runs failing with an error event",
+    )
+    max_runs: int = Field(
+        0,
+        title="concurrent runs before 503 is returned. 0 is unlimited",
+    )
+    assistant_id: str = Field(MOCK_ASSISTANT_ID, title="assistant id")
+
+
+def answer_text(tokens: int) -> str:
+    """Answer streamed by every mock run
+
+    Args:
+        tokens (int): answer tokens
+
+    Returns:
+        str: answer
+    """
+    return " ".join(f"token{i}" for i in range(tokens))
+
+
+def _now() -> str:
+    """Current timestamp of OpenGPTs resources
+
+    Returns:
+        str: ISO 8601 timestamp
+    """
+    return datetime.now(timezone.utc).isoformat()
+
+
+class MockOpenGPTs:
+    """In-memory OpenGPTs backend streaming answers at a fixed token rate"""
+
+    def __init__(self, config: MockConfig) -> None:
+        """コンストラクタ
+
+        Args:
+            config (MockConfig): mock behaviour
+        """
+        self.config = config
+        self.assistant = {
+            "assistant_id": config.assistant_id,
+            "user_id": "mock",
+            "name": "Mock Assistant",
+            "config": {"configurable": {"type": "mock"}},
+            "updated_at": _now(),
+            "public": True,
+        }
+        self._lock = threading.Lock()
+        self._threads: dict[str, dict[str, Any]] = {}
+        self._messages: dict[str, list[dict[str, Any]]] = {}
+        self._active_runs = 0
+        self.runs = 0
+        self.rejected_runs = 0
+
+    def list_threads(self, user_id: str) -> list[dict[str, Any]]:
+        """Threads of a user
+
+        Args:
+            user_id (str): opengpts user id
+
+        Returns:
+            list[dict[str, Any]]: threads
+        """
+        with self._lock:
+            return [
+                thread
+                for thread in self._threads.values()
+                if thread["user_id"] == user_id
+            ]
+
+    def get_thread(self, thread_id: str) -> Optional[dict[str, Any]]:
+        """Thread by id
+
+        Args:
+            thread_id (str): thread id
+
+        Returns:
+            Optional[dict[str, Any]]: thread. None if it does not exist
+        """
+        with self._lock:
+            return self._threads.get(thread_id)
+
+    def create_thread(
+        self,
+        user_id: str,
+        body: dict[str, Any],
+    ) -> dict[str, Any]:
+        """Create a thread
+
+        Args:
+            user_id (str): opengpts user id
+            body (dict[str, Any]): request body
+
+        Returns:
+            dict[str, Any]: thread
+        """
+        thread = {
+            "thread_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "assistant_id": body.get("assistant_id", self.config.assistant_id),
+            "name": body.get("name", ""),
+            "updated_at": _now(),
+        }
+        with self._lock:
+            self._threads[thread["thread_id"]] = thread
+            self._messages[thread["thread_id"]] = []
+        return thread
+
+    def messages(self, thread_id: str) -> list[dict[str, Any]]:
+        """Messages of a thread
+
+        Args:
+            thread_id (str): thread id
+
+        Returns:
+            list[dict[str, Any]]: messages
+        """
+        with self._lock:
+            return list(self._messages.get(thread_id, []))
+
+    def add_messages(
+        self,
+        thread_id: str,
+        messages: list[dict[str, Any]],
+    ) -> None:
+        """Append messages to a thread without running it
+
+        Args:
+            thread_id (str): thread id
+            messages (list[dict[str, Any]]): messages
+        """
+        with self._lock:
+            self._messages.setdefault(thread_id, []).extend(messages)
+
+    def start_run(self) -> bool:
+        """Take a run slot
+
+        Returns:
+            bool: started or rejected by `max_runs`
+        """
+        with self._lock:
+            if 0 < self.config.max_runs <= self._active_runs:
+                self.rejected_runs += 1
+                return False
+            self._active_runs += 1
+            self.runs += 1
+            return True
+
+    def stream_run(
+        self,
+        body: dict[str, Any],
+        send: Callable[[str, Any], None],
+    ) -> None:
+        """Stream a run as SSE events
+
+        Every data event carries the whole thread like OpenGPTs does.
+
+        Args:
+            body (dict[str, Any]): run request body
+            send (Callable[[str, Any], None]): sends one event
+        """
+        try:
+            thread_id = body["thread_id"]
+            history = self.messages(thread_id) + [
+                {**m, "id": str(uuid.uuid4())} for m in body.get("input", [])
+            ]
+            send("metadata", {"run_id": str(uuid.uuid4())})
+            time.sleep(self.config.first_token_delay)
+
+            if random.random() < self.config.error_rate:  # noqa: S311
+                send("error", {"status_code": 500, "message": "mock error"})
+                return
+
+            ai = {"type": "ai", "content": "", "id": str(uuid.uuid4())}
+            interval = 1 / self.config.token_rate
+            tokens = answer_text(self.config.answer_tokens).split(" ")
+            for i, token in enumerate(tokens):
+                ai["content"] = f"{ai['content']} {token}" if i else token
+                send("data", history + [ai])
+                time.sleep(interval)
+            with self._lock:
+                self._messages[thread_id] = history + [ai]
+                if thread_id in self._threads:
+                    self._threads[thread_id]["updated_at"] = _now()
+            send("end", None)
+        finally:
+            with self._lock:
+                self._active_runs -= 1
+
+    def metrics(self) -> dict[str, Any]:
+        """Mock metrics
+
+        Returns:
+            dict[str, Any]: runs and threads
+        """
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "active_runs": self._active_runs,
+                "rejected_runs": self.rejected_runs,
+                "threads": len(self._threads),
+            }
+
+
+class SlackRecord(BaseModel):
+    """Message posted or updated through the mock Slack Web API"""
+
+    at: float = Field(..., title="time.perf_counter() of the call")
+    method: str = Field(..., title="Web API method")
+    text: str = Field(..., title="fallback text")
+    blocks: str = Field(..., title="blocks as JSON")
+
+
+class MockSlack:
+    """Slack Web API recording replies per thread
+
+    Replies are keyed by the `thread_ts` of `chat.postMessage`, i.e. the
+    ts of the mention that started the conversation.
+    """
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self._condition = threading.Condition()
+        self._ts = itertools.count(1)
+        self._thread_of: dict[tuple[str, str], str] = {}
+        self._replies: dict[str, list[SlackRecord]] = {}
+
+    def call(self, method: str, params: dict[str, Any]) -> dict[str, Any]:
+        """Handle a Web API call
+
+        Args:
+            method (str): method name, e.g. "chat.postMessage"
+            params (dict[str, Any]): arguments
+
+        Returns:
+            dict[str, Any]: response
+        """
+        if method == "auth.test":
+            return {
+                "ok": True,
+                "url": "https://mock.slack.com/",
+                "team": "mock",
+                "user": "mockbot",
+                "team_id": "TMOCK",
+                "user_id": MOCK_BOT_USER_ID,
+                "bot_id": "BMOCK",
+            }
+        if method not in ("chat.postMessage", "chat.update"):
+            return {"ok": True}
+
+        channel = str(params.get("channel", ""))
+        record = SlackRecord(
+            at=time.perf_counter(),
+            method=method,
+            text=str(params.get("text", "")),
+            blocks=orjson.dumps(params.get("blocks") or []).decode(),
+        )
+        with self._condition:
+            if method == "chat.postMessage":
+                ts = f"{int(time.time())}.{next(self._ts):06d}"
+                thread_ts = str(params.get("thread_ts") or ts)
+                self._thread_of[(channel, ts)] = thread_ts
+            else:
+                ts = str(params.get("ts", ""))
+                thread_ts = self._thread_of.get((channel, ts), ts)
+            self._replies.setdefault(thread_ts, []).append(record)
+            self._condition.notify_all()
+        return {"ok": True, "channel": channel, "ts": ts, "text": record.text}
+
+    def wait(
+        self,
+        thread_ts: str,
+        done: Callable[[list[SlackRecord]], bool],
+        timeout: float,
+    ) -> list[SlackRecord]:
+        """Wait until the replies of a thread are done
+
+        Args:
+            thread_ts (str): ts of the thread root
+            done (Callable[[list[SlackRecord]], bool]): completion check
+            timeout (float): max seconds to wait
+
+        Returns:
+            list[SlackRecord]: replies so far
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            while not done(self._replies.get(thread_ts, [])):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            return list(self._replies.get(thread_ts, []))
+
+    def forget(self, thread_ts: str) -> None:
+        """Drop the records of a thread
+
+        Args:
+            thread_ts (str): ts of the thread root
+        """
+        with self._condition:
+            self._replies.pop(thread_ts, None)
+            self._thread_of = {
+                key: value
+                for key, value in self._thread_of.items()
+                if value != thread_ts
+            }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Request handler of `MockServer`"""
+
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately; like uvicorn set
+    # TCP_NODELAY so small writes are not held back by delayed ACKs
+    disable_nagle_algorithm = True
+    server: "_HTTPServer"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Log requests at debug level"""
+        logger.debug(format, *args)
+
+    def _body(self) -> bytes:
+        """Read the request body
+
+        Returns:
+            bytes: decoded body
+        """
+        if self.headers.get("Transfer-Encoding", "") == "chunked":
+            chunks = []
+            while (size := int(self.rfile.readline().strip(), 16)) > 0:
+                chunks.append(self.rfile.read(size))
+                self.rfile.readline()
+            self.rfile.readline()
+            body = b"".join(chunks)
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.transfer(received=len(body))
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "zstd" and HAS_ZSTANDARD:
+            body = (
+                zstandard.ZstdDecompressor()
+                .decompressobj()
+                .decompress(
+                    body,
+                )
+            )
+        return body
+
+    def _encoding(self) -> Optional[str]:
+        """Response encoding negotiated with Accept-Encoding
+
+        Returns:
+            Optional[str]: "zstd", "gzip" or None (identity)
+        """
+        accepted = {
+            value.split(";")[0].strip()
+            for value in self.headers.get("Accept-Encoding", "").split(",")
+        }
+        if "zstd" in accepted and HAS_ZSTANDARD:
+            return "zstd"
+        if "gzip" in accepted:
+            return "gzip"
+        return None
+
+    def _json(self, body: Any, status: int = 200) -> None:
+        """Send a JSON response
+
+        Args:
+            body (Any): response body
+            status (int, optional): status code. Defaults to 200.
+        """
+        data = orjson.dumps(body)
+        encoding = self._encoding()
+        if len(data) < MOCK_MIN_COMPRESS_SIZE:
+            encoding = None
+        elif encoding == "zstd":
+            data = zstandard.ZstdCompressor().compress(data)
+        elif encoding == "gzip":
+            data = gzip.compress(data, mtime=0)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.transfer(sent=len(data))
+
+    def _user_id(self) -> str:
+        """opengpts_user_id cookie
+
+        Returns:
+            str: user id
+        """
+        for cookie in self.headers.get("Cookie", "").split(";"):
+            name, _, value = cookie.strip().partition("=")
+            if name == "opengpts_user_id":
+                return value
+        return ""
+
+    def do_GET(self) -> None:
+        """Handle GET"""
+        opengpts = self.server.opengpts
+        path = urlparse(self.path).path.rstrip("/")
+        parts = path.strip("/").split("/")
+        if path == "/health":
+            self._json({"status": "ok"})
+        elif path == "/metrics":
+            self._json(opengpts.metrics())
+        elif path in ("/assistants", "/assistants/public"):
+            self._json([opengpts.assistant])
+        elif parts[0] == "assistants" and len(parts) == 2:
+            if parts[1] != opengpts.assistant["assistant_id"]:
+                self._json({"detail": "Assistant not found"}, 404)
+            else:
+                self._json(opengpts.assistant)
+        elif path == "/threads":
+            self._json(opengpts.list_threads(self._user_id()))
+        elif parts[0] == "threads" and len(parts) >= 2:
+            self._get_thread(parts[1], parts[2:])
+        else:
+            self._json({"detail": "Not Found"}, 404)
+
+    def _get_thread(self, thread_id: str, rest: list[str]) -> None:
+        """Handle GET of a thread resource
+
+        Args:
+            thread_id (str): thread id
+            rest (list[str]): path after the thread id
+        """
+        opengpts = self.server.opengpts
+        thread = opengpts.get_thread(thread_id)
+        if thread is None:
+            self._json({"detail": "Thread not found"}, 404)
+        elif rest == []:
+            self._json(thread)
+        elif rest == ["messages"]:
+            self._json(
+                {
+                    "messages": opengpts.messages(thread_id),
+                    "resumeable": False,
+                },
+            )
+        elif rest == ["history"]:
+            self._json([])
+        else:
+            self._json({"detail": "Not Found"}, 404)
+
+    def do_POST(self) -> None:
+        """Handle POST"""
+        path = urlparse(self.path).path.rstrip("/")
+        body = self._body()
+        if path.startswith("/api/"):
+            self._slack(path[len("/api/") :], body)
+        elif path == "/threads":
+            self._json(
+                self.server.opengpts.create_thread(
+                    self._user_id(),
+                    orjson.loads(body),
+                ),
+            )
+        elif path.startswith("/threads/") and path.endswith("/messages"):
+            self._add_messages(path.split("/")[2], orjson.loads(body))
+        elif path == "/runs/stream":
+            self._stream(orjson.loads(body))
+        elif path == "/ingest":
+            self._json({"ingested_bytes": len(body)})
+        else:
+            self._json({"detail": "Not Found"}, 404)
+
+    def _add_messages(self, thread_id: str, body: dict[str, Any]) -> None:
+        """Handle POST of thread messages
+
+        Args:
+            thread_id (str): thread id
+            body (dict[str, Any]): request with the messages
+        """
+        opengpts = self.server.opengpts
+        if opengpts.get_thread(thread_id) is None:
+            self._json({"detail": "Thread not found"}, 404)
+            return
+        opengpts.add_messages(
+            thread_id,
+            [{**m, "id": str(uuid.uuid4())} for m in body["messages"]],
+        )
+        self._json({"messages": opengpts.messages(thread_id)})
+
+    def _slack(self, method: str, body: bytes) -> None:
+        """Handle a Slack Web API call
+
+        Args:
+            method (str): method name
+            body (bytes): JSON or form encoded arguments
+        """
+        if self.headers.get("Content-Type", "").startswith(
+            "application/json",
+        ):
+            params = orjson.loads(body or b"{}")
+        else:
+            params = {
+                key: values[-1]
+                for key, values in parse_qs(body.decode()).items()
+            }
+        self._json(self.server.slack.call(method, params))
+
+    def _stream(self, body: dict[str, Any]) -> None:
+        """Stream a run
+
+        Args:
+            body (dict[str, Any]): run request body
+        """
+        opengpts = self.server.opengpts
+        if opengpts.get_thread(body.get("thread_id", "")) is None:
+            self._json({"detail": "Thread not found"}, 404)
+            return
+        if not opengpts.start_run():
+            self._json({"detail": "too many runs"}, 503)
+            return
+
+        encoding = self._encoding()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        if encoding is not None:
+            self.send_header("Content-Encoding", encoding)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        # every event is flushed so the client can decode it immediately
+        encoder = _EventEncoder(encoding)
+
+        def write(payload: bytes) -> None:
+            if not payload:
+                return
+            self.wfile.write(f"{len(payload):x}\r\n".encode())
+            self.wfile.write(payload + b"\r\n")
+            self.wfile.flush()
+            self.server.transfer(sent=len(payload))
+
+        def send(event: str, data: Any) -> None:
+            payload = f"event: {event}\r\n".encode()
+            if data is not None:
+                payload += b"data: " + orjson.dumps(data) + b"\r\n"
+            write(encoder.encode(payload + b"\r\n"))
+
+        try:
+            opengpts.stream_run(body, send)
+            write(encoder.finish())
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # the client stopped reading the stream early
+            self.close_connection = True
+
+
+class _EventEncoder:
+    """Content encoder emitting a decodable block per SSE event"""
+
+    def __init__(self, encoding: Optional[str]) -> None:
+        """コンストラクタ
+
+        Args:
+            encoding (Optional[str]): "zstd", "gzip" or None (identity)
+        """
+        self.encoding = encoding
+        self._compressobj: Any = None
+        if encoding == "zstd":
+            self._compressobj = zstandard.ZstdCompressor().compressobj()
+        elif encoding == "gzip":
+            # wbits=31 writes a gzip container
+            self._compressobj = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def encode(self, data: bytes) -> bytes:
+        """Encode and flush one event
+
+        Args:
+            data (bytes): event
+
+        Returns:
+            bytes: encoded event
+        """
+        if self._compressobj is None:
+            return data
+        mode = (
+            zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            if self.encoding == "zstd"
+            else zlib.Z_SYNC_FLUSH
+        )
+        encoded: bytes = self._compressobj.compress(data)
+        flushed: bytes = self._compressobj.flush(mode)
+        return encoded + flushed
+
+    def finish(self) -> bytes:
+        """End the encoded stream
+
+        Returns:
+            bytes: trailer of the stream
+        """
+        if self._compressobj is None:
+            return b""
+        trailer: bytes = self._compressobj.flush()
+        return trailer
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    """HTTP server holding the mock state"""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    opengpts: MockOpenGPTs
+    slack: MockSlack
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        """コンストラクタ"""
+        super().__init__(*args, **kwargs)
+        self._transfer_lock = threading.Lock()
+        self.bytes_received = 0
+        self.bytes_sent = 0
+
+    def transfer(self, received: int = 0, sent: int = 0) -> None:
+        """Count body bytes on the wire
+
+        Args:
+            received (int, optional): request body bytes. Defaults to 0.
+            sent (int, optional): response body bytes. Defaults to 0.
+        """
+        with self._transfer_lock:
+            self.bytes_received += received
+            self.bytes_sent += sent
+
+
+class MockServer:
+    """Local server mocking OpenGPTs and the Slack Web API
+
+    OpenGPTs endpoints are served at the root and the Slack Web API under
+    `/api/`, so the same address is used as `OPENGPTS_URL` and (with the
+    `/api/` suffix) as `SLACK_API_URL` of the slack bot.
+    """
+
+    def __init__(
+        self,
+        config: Optional[MockConfig] = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            config (Optional[MockConfig], optional): \
+                mock behaviour. Defaults to None.
+            host (str, optional): bind address. Defaults to "127.0.0.1".
+            port (int, optional): port. 0 picks a free one. Defaults to 0.
+        """
+        self.opengpts = MockOpenGPTs(config or MockConfig())
+        self.slack = MockSlack()
+        self._server = _HTTPServer((host, port), _Handler)
+        self._server.opengpts = self.opengpts
+        self._server.slack = self.slack
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        """OpenGPTs URL of the mock
+
+        Returns:
+            str: url
+        """
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def transferred(self) -> tuple[int, int]:
+        """Body bytes on the wire since the server started
+
+        Request bodies are counted before decoding and response bodies
+        after encoding, so compression shows up in the counts.
+
+        Returns:
+            tuple[int, int]: received and sent bytes
+        """
+        return self._server.bytes_received, self._server.bytes_sent
+
+    @property
+    def slack_api_url(self) -> str:
+        """Slack Web API base URL of the mock
+
+        Returns:
+            str: url
+        """
+        return f"{self.url}/api/"
+
+    def start(self) -> "MockServer":
+        """Serve on a background thread
+
+        Returns:
+            MockServer: self
+        """
+        self._thread = threading.Thread(
+            target=self._server.serve_forever,
+            name="mock-server",
+            daemon=True,
+        )
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        """Serve on the current thread"""
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        """Stop serving"""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "MockServer":
+        """Start serving"""
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        """Stop serving"""
+        self.stop()
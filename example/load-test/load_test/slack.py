@@ -0,0 +1,327 @@
+"""Synthetic app_mention events replayed into the slack bot"""
+
+import importlib
+import itertools
+import os
+import tempfile
+import time
+import uuid
+from logging import getLogger
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+import orjson
+import requests
+from slack_sdk.signature import SignatureVerifier
+
+from load_test.mock_server import MOCK_BOT_USER_ID, MockServer, SlackRecord
+from load_test.stats import Sample
+
+logger = getLogger(__name__)
+
+DEFAULT_SIGNING_SECRET = "load-test-signing-secret"  # noqa: S105
+ACK_TIMEOUT = 30
+
+_ts = itertools.count(1)
+
+Target = Callable[[bytes, dict[str, str]], int]
+"""delivers a signed event request and returns the status code"""
+
+
+def configure_bot(mock: MockServer, signing_secret: str) -> None:
+    """Point the slack bot of this process at the mock server
+
+    Variables that are already set are kept, so the bot can still be
+    tuned (WORKER_THREADS, SLACK_UPDATE_INTERVAL, ...) from the environment.
+
+    Args:
+        mock (MockServer): mock server
+        signing_secret (str): signing secret of the synthetic events
+    """
+    state_dir = Path(tempfile.mkdtemp(prefix="slack-load-test-"))
+    defaults = {
+        "SLACK_BOT_TOKEN": "xoxb-load-test",
+        "SLACK_SIGNING_SECRET": signing_secret,
+        "SLACK_API_URL": mock.slack_api_url,
+        "OPENGPTS_URL": mock.url,
+        "OPENGPTS_BOT_ID": mock.opengpts.config.assistant_id,
+        "THREAD_STORE_PATH": str(state_dir / "threads.sqlite3"),
+        "EVENT_STORE_PATH": str(state_dir / "events.sqlite3"),
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, value)
+
+
+def in_process_target() -> Target:
+    """Call `slack_bot` of the sample slack bot in this process
+
+    `configure_bot` has to be called first because the bot reads its
+    settings and calls auth.test when it is imported.
+
+    Returns:
+        Target: target
+    """
+    from flask import Flask, request
+
+    bot: Any = importlib.import_module("app.main")
+    flask_app = Flask(__name__)
+
+    def send(body: bytes, headers: dict[str, str]) -> int:
+        with flask_app.test_request_context(
+            "/",
+            method="POST",
+            data=body,
+            headers=headers,
+        ):
+            return int(bot.slack_bot(request).status_code)
+
+    return send
+
+
+def http_target(url: str) -> Target:
+    """POST events to a running slack bot
+
+    Args:
+        url (str): url of the deployed `slack_bot` function
+
+    Returns:
+        Target: target
+    """
+    session = requests.Session()
+
+    def send(body: bytes, headers: dict[str, str]) -> int:
+        response = session.post(
+            url,
+            data=body,
+            headers=headers,
+            timeout=ACK_TIMEOUT,
+        )
+        return response.status_code
+
+    return send
+
+
+def mention_event(
+    text: str,
+    channel: str,
+    user: str,
+    team: str,
+    thread_ts: Optional[str] = None,
+) -> dict[str, Any]:
+    """Synthetic app_mention event callback
+
+    Args:
+        text (str): message without the mention
+        channel (str): channel id
+        user (str): user id
+        team (str): workspace id
+        thread_ts (Optional[str], optional): \
+            thread root for replies in a thread. Defaults to None.
+
+    Returns:
+        dict[str, Any]: event callback body
+    """
+    ts = f"{int(time.time())}.{next(_ts):06d}"
+    event = {
+        "type": "app_mention",
+        "user": user,
+        "text": f"<@{MOCK_BOT_USER_ID}> {text}",
+        "ts": ts,
+        "event_ts": ts,
+        "channel": channel,
+        "team": team,
+    }
+    if thread_ts is not None:
+        event["thread_ts"] = thread_ts
+    return {
+        "type": "event_callback",
+        "team_id": team,
+        "api_app_id": "ALOADTEST",
+        "event_id": f"Ev{uuid.uuid4().hex}",
+        "event_time": int(time.time()),
+        "event": event,
+    }
+
+
+class SlackSession:
+    """Conversation of one user mentioning the bot in a Slack thread
+
+    The first mention starts a thread and each following one is a reply in
+    it, sent after the previous answer was finalized. The answer is read
+    back from the mock Slack Web API: time to first token is the first
+    `chat.update` (throttled by the bot's SLACK_UPDATE_INTERVAL like real
+    users see it) and the total is the update without the cursor.
+    """
+
+    def __init__(
+        self,
+        target: Target,
+        mock: MockServer,
+        signing_secret: str = DEFAULT_SIGNING_SECRET,
+        turns: int = 1,
+        think_time: float = 1.0,
+        workspaces: int = 1,
+        timeout: float = 120.0,
+        expected_answer: Optional[str] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            target (Target): slack bot to send events to
+            mock (MockServer): mock server the bot replies to
+            signing_secret (str, optional): \
+                signing secret. Defaults to DEFAULT_SIGNING_SECRET.
+            turns (int, optional): mentions per session. Defaults to 1.
+            think_time (float, optional): \
+                seconds between mentions. Defaults to 1.0.
+            workspaces (int, optional): \
+                workspaces sessions are spread over. Defaults to 1.
+            timeout (float, optional): \
+                max seconds to wait for an answer. Defaults to 120.0.
+            expected_answer (Optional[str], optional): answers differing \
+                from this count as errors. Defaults to None (not checked).
+        """
+        from app.streaming import CURSOR, PLACEHOLDER_TEXT
+
+        self.target = target
+        self.mock = mock
+        self.verifier = SignatureVerifier(signing_secret)
+        self.turns = turns
+        self.think_time = think_time
+        self.workspaces = max(1, workspaces)
+        self.timeout = timeout
+        self.expected_answer = expected_answer
+        self.cursor: str = CURSOR
+        self.placeholder: str = PLACEHOLDER_TEXT
+        self._sessions = itertools.count()
+
+    def __call__(self, scheduled_at: float) -> list[Sample]:
+        """Run a session
+
+        Args:
+            scheduled_at (float): perf counter the session was due at
+
+        Returns:
+            list[Sample]: one sample per mention
+        """
+        n = next(self._sessions)
+        channel = f"CLOAD{n:08d}"
+        user = f"ULOAD{n:08d}"
+        team = f"TLOAD{n % self.workspaces:04d}"
+        thread_ts: Optional[str] = None
+        samples: list[Sample] = []
+        started_at = scheduled_at
+        for turn in range(self.turns):
+            if turn > 0:
+                time.sleep(self.think_time)
+                started_at = time.perf_counter()
+            body = mention_event(
+                f"question {turn}",
+                channel=channel,
+                user=user,
+                team=team,
+                thread_ts=thread_ts,
+            )
+            thread_ts = thread_ts or body["event"]["ts"]
+            sample = self.mention(body, thread_ts, started_at)
+            samples.append(sample)
+            if sample.error is not None:
+                break
+        if thread_ts is not None:
+            self.mock.slack.forget(thread_ts)
+        return samples
+
+    def mention(
+        self,
+        body: dict[str, Any],
+        thread_ts: str,
+        started_at: float,
+    ) -> Sample:
+        """Send one mention and wait for the answer
+
+        Args:
+            body (dict[str, Any]): event callback
+            thread_ts (str): thread the answer is posted to
+            started_at (float): perf counter the mention was due at
+
+        Returns:
+            Sample: sample
+        """
+        self.mock.slack.forget(thread_ts)
+        data = orjson.dumps(body)
+        timestamp = str(int(time.time()))
+        signature = self.verifier.generate_signature(
+            timestamp=timestamp,
+            body=data,
+        )
+        if signature is None:
+            raise ValueError("slack request could not be signed")
+        headers = {
+            "Content-Type": "application/json",
+            "X-Slack-Request-Timestamp": timestamp,
+            "X-Slack-Signature": signature,
+        }
+        try:
+            status = self.target(data, headers)
+        except Exception as e:
+            return self._sample(started_at, {}, type(e).__name__)
+        latencies = {"ack": time.perf_counter() - started_at}
+        if status != 200:
+            return self._sample(started_at, latencies, f"http_{status}")
+
+        records = self.mock.slack.wait(thread_ts, self._done, self.timeout)
+        if not self._done(records):
+            return self._sample(started_at, latencies, "timeout")
+
+        answered = [r for r in records if r.text != self.placeholder]
+        latencies["ttft"] = answered[0].at - started_at
+        latencies["total"] = records[-1].at - started_at
+        error = None
+        if self.expected_answer not in (None, records[-1].text):
+            error = "unexpected_answer"
+        return self._sample(started_at, latencies, error, records[-1].at)
+
+    def _done(self, records: list[SlackRecord]) -> bool:
+        """Whether the answer was finalized
+
+        Args:
+            records (list[SlackRecord]): replies of the thread
+
+        Returns:
+            bool: finalized or not
+        """
+        if len(records) == 0:
+            return False
+        last = records[-1]
+        if last.method == "chat.update":
+            return self.cursor not in last.blocks
+        # answered at once: cached answer or busy message
+        return last.text != self.placeholder
+
+    def _sample(
+        self,
+        started_at: float,
+        latencies: dict[str, float],
+        error: Optional[str],
+        finished_at: Optional[float] = None,
+    ) -> Sample:
+        """Sample of a mention
+
+        Args:
+            started_at (float): perf counter the mention was due at
+            latencies (dict[str, float]): measured latencies
+            error (Optional[str]): error kind
+            finished_at (Optional[float], optional): \
+                perf counter of the answer. Defaults to None (now).
+
+        Returns:
+            Sample: sample
+        """
+        if error is not None:
+            logger.debug("slack mention failed: %s", error)
+        return Sample(
+            started_at=started_at,
+            finished_at=finished_at or time.perf_counter(),
+            latencies=latencies,
+            error=error,
+        )
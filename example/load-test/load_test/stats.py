@@ -0,0 +1,253 @@
+"""Open-loop load generation and latency statistics"""
+
+import math
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from logging import getLogger
+from typing import Callable, Optional
+
+from pydantic import BaseModel, Field
+
+logger = getLogger(__name__)
+
+
+class Sample(BaseModel):
+    """Result of one request (a chat turn or a Slack mention)"""
+
+    started_at: float = Field(..., title="time.perf_counter() at the start")
+    finished_at: float = Field(..., title="time.perf_counter() at the end")
+    latencies: dict[str, float] = Field(
+        {},
+        title="seconds per metric, e.g. ttft or total",
+    )
+    error: Optional[str] = Field(None, title="error kind. None on success")
+
+
+Session = Callable[[float], list[Sample]]
+"""runs one scripted session scheduled at a perf counter value"""
+
+
+class LatencySummary(BaseModel):
+    """Percentiles of one latency metric"""
+
+    count: int = Field(..., title="samples")
+    p50_ms: float = Field(..., title="median")
+    p95_ms: float = Field(..., title="95th percentile")
+    p99_ms: float = Field(..., title="99th percentile")
+    max_ms: float = Field(..., title="max")
+
+
+class StageReport(BaseModel):
+    """Result of running at one arrival rate"""
+
+    rate: float = Field(..., title="offered sessions per second")
+    duration: float = Field(..., title="seconds sessions were started")
+    sessions: int = Field(..., title="started sessions")
+    requests: int = Field(..., title="requests of all sessions")
+    errors: int = Field(..., title="failed requests")
+    error_rate: float = Field(..., title="errors / requests")
+    error_kinds: dict[str, int] = Field({}, title="errors per kind")
+    throughput: float = Field(..., title="successful requests per second")
+    latency: dict[str, LatencySummary] = Field(
+        {},
+        title="percentiles of successful requests per metric",
+    )
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Percentile with linear interpolation
+
+    Args:
+        values (list[float]): sorted values
+        q (float): percentile between 0 and 100
+
+    Returns:
+        float: percentile. NaN if there are no values
+    """
+    if len(values) == 0:
+        return math.nan
+    position = (len(values) - 1) * q / 100
+    lower = math.floor(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def summarize(values: list[float]) -> LatencySummary:
+    """Summarize latencies
+
+    Args:
+        values (list[float]): seconds
+
+    Returns:
+        LatencySummary: summary in milliseconds
+    """
+    values = sorted(values)
+    return LatencySummary(
+        count=len(values),
+        p50_ms=round(percentile(values, 50) * 1000, 3),
+        p95_ms=round(percentile(values, 95) * 1000, 3),
+        p99_ms=round(percentile(values, 99) * 1000, 3),
+        max_ms=round(values[-1] * 1000, 3) if values else math.nan,
+    )
+
+
+def report(
+    samples: list[Sample],
+    rate: float,
+    duration: float,
+    sessions: int,
+) -> StageReport:
+    """Aggregate samples of a stage
+
+    Args:
+        samples (list[Sample]): samples
+        rate (float): offered sessions per second
+        duration (float): seconds sessions were started
+        sessions (int): started sessions
+
+    Returns:
+        StageReport: report
+    """
+    succeeded = [s for s in samples if s.error is None]
+    errors = Counter(s.error for s in samples if s.error is not None)
+    metrics = sorted({name for s in succeeded for name in s.latencies})
+    throughput = 0.0
+    if len(succeeded) > 0:
+        elapsed = max(s.finished_at for s in samples) - min(
+            s.started_at for s in samples
+        )
+        throughput = len(succeeded) / max(elapsed, 1e-9)
+    return StageReport(
+        rate=rate,
+        duration=duration,
+        sessions=sessions,
+        requests=len(samples),
+        errors=sum(errors.values()),
+        error_rate=(
+            sum(errors.values()) / len(samples) if len(samples) else 0.0
+        ),
+        error_kinds=dict(errors),
+        throughput=round(throughput, 3),
+        latency={
+            name: summarize(
+                [s.latencies[name] for s in succeeded if name in s.latencies],
+            )
+            for name in metrics
+        },
+    )
+
+
+def run_stage(
+    session: Session,
+    rate: float,
+    duration: float,
+    concurrency: int,
+) -> StageReport:
+    """Start sessions at a fixed rate regardless of how fast they finish
+
+    Sessions are scheduled open-loop and latencies are measured from the
+    scheduled time, so time spent waiting for a free worker is included
+    instead of silently lowering the offered load.
+
+    Args:
+        session (Session): scripted session
+        rate (float): sessions per second
+        duration (float): seconds to start sessions for
+        concurrency (int): max sessions in flight
+
+    Returns:
+        StageReport: report
+    """
+    count = max(1, int(rate * duration))
+    samples: list[Sample] = []
+    lock = threading.Lock()
+
+    def run(scheduled_at: float) -> None:
+        try:
+            result = session(scheduled_at)
+        except Exception as e:
+            logger.exception("session failed")
+            result = [
+                Sample(
+                    started_at=scheduled_at,
+                    finished_at=time.perf_counter(),
+                    error=type(e).__name__,
+                ),
+            ]
+        with lock:
+            samples.extend(result)
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(
+        max_workers=concurrency,
+        thread_name_prefix="load-test",
+    ) as executor:
+        for i in range(count):
+            scheduled_at = started_at + i / rate
+            time.sleep(max(0.0, scheduled_at - time.perf_counter()))
+            executor.submit(run, scheduled_at)
+    return report(samples, rate=rate, duration=duration, sessions=count)
+
+
+class SLO(BaseModel):
+    """Service level a stage has to meet to be sustainable"""
+
+    metric: str = Field("total", title="latency metric checked")
+    p95_ms: float = Field(..., title="max 95th percentile")
+    max_error_rate: float = Field(0.01, title="max error rate")
+
+
+def meets(stage: StageReport, slo: SLO) -> bool:
+    """Whether a stage is sustainable
+
+    Args:
+        stage (StageReport): stage report
+        slo (SLO): service level
+
+    Returns:
+        bool: meets the service level or not
+    """
+    summary = stage.latency.get(slo.metric)
+    return (
+        summary is not None
+        and summary.p95_ms <= slo.p95_ms
+        and stage.error_rate <= slo.max_error_rate
+    )
+
+
+def ramp(
+    session: Session,
+    rates: list[float],
+    duration: float,
+    concurrency: int,
+    slo: SLO,
+    on_stage: Optional[Callable[[StageReport], None]] = None,
+) -> tuple[list[StageReport], Optional[StageReport]]:
+    """Raise the rate until the service level is broken
+
+    Args:
+        session (Session): scripted session
+        rates (list[float]): increasing sessions per second
+        duration (float): seconds per stage
+        concurrency (int): max sessions in flight
+        slo (SLO): service level
+        on_stage (Optional[Callable[[StageReport], None]], optional): \
+            called after each stage. Defaults to None.
+
+    Returns:
+        tuple[list[StageReport], Optional[StageReport]]: \
+            all stages and the fastest sustainable one (None if none was)
+    """
+    stages: list[StageReport] = []
+    sustainable: Optional[StageReport] = None
+    for rate in rates:
+        stage = run_stage(session, rate, duration, concurrency)
+        stages.append(stage)
+        if on_stage is not None:
+            on_stage(stage)
+        if not meets(stage, slo):
+            break
+        sustainable = stage
+    return stages, sustainable
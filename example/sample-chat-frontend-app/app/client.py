@@ -0,0 +1,119 @@
+"""OpenGPTs client shared by the pages"""
+
+import uuid
+from datetime import datetime, timedelta
+from typing import Optional
+
+import streamlit as st
+from opengpts_client.cache import (
+    CacheBackend,
+    CacheTTL,
+    MemoryCache,
+    RedisCache,
+    SQLiteCache,
+)
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.pool import OpenGPTsClientPool
+from opengpts_client.tracing import Tracer, create_exporter, set_tracer
+from streamlit_google_oauth.google_oauth import cookie_controller
+
+from app.constants import (
+    CACHE_BACKEND,
+    CACHE_REDIS_URL,
+    CACHE_SQLITE_PATH,
+    CACHE_TTL_ASSISTANTS,
+    CACHE_TTL_MESSAGES,
+    CACHE_TTL_THREADS,
+    TRACE_EXPORTER,
+    TRACE_FILE,
+)
+
+
+def get_opengpts_user_id() -> str:
+    """cookieからOpenGPTs user idを取得
+
+    Returns:
+        str: OpenGPTs user id
+    """
+    cookie_manager = cookie_controller()
+    user_id: Optional[str] = cookie_manager.get("opengpts_user_id")
+
+    if st.session_state.get("init") is not None and user_id is None:
+        user_id = str(uuid.uuid4())
+        expires_at = datetime.now() + timedelta(days=1000)
+        cookie_manager.set("opengpts_user_id", user_id, expires=expires_at)
+    return user_id
+
+
+def create_cache(backend: str = CACHE_BACKEND) -> CacheBackend:
+    """Create the client cache backend
+
+    Args:
+        backend (str, optional): \
+            "memory", "sqlite" or "redis". Defaults to CACHE_BACKEND.
+
+    Raises:
+        ValueError: unknown backend
+
+    Returns:
+        CacheBackend: cache backend
+    """
+    if backend == "memory":
+        return MemoryCache()
+    if backend == "sqlite":
+        return SQLiteCache(CACHE_SQLITE_PATH)
+    if backend == "redis":
+        import redis  # optional dependency
+
+        return RedisCache(redis.Redis.from_url(CACHE_REDIS_URL))
+    raise ValueError(f"unknown cache backend: {backend}")
+
+
+@st.cache_resource
+def configure_tracing() -> Tracer:
+    """Process-wide tracer, configured once for all sessions
+
+    Returns:
+        Tracer: tracer used by the app and the OpenGPTs client
+    """
+    tracer = Tracer(
+        create_exporter(TRACE_EXPORTER, TRACE_FILE),
+        service_name="chat-frontend",
+    )
+    set_tracer(tracer)
+    return tracer
+
+
+@st.cache_resource
+def opengpts_client_pool() -> OpenGPTsClientPool:
+    """OpenGPTs Client Pool shared by all sessions
+
+    Assistants and threads are cached per user in the pool, so reruns
+    (typing in the chat input, switching threads) do not hit the backend.
+    The cache is invalidated by the client on thread creation and runs.
+
+    Returns:
+        OpenGPTsClientPool: OpenGPTs Client Pool
+    """
+    # pages other than main also reach OpenGPTs through the pool
+    configure_tracing()
+    return OpenGPTsClientPool(
+        cache=create_cache(),
+        cache_ttl=CacheTTL(
+            assistants=CACHE_TTL_ASSISTANTS,
+            threads=CACHE_TTL_THREADS,
+            messages=CACHE_TTL_MESSAGES,
+        ),
+    )
+
+
+def opengpt_client(url: str, opengpts_user_id: str) -> OpenGPTsClient:
+    """OpenGPTs Client
+
+    Returns:
+        OpenGPTsClient: OpenGPTs Client
+    """
+    return opengpts_client_pool().client(
+        url=url,
+        opengpts_user_id=opengpts_user_id,
+    )
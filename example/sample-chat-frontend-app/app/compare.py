@@ -0,0 +1,241 @@
+"""assistant compare mode"""
+
+import queue
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import streamlit as st
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.schema import Assistant, Message
+from pydantic import BaseModel, Field
+
+from app.renderer import StreamingRenderer
+
+COMPARE_RESULTS_KEY = "compare_results"
+EVENT_POLL_INTERVAL = 0.5
+
+
+class CompareResult(BaseModel):
+    """Answer of one assistant in compare mode"""
+
+    assistant_name: str = Field(..., title="assistant name")
+    thread_id: Optional[str] = Field(None, title="thread id")
+    text: str = Field("", title="answer")
+    messages: list[Message] = Field([], title="messages produced by the run")
+    ttft: Optional[float] = Field(None, title="time to first token (sec)")
+    total: Optional[float] = Field(None, title="total time (sec)")
+    error: Optional[str] = Field(None, title="error message")
+
+
+def run_assistant(
+    client: OpenGPTsClient,
+    assistant: Assistant,
+    prompt: str,
+    index: int,
+    events: queue.Queue,
+    started_at: float,
+) -> None:
+    """Run one assistant on its own thread and report progress
+
+    Executed on a worker thread, so it must not call Streamlit.
+
+    Args:
+        client (OpenGPTsClient): OpenGPTs Client
+        assistant (Assistant): assistant
+        prompt (str): user prompt
+        index (int): column index
+        events (queue.Queue): ("delta" | "done", index, payload) events
+        started_at (float): monotonic start time of the comparison
+    """
+    result = CompareResult(assistant_name=assistant.name)
+    try:
+        result.thread_id = client.create_thread(
+            name=prompt,
+            assistant_id=assistant.assistant_id,
+        ).thread_id
+        for res in client.run_stream(
+            assistant_id=assistant.assistant_id,
+            thread_id=result.thread_id,
+            messages=[Message(type="human", content=prompt)],
+        ):
+            result.messages = res[1:]
+            if len(result.messages) == 0 or result.messages[-1].type != "ai":
+                continue
+            content = result.messages[-1].content
+            if not isinstance(content, str):
+                continue
+            result.text = content
+            if result.ttft is None and result.text:
+                result.ttft = time.monotonic() - started_at
+            events.put(("delta", index, result.text))
+    except Exception as e:
+        result.error = str(e)
+    result.total = time.monotonic() - started_at
+    events.put(("done", index, result))
+
+
+def display_compare_result(result: CompareResult, index: int) -> None:
+    """Display a finished answer
+
+    Args:
+        result (CompareResult): answer
+        index (int): column index
+    """
+    renderer = StreamingRenderer(st.empty())
+    renderer.finalize(
+        text=result.text,
+        messages=result.messages,
+        key_prefix=f"compare-{index}-",
+    )
+    display_timing(result)
+
+
+def display_previous_results() -> None:
+    """Display the last comparison again on reruns"""
+    results: list[CompareResult] = st.session_state.get(
+        COMPARE_RESULTS_KEY,
+        [],
+    )
+    if len(results) == 0:
+        return
+    for index, (column, result) in enumerate(
+        zip(st.columns(len(results)), results, strict=True),
+    ):
+        with column:
+            st.markdown(f"#### 🤖 {result.assistant_name}")
+            display_compare_result(result, index)
+
+
+def display_timing(result: CompareResult) -> None:
+    """Display TTFT and total time
+
+    Args:
+        result (CompareResult): answer
+    """
+    if result.error is not None:
+        st.error(result.error)
+    ttft = "-" if result.ttft is None else f"{result.ttft:.2f}s"
+    total = "-" if result.total is None else f"{result.total:.2f}s"
+    st.caption(f"⏱️ TTFT {ttft} / total {total}")
+
+
+def collect_results(
+    futures: list[Future],
+    events: queue.Queue,
+    renderers: list[StreamingRenderer],
+    results: list[Optional[CompareResult]],
+) -> None:
+    """Render worker events until every worker has finished
+
+    Args:
+        futures (list[Future]): workers
+        events (queue.Queue): events reported by `run_assistant`
+        renderers (list[StreamingRenderer]): renderer per column
+        results (list[Optional[CompareResult]]): \
+            filled with the result of each column
+    """
+    while any(result is None for result in results):
+        # drain everything available and render only the newest text
+        latest: dict[int, str] = {}
+        try:
+            batch = [events.get(timeout=EVENT_POLL_INTERVAL)]
+        except queue.Empty:
+            # a worker that died without reporting would block forever
+            if all(future.done() for future in futures):
+                return
+            continue
+        while not events.empty():
+            batch.append(events.get_nowait())
+        for kind, index, payload in batch:
+            if kind == "delta":
+                latest[index] = payload
+            else:
+                results[index] = payload
+                latest.pop(index, None)
+        for index, text in latest.items():
+            renderers[index].update(text)
+
+
+def compare_assistants(
+    client: OpenGPTsClient,
+    assistant_list: list[Assistant],
+) -> None:
+    """Send one prompt to several assistants and stream answers side by side
+
+    Runs are executed concurrently, so the wall time is that of the
+    slowest assistant. Worker threads only report through a queue and the
+    script thread does all rendering.
+
+    Args:
+        client (OpenGPTsClient): OpenGPTs Client
+        assistant_list (list[Assistant]): assistant list
+    """
+    indexes = st.multiselect(
+        "assistants",
+        range(len(assistant_list)),
+        default=list(range(min(2, len(assistant_list)))),
+        format_func=lambda x: assistant_list[x].name,
+    )
+    targets = [assistant_list[idx] for idx in indexes]
+
+    prompt = st.chat_input(key="compare-input")
+    if not prompt or len(targets) == 0:
+        display_previous_results()
+        return
+
+    st.chat_message("user").write(prompt)
+    columns = st.columns(len(targets))
+    renderers: list[StreamingRenderer] = []
+    for column, assistant in zip(columns, targets, strict=True):
+        with column:
+            st.markdown(f"#### 🤖 {assistant.name}")
+            renderers.append(StreamingRenderer(st.markdown("▌")))
+
+    events: queue.Queue = queue.Queue()
+    results: list[Optional[CompareResult]] = [None] * len(targets)
+    started_at = time.monotonic()
+    with ThreadPoolExecutor(
+        max_workers=len(targets),
+        thread_name_prefix="compare",
+    ) as executor:
+        futures = [
+            executor.submit(
+                run_assistant,
+                client,
+                assistant,
+                prompt,
+                index,
+                events,
+                started_at,
+            )
+            for index, assistant in enumerate(targets)
+        ]
+
+        collect_results(futures, events, renderers, results)
+
+    finished = [
+        result
+        or CompareResult(
+            assistant_name=assistant.name,
+            text=renderers[index].text,
+            total=time.monotonic() - started_at,
+            error="the run ended without reporting a result",
+        )
+        for index, (assistant, result) in enumerate(
+            zip(targets, results, strict=True),
+        )
+    ]
+    for index, (column, result) in enumerate(
+        zip(columns, finished, strict=True),
+    ):
+        with column:
+            renderers[index].finalize(
+                text=result.text,
+                messages=result.messages,
+                key_prefix=f"compare-{index}-",
+            )
+            display_timing(result)
+
+    st.caption(f"⏱️ wall time {time.monotonic() - started_at:.2f}s")
+    st.session_state[COMPARE_RESULTS_KEY] = finished
@@ -18,3 +18,45 @@ _target_assistant_ids = os.environ.get("TARGET_ASSISTANT_IDS")
 TARGET_ASSISTANT_IDS = (
     None if _target_assistant_ids is None else _target_assistant_ids.split(",")
 )
+
+# streaming render throttling
+STREAM_RENDER_FPS = float(os.environ.get("STREAM_RENDER_FPS", "8"))
+STREAM_RENDER_MIN_DELTA = int(os.environ.get("STREAM_RENDER_MIN_DELTA", "0"))
+
+# thread history rendering
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "10"))
+HISTORY_CACHE_THREADS = int(os.environ.get("HISTORY_CACHE_THREADS", "5"))
+
+# client cache TTL (seconds)
+CACHE_TTL_ASSISTANTS = float(os.environ.get("CACHE_TTL_ASSISTANTS", "300"))
+CACHE_TTL_THREADS = float(os.environ.get("CACHE_TTL_THREADS", "30"))
+CACHE_TTL_MESSAGES = float(os.environ.get("CACHE_TTL_MESSAGES", "300"))
+
+# background prefetch of likely-next threads
+PREFETCH_WORKERS = int(os.environ.get("PREFETCH_WORKERS", "4"))
+PREFETCH_TOP_N = int(os.environ.get("PREFETCH_TOP_N", "3"))
+PREFETCH_CACHE_SIZE = int(os.environ.get("PREFETCH_CACHE_SIZE", "10"))
+
+# background ingestion
+INGEST_WORKERS = int(os.environ.get("INGEST_WORKERS", "2"))
+INGEST_MAX_QUEUE = int(os.environ.get("INGEST_MAX_QUEUE", "32"))
+INGEST_MAX_JOBS = int(os.environ.get("INGEST_MAX_JOBS", "100"))
+INGEST_POLL_INTERVAL = float(os.environ.get("INGEST_POLL_INTERVAL", "1"))
+INGEST_SPOOL_DIR = os.environ.get("INGEST_SPOOL_DIR")
+
+# client cache backend: "memory", "sqlite" (shared by the processes of a
+# host) or "redis" (shared by hosts, requires the redis package)
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory")
+CACHE_SQLITE_PATH = os.environ.get(
+    "CACHE_SQLITE_PATH",
+    "/tmp/opengpts-cache.sqlite3",  # noqa: S108
+)
+CACHE_REDIS_URL = os.environ.get("CACHE_REDIS_URL", "redis://localhost:6379/0")
+
+# tracing: spans are written to "file" (default, TRACE_FILE), "console"
+# (stderr) or nowhere with "none"
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "file")
+TRACE_FILE = os.environ.get(
+    "TRACE_FILE",
+    "/tmp/chat-frontend-traces.jsonl",  # noqa: S108
+)
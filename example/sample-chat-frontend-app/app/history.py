@@ -0,0 +1,172 @@
+"""thread history"""
+
+from collections import OrderedDict
+from typing import Optional
+
+import streamlit as st
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.schema import Message
+
+from app.constants import HISTORY_CACHE_THREADS, HISTORY_PAGE_SIZE
+from app.prefetch import get_prefetcher
+from app.renderer import display_function_or_tool_result
+
+THREAD_MESSAGES_KEY = "thread_messages"
+HISTORY_PAGES_KEY = "history_pages"
+
+
+def _thread_messages() -> OrderedDict[str, list[Message]]:
+    """Decoded thread messages kept in the session
+
+    Returns:
+        OrderedDict[str, list[Message]]: messages by thread id
+    """
+    if THREAD_MESSAGES_KEY not in st.session_state:
+        st.session_state[THREAD_MESSAGES_KEY] = OrderedDict()
+    messages: OrderedDict[str, list[Message]] = st.session_state[
+        THREAD_MESSAGES_KEY
+    ]
+    return messages
+
+
+def get_thread_messages(
+    client: OpenGPTsClient,
+    thread_id: str,
+) -> list[Message]:
+    """Get thread messages, fetching them only on the first visit
+
+    Messages prefetched in the background are used when they are ready.
+
+    Args:
+        client (OpenGPTsClient): OpenGPTs Client
+        thread_id (str): thread id
+
+    Returns:
+        list[Message]: thread messages
+    """
+    cache = _thread_messages()
+    if thread_id not in cache:
+        messages = get_prefetcher().pop(thread_id)
+        if messages is None:
+            messages = client.get_messages(thread_id=thread_id).messages
+        set_thread_messages(thread_id, messages)
+    cache.move_to_end(thread_id)
+    return cache[thread_id]
+
+
+def has_thread_messages(thread_id: str) -> bool:
+    """Whether thread messages are stored in the session
+
+    Args:
+        thread_id (str): thread id
+
+    Returns:
+        bool: stored or not
+    """
+    return thread_id in _thread_messages()
+
+
+def set_thread_messages(thread_id: str, messages: list[Message]) -> None:
+    """Store thread messages in the session (e.g. after a run)
+
+    Args:
+        thread_id (str): thread id
+        messages (list[Message]): all thread messages
+    """
+    cache = _thread_messages()
+    cache[thread_id] = messages
+    cache.move_to_end(thread_id)
+    while len(cache) > HISTORY_CACHE_THREADS:
+        cache.popitem(last=False)
+
+
+def discard_thread_messages(thread_id: str) -> None:
+    """Drop stored thread messages so the next visit refetches them
+
+    Args:
+        thread_id (str): thread id
+    """
+    _thread_messages().pop(thread_id, None)
+
+
+def split_turns(messages: list[Message]) -> list[list[Message]]:
+    """Split messages into turns starting with a human message
+
+    Args:
+        messages (list[Message]): thread messages
+
+    Returns:
+        list[list[Message]]: turns
+    """
+    turns: list[list[Message]] = []
+    for msg in messages:
+        if msg.type == "human" or len(turns) == 0:
+            turns.append([])
+        turns[-1].append(msg)
+    return turns
+
+
+def display_turn(turn: list[Message], offset: int) -> None:
+    """Display one turn
+
+    Args:
+        turn (list[Message]): messages of the turn
+        offset (int): index of the first message in the thread
+    """
+    tools_message_list: list[tuple[int, Message]] = []
+    for idx, msg in enumerate(turn, start=offset):
+        if msg.content == "":
+            continue
+        if msg.type in ["function", "tool"]:
+            tools_message_list.append((idx, msg))
+        elif msg.type == "human":
+            st.chat_message(msg.type).write(msg.content)
+        elif msg.type == "ai":
+            with st.chat_message(msg.type):
+                st.write(msg.content)
+                for tools_idx, tools_msg in tools_message_list:
+                    display_function_or_tool_result(
+                        message=tools_msg,
+                        key=f"{tools_msg.id or tools_idx}",
+                    )
+            tools_message_list.clear()
+
+
+def display_thread_history(
+    client: OpenGPTsClient,
+    thread_id: Optional[str] = None,
+) -> list[Message]:
+    """Display thread message
+
+    Only the latest `HISTORY_PAGE_SIZE` turns are rendered; older turns are
+    loaded page by page on demand.
+
+    Args:
+        client (OpenGPTsClient): OpenGPTs Client
+        thread_id (str, optional): thread id. Defaults to None.
+
+    Returns:
+        list[Message]: all thread messages
+    """
+    if thread_id is None:
+        return []
+
+    message_list = get_thread_messages(client=client, thread_id=thread_id)
+    turns = split_turns(message_list)
+
+    pages: dict[str, int] = st.session_state.setdefault(HISTORY_PAGES_KEY, {})
+    visible = pages.get(thread_id, 1) * HISTORY_PAGE_SIZE
+    hidden = max(0, len(turns) - visible)
+    if hidden > 0 and st.button(
+        f"⬆️ load older messages ({hidden})",
+        key=f"load-older-{thread_id}",
+    ):
+        pages[thread_id] = pages.get(thread_id, 1) + 1
+        hidden = max(0, hidden - HISTORY_PAGE_SIZE)
+
+    offset = sum(len(turn) for turn in turns[:hidden])
+    for turn in turns[hidden:]:
+        display_turn(turn, offset)
+        offset += len(turn)
+
+    return message_list
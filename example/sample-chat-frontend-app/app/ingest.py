@@ -0,0 +1,260 @@
+"""background ingestion"""
+
+import queue
+import shutil
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from logging import getLogger
+from pathlib import Path
+from typing import BinaryIO, Literal, Optional
+
+import streamlit as st
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.scheduler import Priority, scheduling_priority
+from pydantic import BaseModel, Field
+
+from app.constants import (
+    INGEST_MAX_JOBS,
+    INGEST_MAX_QUEUE,
+    INGEST_SPOOL_DIR,
+    INGEST_WORKERS,
+)
+
+logger = getLogger(__name__)
+
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+FileState = Literal["queued", "uploading", "done", "failed"]
+
+
+class IngestFileStatus(BaseModel):
+    """Upload status of one file"""
+
+    name: str = Field(..., title="file name")
+    size: int = Field(..., title="file size (bytes)")
+    sent: int = Field(0, title="uploaded bytes")
+    state: FileState = Field("queued", title="state")
+    error: Optional[str] = Field(None, title="error message")
+
+
+class IngestJob(BaseModel):
+    """Files uploaded together to one assistant"""
+
+    job_id: str = Field(..., title="job id")
+    user_id: str = Field(..., title="opengpts user id")
+    assistant_id: str = Field(..., title="assistant id")
+    assistant_name: str = Field(..., title="assistant name")
+    created_at: datetime = Field(..., title="created at")
+    files: list[IngestFileStatus] = Field(..., title="files")
+
+    @property
+    def finished(self) -> bool:
+        """Whether every file is done or failed
+
+        Returns:
+            bool: finished or not
+        """
+        return all(f.state in ("done", "failed") for f in self.files)
+
+    @property
+    def progress(self) -> float:
+        """Uploaded fraction of the job
+
+        Returns:
+            float: 0.0 - 1.0
+        """
+        total = sum(f.size for f in self.files)
+        if total == 0:
+            return 1.0 if self.finished else 0.0
+        return sum(f.sent for f in self.files) / total
+
+
+class IngestQueueFullError(Exception):
+    """Too many jobs are waiting"""
+
+
+class IngestQueue:
+    """Ingestion job queue processed by worker threads
+
+    Uploaded files are spooled to disk and streamed to the backend one
+    file per request, so each file has its own status. Workers call the
+    backend with batch priority, so chats of the same process are
+    scheduled first.
+    """
+
+    def __init__(
+        self,
+        workers: int = INGEST_WORKERS,
+        max_queue: int = INGEST_MAX_QUEUE,
+        max_jobs: int = INGEST_MAX_JOBS,
+        spool_dir: Optional[str] = INGEST_SPOOL_DIR,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            workers (int, optional): \
+                worker threads. Defaults to INGEST_WORKERS.
+            max_queue (int, optional): \
+                max waiting jobs. Defaults to INGEST_MAX_QUEUE.
+            max_jobs (int, optional): \
+                max jobs kept for status display. Defaults to INGEST_MAX_JOBS.
+            spool_dir (Optional[str], optional): \
+                directory of spooled uploads. Defaults to INGEST_SPOOL_DIR.
+        """
+        self.max_jobs = max_jobs
+        self.spool_dir = spool_dir
+        self._queue: queue.Queue[tuple[IngestJob, OpenGPTsClient, Path]] = (
+            queue.Queue(maxsize=max_queue)
+        )
+        self._lock = threading.Lock()
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._workers = [
+            threading.Thread(
+                target=self._work,
+                name=f"ingest-worker-{i}",
+                daemon=True,
+            )
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(
+        self,
+        client: OpenGPTsClient,
+        assistant_id: str,
+        assistant_name: str,
+        files: list[tuple[str, BinaryIO]],
+    ) -> IngestJob:
+        """Spool files and enqueue an ingestion job
+
+        Args:
+            client (OpenGPTsClient): OpenGPTs Client of the user
+            assistant_id (str): assistant id
+            assistant_name (str): assistant name
+            files (list[tuple[str, BinaryIO]]): file names and contents
+
+        Raises:
+            IngestQueueFullError: too many jobs are waiting
+
+        Returns:
+            IngestJob: queued job
+        """
+        job_id = str(uuid.uuid4())
+        spool = Path(tempfile.mkdtemp(prefix="ingest-", dir=self.spool_dir))
+        statuses = []
+        try:
+            for index, (name, content) in enumerate(files):
+                # a directory per file keeps the original name on upload
+                path = spool / str(index) / Path(name).name
+                path.parent.mkdir()
+                with path.open("wb") as f:
+                    shutil.copyfileobj(content, f, SPOOL_CHUNK_SIZE)
+                statuses.append(
+                    IngestFileStatus(name=path.name, size=path.stat().st_size),
+                )
+            job = IngestJob(
+                job_id=job_id,
+                user_id=client.opengpts_user_id,
+                assistant_id=assistant_id,
+                assistant_name=assistant_name,
+                created_at=datetime.now(),
+                files=statuses,
+            )
+            self._queue.put_nowait((job, client, spool))
+        except queue.Full as e:
+            shutil.rmtree(spool, ignore_errors=True)
+            raise IngestQueueFullError("too many ingestion jobs") from e
+        except BaseException:
+            shutil.rmtree(spool, ignore_errors=True)
+            raise
+
+        with self._lock:
+            self._jobs[job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                oldest = next(iter(self._jobs.values()))
+                if not oldest.finished:
+                    break
+                self._jobs.popitem(last=False)
+        return job
+
+    def jobs(self, user_id: str) -> list[IngestJob]:
+        """Jobs of a user, newest first
+
+        Args:
+            user_id (str): opengpts user id
+
+        Returns:
+            list[IngestJob]: jobs
+        """
+        with self._lock:
+            jobs = [
+                job for job in self._jobs.values() if job.user_id == user_id
+            ]
+        return jobs[::-1]
+
+    def _work(self) -> None:
+        """Worker loop"""
+        while True:
+            job, client, spool = self._queue.get()
+            try:
+                with scheduling_priority(Priority.BATCH):
+                    self._run(job, client, spool)
+            finally:
+                shutil.rmtree(spool, ignore_errors=True)
+                self._queue.task_done()
+
+    def _run(
+        self,
+        job: IngestJob,
+        client: OpenGPTsClient,
+        spool: Path,
+    ) -> None:
+        """Upload the files of a job one by one
+
+        Args:
+            job (IngestJob): job
+            client (OpenGPTsClient): OpenGPTs Client
+            spool (Path): spool directory of the job
+        """
+        for index, status in enumerate(job.files):
+            status.state = "uploading"
+
+            def progress(
+                sent: int,
+                total: int,
+                status: IngestFileStatus = status,
+            ) -> None:
+                status.sent = min(sent, status.size)
+
+            try:
+                result = client.ingest_retrivers_files(
+                    files=[spool / str(index) / status.name],
+                    assistant_id=job.assistant_id,
+                    progress=progress,
+                )
+            except Exception as e:
+                logger.exception("ingestion failed: %s", status.name)
+                status.state = "failed"
+                status.error = str(e)
+                continue
+
+            if result["status"] >= 400:
+                status.state = "failed"
+                status.error = f"HTTP {result['status']}"
+            else:
+                status.sent = status.size
+                status.state = "done"
+
+
+@st.cache_resource
+def ingest_queue() -> IngestQueue:
+    """Ingestion queue shared by all sessions
+
+    Returns:
+        IngestQueue: ingestion queue
+    """
+    return IngestQueue()
@@ -1,49 +1,31 @@
 """sample frontend app"""
 
-import uuid
-from datetime import datetime, timedelta
 from typing import Optional
 
 import streamlit as st
 from opengpts_client.client import OpenGPTsClient
-from opengpts_client.schema import Assistant, Message
-from streamlit_cookies_controller import CookieController
+from opengpts_client.schema import Assistant, Message, Thread
+from opengpts_client.tracing import get_tracer
 from streamlit_google_oauth.google_oauth import google_oauth2_required
 
+from app.client import (
+    configure_tracing,
+    get_opengpts_user_id,
+    opengpt_client,
+)
+from app.compare import compare_assistants
 from app.constants import OPENGPTS_URL, TARGET_ASSISTANT_IDS
+from app.history import (
+    discard_thread_messages,
+    display_thread_history,
+    has_thread_messages,
+    set_thread_messages,
+)
+from app.prefetch import get_prefetcher, likely_next_threads
+from app.renderer import StreamingRenderer
 from app.ui import set_page_layout
 
 
-def get_opengpts_user_id() -> str:
-    """cookieからOpenGPTs user idを取得
-
-    Returns:
-        str: OpenGPTs user id
-    """
-    cookie_manager = CookieController()
-    user_id: Optional[str] = cookie_manager.get("opengpts_user_id")
-
-    if st.session_state.get("init") is not None and user_id is None:
-        user_id = str(uuid.uuid4())
-        expires_at = datetime.now() + timedelta(days=1000)
-        cookie_manager.set(
-            cookie="opengpts_user_id",
-            val=user_id,
-            expires_at=expires_at,
-        )
-    return user_id
-
-
-@st.cache_resource
-def opengpt_client(url: str, opengpts_user_id: str) -> OpenGPTsClient:
-    """OpenGPTs Client
-
-    Returns:
-        OpenGPTsClient: OpenGPTs Client
-    """
-    return OpenGPTsClient(url=url, opengpts_user_id=opengpts_user_id)
-
-
 def get_assitants(
     _client: OpenGPTsClient,
     target_assistant_ids: Optional[list[str]] = None,
@@ -93,6 +75,27 @@ def select_assistant(assistant_list: list[Assistant]) -> str:
     return assistant_list[index].assistant_id
 
 
+def list_assistant_threads(
+    client: OpenGPTsClient,
+    assistant_id: str,
+) -> list[Thread]:
+    """List threads of an assistant, most recently updated first
+
+    Args:
+        client (OpenGPTsClient): OpenGPTs Client
+        assistant_id (str): assistant id
+
+    Returns:
+        list[Thread]: threads
+    """
+    thread_list = [
+        thread
+        for thread in client.get_thread_list()
+        if thread.assistant_id == assistant_id
+    ]
+    return sorted(thread_list, key=lambda x: x.updated_at, reverse=True)
+
+
 def select_thread(
     client: OpenGPTsClient,
     assistant_id: str,
@@ -109,12 +112,7 @@ def select_thread(
         Optional[str]: thread id
     """
     st.sidebar.markdown("# 💬 Thread")
-    thread_list = [
-        thread
-        for thread in client.get_thread_list()
-        if thread.assistant_id == assistant_id
-    ]
-    thread_list = sorted(thread_list, key=lambda x: x.updated_at, reverse=True)
+    thread_list = list_assistant_threads(client, assistant_id)
 
     hoge = 0
     if current_thread_id is not None:
@@ -143,63 +141,6 @@ def select_thread(
     return thread_list[index - 1].thread_id
 
 
-def display_thread_history(
-    client: OpenGPTsClient,
-    thread_id: Optional[str] = None,
-) -> list[Message]:
-    """Display thread message
-
-    Args:
-        client (OpenGPTsClient): OpenGPTs Client
-        thread_id (str, optional): thread id. Defaults to None.
-
-    Returns:
-        list[Message]: _description_
-    """
-    if thread_id is None:
-        return []
-
-    message_list = client.get_messages(thread_id=thread_id).messages
-
-    tools_message_list = []
-    for msg in message_list:
-        if msg.content == "":
-            continue
-        if msg.type in ["function", "tool"]:
-            tools_message_list.append(msg)
-        elif msg.type == "human":
-            st.chat_message(msg.type).write(msg.content)
-        elif msg.type == "ai":
-            with st.chat_message(msg.type):
-                st.write(msg.content)
-                for tools_msg in tools_message_list:
-                    display_function_or_tool_result(message=tools_msg)
-            tools_message_list.clear()
-
-    return message_list
-
-
-def display_function_or_tool_result(message: Message) -> None:
-    """Display function result
-
-    Args:
-        message (Message): message
-    """
-    label = message.name or message.additional_kwargs.name
-    with st.expander(label):
-        if isinstance(message.content, list):
-            for content in message.content:
-                source = (
-                    content.metadata["source"] or content.page_content[:15]
-                ).replace("\n", " ")
-                with st.popover(label=f"📑 source: {source}"):
-                    st.caption(f"{content.page_content}")
-        else:
-            source = message.content[:25]
-            with st.popover(label=f"📑 source: {source}"):
-                st.text(message.content)
-
-
 @google_oauth2_required
 def main() -> None:
     """Main"""
@@ -216,6 +157,10 @@ def main() -> None:
 
     assistant_list = get_assitants(client, TARGET_ASSISTANT_IDS)
 
+    if len(assistant_list) > 1 and st.sidebar.toggle("⚖️ compare mode"):
+        compare_assistants(client, assistant_list)
+        return
+
     assistant_id = select_assistant(assistant_list)
     thread_id = select_thread(
         client,
@@ -223,41 +168,62 @@ def main() -> None:
         st.session_state["thread_id"],
     )
 
+    # warm the threads the user is likely to open next
+    get_prefetcher().prefetch(
+        client,
+        [
+            tid
+            for tid in likely_next_threads(
+                list_assistant_threads(client, assistant_id),
+                thread_id,
+            )
+            if not has_thread_messages(tid)
+        ],
+    )
+
     message_list = display_thread_history(client=client, thread_id=thread_id)
 
     if prompt := st.chat_input():
-        st.chat_message("user").write(prompt)
-
-        if thread_id is None:
-            thread_id = client.create_thread(
-                name=prompt,
+        with get_tracer().span(
+            "streamlit.chat_turn",
+            attributes={"assistant_id": assistant_id, "thread_id": thread_id},
+        ):
+            st.chat_message("user").write(prompt)
+
+            if thread_id is None:
+                thread_id = client.create_thread(
+                    name=prompt,
+                    assistant_id=assistant_id,
+                ).thread_id
+                st.session_state["thread_id"] = thread_id
+
+            message = Message(type="human", content=prompt)
+            response = client.run_stream(
                 assistant_id=assistant_id,
-            ).thread_id
-            st.session_state["thread_id"] = thread_id
+                thread_id=thread_id,
+                messages=[message],
+                prefetch="latest",
+            )
 
-        response = client.run_stream(
-            assistant_id=assistant_id,
-            thread_id=thread_id,
-            messages=[Message(type="human", content=prompt)],
-        )
+            with st.chat_message("assistant"), response:
+                renderer = StreamingRenderer(st.markdown("▌"))
+                result: list[Message] = []
 
-        with st.chat_message("assistant"):
-            message_placeholder = st.markdown("▌")
-            full_response = ""
+                for res in response:
+                    result = res[len(message_list) :]
+                    if len(result) == 0 or result[-1].type != "ai":
+                        continue
+                    renderer.update(result[-1].content)
 
-            for res in response:
-                result: list[Message] = res[len(message_list) :]
-                if result[-1].type != "ai":
-                    continue
-                full_response = result[-1].content
-                message_placeholder.markdown(full_response + "▌")
+                renderer.finalize(messages=result, offset=len(message_list))
 
-            message_placeholder.markdown(full_response)
-            for res in result:
-                if res.type in ["human", "ai"]:
-                    continue
-                display_function_or_tool_result(res)
+            # keep the decoded thread so the next rerun does not refetch it
+            if len(result) > 0:
+                set_thread_messages(thread_id, message_list + result)
+            else:
+                discard_thread_messages(thread_id)
 
 
 if __name__ == "__main__":
-    main()
+    with configure_tracing().span("streamlit.main"):
+        main()
@@ -0,0 +1,105 @@
+"""file ingestion page"""
+
+import streamlit as st
+from streamlit_google_oauth.google_oauth import google_oauth2_required
+
+from app.client import (
+    configure_tracing,
+    get_opengpts_user_id,
+    opengpt_client,
+)
+from app.constants import (
+    INGEST_POLL_INTERVAL,
+    OPENGPTS_URL,
+    TARGET_ASSISTANT_IDS,
+)
+from app.ingest import IngestJob, IngestQueueFullError, ingest_queue
+from app.main import get_assitants
+from app.ui import set_page_layout
+
+STATE_ICONS = {
+    "queued": "⏳",
+    "uploading": "⬆️",
+    "done": "✅",
+    "failed": "❌",
+}
+
+
+def display_job(job: IngestJob) -> None:
+    """Display job status
+
+    Args:
+        job (IngestJob): job
+    """
+    with st.container(border=True):
+        st.markdown(
+            f"**{job.assistant_name}** "
+            f"({job.created_at.strftime('%Y/%m/%d %H:%M:%S')})",
+        )
+        if not job.finished:
+            st.progress(job.progress)
+        for status in job.files:
+            line = f"{STATE_ICONS[status.state]} {status.name}"
+            if status.state == "uploading" and status.size > 0:
+                line += f" ({status.sent * 100 // status.size}%)"
+            if status.error is not None:
+                line += f" : {status.error}"
+            st.markdown(line)
+
+
+@st.fragment(run_every=INGEST_POLL_INTERVAL)
+def display_jobs(user_id: str) -> None:
+    """Display jobs of the user, refreshed in place while they run
+
+    Args:
+        user_id (str): opengpts user id
+    """
+    jobs = ingest_queue().jobs(user_id)
+    if len(jobs) == 0:
+        st.caption("no ingestion jobs")
+    for job in jobs:
+        display_job(job)
+
+
+@google_oauth2_required
+def main() -> None:
+    """Main"""
+    set_page_layout()
+
+    user_id = get_opengpts_user_id()
+    if user_id is None:
+        return
+
+    client = opengpt_client(url=OPENGPTS_URL, opengpts_user_id=user_id)
+    assistant_list = get_assitants(client, TARGET_ASSISTANT_IDS)
+
+    with st.form("ingest", clear_on_submit=True):
+        index = st.selectbox(
+            "assistant",
+            range(len(assistant_list)),
+            format_func=lambda x: assistant_list[x].name,
+        )
+        uploaded_files = st.file_uploader(
+            "files",
+            accept_multiple_files=True,
+        )
+        submitted = st.form_submit_button("ingest")
+
+    if submitted and uploaded_files:
+        assistant = assistant_list[index]
+        try:
+            ingest_queue().submit(
+                client=client,
+                assistant_id=assistant.assistant_id,
+                assistant_name=assistant.name,
+                files=[(f.name, f) for f in uploaded_files],
+            )
+        except IngestQueueFullError:
+            st.error("too many ingestion jobs. please retry later")
+
+    display_jobs(user_id)
+
+
+if __name__ == "__main__":
+    with configure_tracing().span("streamlit.ingest_files"):
+        main()
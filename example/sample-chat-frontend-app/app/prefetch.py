@@ -0,0 +1,150 @@
+"""thread prefetch"""
+
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+import streamlit as st
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.schema import Message, Thread
+
+from app.constants import (
+    PREFETCH_CACHE_SIZE,
+    PREFETCH_TOP_N,
+    PREFETCH_WORKERS,
+)
+
+PREFETCHER_KEY = "thread_prefetcher"
+
+
+@st.cache_resource
+def prefetch_executor() -> ThreadPoolExecutor:
+    """Thread pool shared by all sessions
+
+    Returns:
+        ThreadPoolExecutor: executor
+    """
+    return ThreadPoolExecutor(
+        max_workers=PREFETCH_WORKERS,
+        thread_name_prefix="thread-prefetch",
+    )
+
+
+def _cancel_all(futures: OrderedDict[str, Future]) -> None:
+    """Cancel pending prefetches
+
+    Args:
+        futures (OrderedDict[str, Future]): prefetches by thread id
+    """
+    for future in futures.values():
+        future.cancel()
+    futures.clear()
+
+
+class ThreadPrefetcher:
+    """Per-session bounded prefetch of thread messages
+
+    Pending prefetches are cancelled when the session (and with it this
+    object in `st.session_state`) goes away.
+    """
+
+    def __init__(
+        self,
+        executor: ThreadPoolExecutor,
+        max_entries: int = PREFETCH_CACHE_SIZE,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            executor (ThreadPoolExecutor): executor
+            max_entries (int, optional): \
+                max prefetched threads. Defaults to PREFETCH_CACHE_SIZE.
+        """
+        self.executor = executor
+        self.max_entries = max_entries
+        self._futures: OrderedDict[str, Future[list[Message]]] = OrderedDict()
+        weakref.finalize(self, _cancel_all, self._futures)
+
+    def prefetch(self, client: OpenGPTsClient, thread_ids: list[str]) -> None:
+        """Start fetching messages of threads in the background
+
+        Args:
+            client (OpenGPTsClient): OpenGPTs Client
+            thread_ids (list[str]): thread ids
+        """
+        for thread_id in thread_ids:
+            if thread_id in self._futures:
+                self._futures.move_to_end(thread_id)
+                continue
+            self._futures[thread_id] = self.executor.submit(
+                lambda tid: client.get_messages(thread_id=tid).messages,
+                thread_id,
+            )
+        while len(self._futures) > self.max_entries:
+            _, future = self._futures.popitem(last=False)
+            future.cancel()
+
+    def pop(self, thread_id: str) -> Optional[list[Message]]:
+        """Take prefetched messages if they are ready
+
+        Args:
+            thread_id (str): thread id
+
+        Returns:
+            Optional[list[Message]]: messages. None if not prefetched yet
+        """
+        future = self._futures.get(thread_id)
+        if future is None or not future.done():
+            return None
+        del self._futures[thread_id]
+        if future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def cancel(self) -> None:
+        """Cancel pending prefetches"""
+        _cancel_all(self._futures)
+
+
+def get_prefetcher() -> ThreadPrefetcher:
+    """Prefetcher of the current session
+
+    Returns:
+        ThreadPrefetcher: prefetcher
+    """
+    if PREFETCHER_KEY not in st.session_state:
+        st.session_state[PREFETCHER_KEY] = ThreadPrefetcher(
+            prefetch_executor(),
+        )
+    prefetcher: ThreadPrefetcher = st.session_state[PREFETCHER_KEY]
+    return prefetcher
+
+
+def likely_next_threads(
+    thread_list: list[Thread],
+    current_thread_id: Optional[str],
+    top_n: int = PREFETCH_TOP_N,
+) -> list[str]:
+    """Threads the user is likely to open next
+
+    Args:
+        thread_list (list[Thread]): threads sorted by update time (desc)
+        current_thread_id (Optional[str]): selected thread id
+        top_n (int, optional): \
+            most recently updated threads. Defaults to PREFETCH_TOP_N.
+
+    Returns:
+        list[str]: thread ids except the selected one
+    """
+    candidates = [thread.thread_id for thread in thread_list[:top_n]]
+    for idx, thread in enumerate(thread_list):
+        if thread.thread_id == current_thread_id:
+            candidates += [
+                t.thread_id for t in thread_list[max(0, idx - 1) : idx + 2]
+            ]
+    return [
+        thread_id
+        for thread_id in dict.fromkeys(candidates)
+        if thread_id != current_thread_id
+    ]
@@ -0,0 +1,129 @@
+"""streaming renderer"""
+
+import time
+from typing import Any, Optional
+
+import streamlit as st
+from opengpts_client.schema import Message
+
+from app.constants import STREAM_RENDER_FPS, STREAM_RENDER_MIN_DELTA
+
+CURSOR = "▌"
+
+
+def display_function_or_tool_result(message: Message, key: str) -> None:
+    """Display function result
+
+    Sources are only built once the user opens them, because expander and
+    popover contents are sent to the browser even while collapsed.
+
+    Args:
+        message (Message): message
+        key (str): widget key unique in the thread
+    """
+    label = message.name or message.additional_kwargs.name
+    if not st.toggle(f"🔧 {label}", key=f"sources-{key}"):
+        return
+    with st.container(border=True):
+        if isinstance(message.content, list):
+            for content in message.content:
+                source = (
+                    content.metadata["source"] or content.page_content[:15]
+                ).replace("\n", " ")
+                with st.popover(label=f"📑 source: {source}"):
+                    st.caption(f"{content.page_content}")
+        else:
+            source = message.content[:25]
+            with st.popover(label=f"📑 source: {source}"):
+                st.text(message.content)
+
+
+class StreamingRenderer:
+    """Frame-rate-throttled markdown renderer for streamed answers
+
+    Every `markdown` call re-sends the whole answer over the websocket, so
+    deltas are coalesced and flushed at most `fps` times per second, or
+    earlier once `min_delta` new characters have arrived (0 disables).
+    Tool and function results are rendered once, by `finalize`.
+    """
+
+    def __init__(
+        self,
+        placeholder: Any,
+        fps: float = STREAM_RENDER_FPS,
+        min_delta: int = STREAM_RENDER_MIN_DELTA,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            placeholder (Any): `st.empty` / `st.markdown` placeholder
+            fps (float, optional): max flushes per second. \
+                Defaults to STREAM_RENDER_FPS.
+            min_delta (int, optional): flush early after this many new \
+                characters. Defaults to STREAM_RENDER_MIN_DELTA.
+        """
+        self.placeholder = placeholder
+        self.frame_interval = 1 / fps if fps > 0 else 0.0
+        self.min_delta = min_delta
+        self.text = ""
+        self.flushes = 0
+        self._rendered_length = 0
+        self._flushed_at = 0.0
+
+    def update(self, text: str) -> None:
+        """Set the latest answer text and flush if a frame is due
+
+        Args:
+            text (str): whole answer so far
+        """
+        self.text = text
+        delta = len(text) - self._rendered_length
+        if delta == 0:
+            return
+        elapsed = time.monotonic() - self._flushed_at
+        if elapsed >= self.frame_interval or (
+            self.min_delta > 0 and delta >= self.min_delta
+        ):
+            self._flush(self.text + CURSOR)
+
+    def _flush(self, body: str) -> None:
+        """Render markdown
+
+        Args:
+            body (str): markdown
+        """
+        self.placeholder.markdown(body)
+        self._rendered_length = len(self.text)
+        self._flushed_at = time.monotonic()
+        self.flushes += 1
+
+    def finalize(
+        self,
+        text: Optional[str] = None,
+        messages: Optional[list[Message]] = None,
+        offset: int = 0,
+        key_prefix: str = "",
+    ) -> None:
+        """Render the final answer and its tool / function results
+
+        Args:
+            text (Optional[str], optional): final answer. \
+                Defaults to None (last updated text).
+            messages (Optional[list[Message]], optional): \
+                messages produced by the run. Defaults to None.
+            offset (int, optional): \
+                index of the run's first message in the thread. \
+                Defaults to 0.
+            key_prefix (str, optional): widget key prefix when several \
+                runs are rendered on one page. Defaults to "".
+        """
+        if text is not None:
+            self.text = text
+        self._flush(self.text)
+        for idx, message in enumerate(messages or [], start=offset):
+            if message.type in ["human", "ai"]:
+                continue
+            display_function_or_tool_result(
+                message,
+                key=f"{key_prefix}{message.id or idx}",
+            )
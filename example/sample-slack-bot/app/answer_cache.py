@@ -0,0 +1,137 @@
+"""FAQ answer cache"""
+
+import hashlib
+import unicodedata
+from typing import Optional
+
+import orjson
+from opengpts_client.cache import CacheBackend
+from opengpts_client.schema import Assistant, Message
+
+from app.constants import ANSWER_CACHE_TTL, ANSWER_CACHE_VERSION
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normalize a question for cache lookup
+
+    Args:
+        prompt (str): question without the mention
+
+    Returns:
+        str: NFKC normalized, case folded and whitespace collapsed question
+    """
+    return " ".join(unicodedata.normalize("NFKC", prompt).casefold().split())
+
+
+def assistant_fingerprint(
+    assistant: Assistant,
+    version: str = ANSWER_CACHE_VERSION,
+) -> str:
+    """Fingerprint of the assistant state an answer came from
+
+    Args:
+        assistant (Assistant): assistant
+        version (str, optional): manual version, e.g. bumped after \
+            ingestion. Defaults to ANSWER_CACHE_VERSION.
+
+    Returns:
+        str: fingerprint
+    """
+    state = orjson.dumps(
+        {
+            "updated_at": assistant.updated_at.isoformat(),
+            "config": assistant.config,
+            "version": version,
+        },
+        option=orjson.OPT_SORT_KEYS,
+    )
+    return hashlib.sha256(state).hexdigest()
+
+
+class AnswerCache:
+    """Answers keyed by (assistant_id, normalized prompt)
+
+    Each answer records the fingerprint of the assistant it came from and
+    is treated as a miss once the assistant config, update time or
+    `ANSWER_CACHE_VERSION` changes. TTL and size bound eviction are left
+    to the cache backend.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        ttl: float = ANSWER_CACHE_TTL,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            backend (CacheBackend): cache backend
+            ttl (float, optional): \
+                seconds an answer is reused. Defaults to ANSWER_CACHE_TTL.
+        """
+        self.backend = backend
+        self.ttl = ttl
+
+    def _key(self, assistant_id: str, prompt: str) -> str:
+        """Cache key
+
+        Args:
+            assistant_id (str): assistant id
+            prompt (str): question
+
+        Returns:
+            str: cache key
+        """
+        digest = hashlib.sha256(
+            normalize_prompt(prompt).encode("utf-8"),
+        ).hexdigest()
+        return f"answer:{assistant_id}:{digest}"
+
+    def get(
+        self,
+        assistant_id: str,
+        fingerprint: str,
+        prompt: str,
+    ) -> Optional[list[Message]]:
+        """Get a cached answer
+
+        Args:
+            assistant_id (str): assistant id
+            fingerprint (str): current assistant fingerprint
+            prompt (str): question
+
+        Returns:
+            Optional[list[Message]]: messages of the answer. None if missing
+        """
+        key = self._key(assistant_id, prompt)
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        if entry["fingerprint"] != fingerprint:
+            self.backend.delete(key)
+            return None
+        return [Message.model_validate(m) for m in entry["messages"]]
+
+    def set(
+        self,
+        assistant_id: str,
+        fingerprint: str,
+        prompt: str,
+        messages: list[Message],
+    ) -> None:
+        """Cache an answer
+
+        Args:
+            assistant_id (str): assistant id
+            fingerprint (str): assistant fingerprint of the run
+            prompt (str): question
+            messages (list[Message]): messages produced by the run
+        """
+        self.backend.set(
+            self._key(assistant_id, prompt),
+            {
+                "fingerprint": fingerprint,
+                "messages": [m.model_dump(mode="json") for m in messages],
+            },
+            self.ttl,
+        )
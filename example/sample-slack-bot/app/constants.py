@@ -12,8 +12,100 @@ SLACK_BOT_TOKEN = os.environ["SLACK_BOT_TOKEN"]
 SLACK_SIGNING_SECRET = os.environ["SLACK_SIGNING_SECRET"]
 """aaa"""
 
+SLACK_API_URL = os.environ.get("SLACK_API_URL", "https://slack.com/api/")
+"""Slack Web API base URL (points to a mock server in load tests)"""
+
 OPENGPTS_BOT_ID = os.environ["OPENGPTS_BOT_ID"]
 """BOT ID created by OpenGPTs"""
 
 OPENGPTS_URL = os.environ.get("OPENGPTS_URL", "http://localhost:8100")
 """OpenGPTs URL"""
+
+DEPLOYED = "K_SERVICE" in os.environ
+"""running on Cloud Functions / Cloud Run, where local files are lost"""
+
+THREAD_STORE_PATH = os.environ.get("THREAD_STORE_PATH")
+"""SQLite file of the Slack thread → OpenGPTs thread mapping
+
+The default under /tmp is for development only. When deployed, set it to
+a persistent volume mount or install a managed store with
+`set_thread_store`; otherwise threads lose their history on cold starts.
+"""
+
+DEV_THREAD_STORE_PATH = "/tmp/slack-threads.sqlite3"  # noqa: S108
+"""THREAD_STORE_PATH of local development"""
+
+THREAD_CACHE_SIZE = int(os.environ.get("THREAD_CACHE_SIZE", "10000"))
+"""in-process LRU size of the thread mapping"""
+
+# background processing
+# NOTE: runs continue after the HTTP response, so deploy with CPU always
+# allocated (Cloud Functions 2nd gen / Cloud Run)
+WORKER_THREADS = int(os.environ.get("WORKER_THREADS", "8"))
+"""worker threads processing mentions"""
+
+WORKER_MAX_QUEUE = int(os.environ.get("WORKER_MAX_QUEUE", "64"))
+"""max mentions waiting for a worker"""
+
+WORKSPACE_CONCURRENCY = int(os.environ.get("WORKSPACE_CONCURRENCY", "2"))
+"""max mentions processed at a time per workspace"""
+
+SLACK_UPDATE_INTERVAL = float(os.environ.get("SLACK_UPDATE_INTERVAL", "1.5"))
+"""min seconds between chat.update calls of a streamed reply"""
+
+SLACK_FINALIZE_TIMEOUT = float(os.environ.get("SLACK_FINALIZE_TIMEOUT", "30"))
+"""seconds the final chat.update is retried before posting a new message"""
+
+EVENT_STORE_PATH = os.environ.get(
+    "EVENT_STORE_PATH",
+    "/tmp/slack-events.sqlite3",  # noqa: S108
+)
+"""SQLite file of processed Slack event ids"""
+
+EVENT_IN_FLIGHT_TTL = float(os.environ.get("EVENT_IN_FLIGHT_TTL", "900"))
+"""seconds an event is claimed while it is processed"""
+
+EVENT_DONE_TTL = float(os.environ.get("EVENT_DONE_TTL", "3600"))
+"""seconds a processed event id is remembered (covers Slack retries)"""
+
+EVENT_PURGE_INTERVAL = float(os.environ.get("EVENT_PURGE_INTERVAL", "300"))
+"""min seconds between deletions of expired event ids"""
+
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+"""shared secret of the X-Admin-Token header of operational endpoints.
+They are disabled when unset"""
+
+WARMUP_ON_START = os.environ.get("WARMUP_ON_START", "true") == "true"
+"""prime DNS / TLS / connections to OpenGPTs when the instance starts"""
+
+ANSWER_CACHE_ENABLED = (
+    os.environ.get("ANSWER_CACHE_ENABLED", "false") == "true"
+)
+"""answer repeated questions from the FAQ answer cache"""
+
+OPENGPTS_BOT_OWNER_ID = os.environ.get("OPENGPTS_BOT_OWNER_ID")
+"""OpenGPTs user id owning OPENGPTS_BOT_ID (required by the answer cache)"""
+
+ANSWER_CACHE_TTL = float(os.environ.get("ANSWER_CACHE_TTL", "3600"))
+"""seconds a cached answer is reused"""
+
+ANSWER_CACHE_SIZE = int(os.environ.get("ANSWER_CACHE_SIZE", "1000"))
+"""max cached answers"""
+
+ANSWER_SEED_TTL = float(os.environ.get("ANSWER_SEED_TTL", "86400"))
+"""seconds a cached answer is kept to seed the thread of a later reply"""
+
+ANSWER_CACHE_VERSION = os.environ.get("ANSWER_CACHE_VERSION", "")
+"""bump after ingesting documents to drop cached answers"""
+
+ASSISTANT_CACHE_TTL = float(os.environ.get("ASSISTANT_CACHE_TTL", "60"))
+"""seconds until assistant config changes invalidate cached answers"""
+
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "file")
+"""span exporter: file (default, TRACE_FILE), console (stderr) or none"""
+
+TRACE_FILE = os.environ.get(
+    "TRACE_FILE",
+    "/tmp/slack-bot-traces.jsonl",  # noqa: S108
+)
+"""JSON lines file of the file span exporter"""
@@ -0,0 +1,180 @@
+"""per-conversation scheduling of Slack mentions"""
+
+import threading
+import time
+from logging import getLogger
+from typing import Any, Callable, Generic, Optional, TypeVar
+
+from app.dispatcher import WorkspaceDispatcher
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+WAIT_EWMA_ALPHA = 0.2
+
+
+class _Conversation(Generic[T]):
+    """Mentions of one conversation waiting for a run"""
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self.items: list[T] = []
+        self.arrived_at: list[float] = []
+        self.running = False
+
+
+class ConversationScheduler(Generic[T]):
+    """Serialize runs per conversation and coalesce bursts
+
+    At most one run per conversation (slack thread) is queued or running.
+    Mentions arriving while the run is waiting join it; mentions arriving
+    while it runs are merged into a single follow-up run. Runs are executed
+    by the dispatcher, whose workers cap the global concurrency.
+    """
+
+    def __init__(
+        self,
+        dispatcher: WorkspaceDispatcher,
+        run: Callable[[list[T]], None],
+        reject: Callable[[list[T]], None],
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            dispatcher (WorkspaceDispatcher): executor of the runs
+            run (Callable[[list[T]], None]): run of coalesced mentions
+            reject (Callable[[list[T]], None]): \
+                called with mentions dropped because the queue is full
+        """
+        self.dispatcher = dispatcher
+        self.run = run
+        self.reject = reject
+        self._lock = threading.Lock()
+        self._conversations: dict[str, _Conversation[T]] = {}
+        self._coalesced = 0
+        self._wait_ewma: Optional[float] = None
+        self._max_wait = 0.0
+
+    def submit(self, key: str, workspace: str, item: T) -> bool:
+        """Schedule a mention
+
+        Args:
+            key (str): conversation key
+            workspace (str): slack team id
+            item (T): mention
+
+        Returns:
+            bool: False if the queue is full
+        """
+        with self._lock:
+            conversation = self._conversations.get(key)
+            if conversation is not None:
+                conversation.items.append(item)
+                conversation.arrived_at.append(time.monotonic())
+                self._coalesced += 1
+                return True
+            # dispatched under the lock: no mention can join a conversation
+            # that is dropped because the queue is full
+            if not self._dispatch(key, workspace):
+                return False
+            conversation = _Conversation()
+            conversation.items.append(item)
+            conversation.arrived_at.append(time.monotonic())
+            self._conversations[key] = conversation
+            return True
+
+    def _dispatch(self, key: str, workspace: str) -> bool:
+        """Queue the next run of a conversation (lock held)
+
+        Args:
+            key (str): conversation key
+            workspace (str): slack team id
+
+        Returns:
+            bool: False if the queue is full
+        """
+        return self.dispatcher.submit(
+            workspace,
+            lambda: self._run(key, workspace),
+        )
+
+    def _run(self, key: str, workspace: str) -> None:
+        """Run the waiting mentions of a conversation (worker thread)
+
+        Args:
+            key (str): conversation key
+            workspace (str): slack team id
+        """
+        with self._lock:
+            conversation = self._conversations[key]
+            items, conversation.items = conversation.items, []
+            arrived_at, conversation.arrived_at = conversation.arrived_at, []
+            conversation.running = True
+            self._record_wait(time.monotonic() - min(arrived_at))
+
+        try:
+            self.run(items)
+        finally:
+            dropped = self._follow_up(key, workspace, conversation)
+            if len(dropped) > 0:
+                self.reject(dropped)
+
+    def _follow_up(
+        self,
+        key: str,
+        workspace: str,
+        conversation: _Conversation[T],
+    ) -> list[T]:
+        """Queue a run of the mentions that arrived during a run
+
+        Args:
+            key (str): conversation key
+            workspace (str): slack team id
+            conversation (_Conversation[T]): conversation
+
+        Returns:
+            list[T]: mentions dropped because the queue is full
+        """
+        with self._lock:
+            conversation.running = False
+            if len(conversation.items) > 0 and self._dispatch(key, workspace):
+                return []
+            del self._conversations[key]
+            return conversation.items
+
+    def _record_wait(self, wait: float) -> None:
+        """Record queueing time (lock held)
+
+        Args:
+            wait (float): seconds from the first mention to the run
+        """
+        self._max_wait = max(self._max_wait, wait)
+        if self._wait_ewma is None:
+            self._wait_ewma = wait
+        else:
+            self._wait_ewma += WAIT_EWMA_ALPHA * (wait - self._wait_ewma)
+
+    def metrics(self) -> dict[str, Any]:
+        """Scheduling metrics
+
+        Returns:
+            dict[str, Any]: metrics
+        """
+        with self._lock:
+            running = sum(1 for c in self._conversations.values() if c.running)
+            return {
+                "conversations": len(self._conversations),
+                "running": running,
+                "waiting_mentions": sum(
+                    len(c.items) for c in self._conversations.values()
+                ),
+                "coalesced": self._coalesced,
+                "wait_ewma_ms": (
+                    None
+                    if self._wait_ewma is None
+                    else round(self._wait_ewma * 1000, 3)
+                ),
+                "max_wait_ms": round(self._max_wait * 1000, 3),
+                "dispatcher": self.dispatcher.metrics(),
+            }
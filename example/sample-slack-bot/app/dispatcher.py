@@ -0,0 +1,124 @@
+"""background processing of Slack events"""
+
+import threading
+from collections import OrderedDict, deque
+from logging import getLogger
+from typing import Any, Callable, Optional
+
+logger = getLogger(__name__)
+
+Job = Callable[[], None]
+
+
+class WorkspaceDispatcher:
+    """Bounded job queue with per-workspace concurrency limits
+
+    Listeners enqueue jobs and return right away, so Slack is acknowledged
+    within its 3 second deadline. Worker threads pick workspaces in round
+    robin and never run more than `per_workspace` jobs of one workspace at
+    a time, so one busy workspace cannot starve the others.
+    """
+
+    def __init__(
+        self,
+        workers: int,
+        max_queue: int,
+        per_workspace: int,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            workers (int): worker threads
+            max_queue (int): max waiting jobs of all workspaces
+            per_workspace (int): max running jobs per workspace
+        """
+        self.workers = workers
+        self.max_queue = max_queue
+        self.per_workspace = per_workspace
+        self._condition = threading.Condition()
+        self._pending: OrderedDict[str, deque[Job]] = OrderedDict()
+        self._active: dict[str, int] = {}
+        self._queued = 0
+        self._rejected = 0
+        self._threads: list[threading.Thread] = []
+
+    def submit(self, workspace: str, job: Job) -> bool:
+        """Enqueue a job
+
+        Args:
+            workspace (str): slack team id
+            job (Job): job
+
+        Returns:
+            bool: False if the queue is full
+        """
+        with self._condition:
+            if self._queued >= self.max_queue:
+                self._rejected += 1
+                return False
+            self._pending.setdefault(workspace, deque()).append(job)
+            self._queued += 1
+            self._start_workers()
+            self._condition.notify()
+        return True
+
+    def _start_workers(self) -> None:
+        """Start worker threads on first use (lock held)"""
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(
+                target=self._work,
+                name=f"slack-worker-{len(self._threads)}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def _next(self) -> Optional[tuple[str, Job]]:
+        """Take a job of a workspace below its limit (lock held)
+
+        Returns:
+            Optional[tuple[str, Job]]: workspace and job
+        """
+        for workspace, jobs in self._pending.items():
+            if self._active.get(workspace, 0) >= self.per_workspace:
+                continue
+            job = jobs.popleft()
+            if len(jobs) == 0:
+                del self._pending[workspace]
+            else:
+                self._pending.move_to_end(workspace)
+            self._queued -= 1
+            self._active[workspace] = self._active.get(workspace, 0) + 1
+            return workspace, job
+        return None
+
+    def _work(self) -> None:
+        """Worker loop"""
+        while True:
+            with self._condition:
+                while (item := self._next()) is None:
+                    self._condition.wait()
+            workspace, job = item
+            try:
+                job()
+            except Exception:
+                logger.exception("slack job failed: %s", workspace)
+            finally:
+                with self._condition:
+                    self._active[workspace] -= 1
+                    if self._active[workspace] == 0:
+                        del self._active[workspace]
+                    self._condition.notify_all()
+
+    def metrics(self) -> dict[str, Any]:
+        """Queue metrics
+
+        Returns:
+            dict[str, Any]: metrics
+        """
+        with self._condition:
+            return {
+                "queued": self._queued,
+                "active": dict(self._active),
+                "rejected": self._rejected,
+            }
@@ -0,0 +1,163 @@
+"""idempotent Slack event processing"""
+
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Union
+
+DEFAULT_PURGE_INTERVAL = 300.0
+SQLITE_TIMEOUT = 5.0
+
+
+class EventStore(ABC):
+    """TTL store of Slack event ids being processed or processed
+
+    Implement this interface with an atomic managed store (e.g. Redis
+    `SET NX EX` or a Firestore transaction) to deduplicate across
+    instances.
+    """
+
+    @abstractmethod
+    def begin(self, event_id: str, ttl: float) -> bool:
+        """Claim an event
+
+        Args:
+            event_id (str): slack event id
+            ttl (float): seconds the claim is held while processing
+
+        Returns:
+            bool: False if the event is in flight or already processed
+        """
+
+    @abstractmethod
+    def complete(self, event_id: str, ttl: float) -> None:
+        """Mark an event as processed
+
+        Args:
+            event_id (str): slack event id
+            ttl (float): seconds the event is remembered
+        """
+
+    @abstractmethod
+    def release(self, event_id: str) -> None:
+        """Drop a claim so that a redelivery is processed
+
+        Args:
+            event_id (str): slack event id
+        """
+
+
+class SQLiteEventStore(EventStore):
+    """Event store in a local SQLite file
+
+    Expired event ids are deleted on start and then by `complete` at most
+    once per `purge_interval` seconds, so the table of a long-lived
+    instance only holds the ids that have not expired.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        purge_interval: float = DEFAULT_PURGE_INTERVAL,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Union[str, Path]): database file
+            purge_interval (float, optional): min seconds between \
+                deletions of expired ids. Defaults to DEFAULT_PURGE_INTERVAL.
+        """
+        self.path = str(path)
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._purge_lock = threading.Lock()
+        self._purged_at = time.monotonic()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS slack_events ("
+                "event_id TEXT PRIMARY KEY, state TEXT NOT NULL, "
+                "expires_at REAL NOT NULL)",
+            )
+            self._purge(conn)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the current thread
+
+        Returns:
+            sqlite3.Connection: connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+            self._local.conn = conn
+        return conn
+
+    def begin(self, event_id: str, ttl: float) -> bool:
+        """Claim an event
+
+        Args:
+            event_id (str): slack event id
+            ttl (float): seconds the claim is held while processing
+
+        Returns:
+            bool: False if the event is in flight or already processed
+        """
+        now = time.time()
+        with self._connection() as conn:
+            # a single statement, so concurrent deliveries cannot both win
+            cursor = conn.execute(
+                "INSERT INTO slack_events (event_id, state, expires_at) "
+                "VALUES (?, 'in_flight', ?) ON CONFLICT (event_id) "
+                "DO UPDATE SET state = 'in_flight', "
+                "expires_at = excluded.expires_at "
+                "WHERE slack_events.expires_at <= ?",
+                (event_id, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, event_id: str, ttl: float) -> None:
+        """Mark an event as processed
+
+        Args:
+            event_id (str): slack event id
+            ttl (float): seconds the event is remembered
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO slack_events "
+                "(event_id, state, expires_at) VALUES (?, 'done', ?)",
+                (event_id, time.time() + ttl),
+            )
+            with self._purge_lock:
+                due = time.monotonic() - self._purged_at >= self.purge_interval
+                if due:
+                    self._purged_at = time.monotonic()
+            if due:
+                self._purge(conn)
+
+    def _purge(self, conn: sqlite3.Connection) -> None:
+        """Delete expired event ids
+
+        Args:
+            conn (sqlite3.Connection): connection
+        """
+        conn.execute(
+            "DELETE FROM slack_events WHERE expires_at <= ?",
+            (time.time(),),
+        )
+
+    def release(self, event_id: str) -> None:
+        """Drop a claim so that a redelivery is processed
+
+        Args:
+            event_id (str): slack event id
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM slack_events "
+                "WHERE event_id = ? AND state = 'in_flight'",
+                (event_id,),
+            )
@@ -0,0 +1,93 @@
+"""cold / warm latency measurement"""
+
+import threading
+import time
+from typing import Any, Literal, Optional
+
+EWMA_ALPHA = 0.2
+
+Start = Literal["cold", "warm"]
+
+
+class _Stats:
+    """Latency statistics of one kind"""
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self.count = 0
+        self.ewma: Optional[float] = None
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        """Record a latency
+
+        Args:
+            seconds (float): latency
+        """
+        self.count += 1
+        self.max = max(self.max, seconds)
+        if self.ewma is None:
+            self.ewma = seconds
+        else:
+            self.ewma += EWMA_ALPHA * (seconds - self.ewma)
+
+    def metrics(self) -> dict[str, Any]:
+        """Metrics
+
+        Returns:
+            dict[str, Any]: count, ewma and max in milliseconds
+        """
+        return {
+            "count": self.count,
+            "ewma_ms": (
+                None if self.ewma is None else round(self.ewma * 1000, 3)
+            ),
+            "max_ms": round(self.max * 1000, 3),
+        }
+
+
+class LatencyRecorder:
+    """Latency split into the first (cold) and later (warm) calls
+
+    The first call of an instance pays for DNS, TLS and connection setup,
+    so it is kept apart from the steady-state latency.
+    """
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self._lock = threading.Lock()
+        self._stats: dict[Start, _Stats] = {"cold": _Stats(), "warm": _Stats()}
+
+    def record(self, seconds: float) -> Start:
+        """Record a latency
+
+        Args:
+            seconds (float): latency
+
+        Returns:
+            Start: whether it was the cold call
+        """
+        with self._lock:
+            start: Start = "cold" if self._stats["cold"].count == 0 else "warm"
+            self._stats[start].record(seconds)
+            return start
+
+    def since(self, started_at: float) -> Start:
+        """Record the time elapsed since a `time.perf_counter()` value
+
+        Args:
+            started_at (float): perf counter at the start
+
+        Returns:
+            Start: whether it was the cold call
+        """
+        return self.record(time.perf_counter() - started_at)
+
+    def metrics(self) -> dict[str, Any]:
+        """Metrics
+
+        Returns:
+            dict[str, Any]: cold and warm statistics
+        """
+        with self._lock:
+            return {start: s.metrics() for start, s in self._stats.items()}
@@ -1,39 +1,301 @@
 """chatbot with slack-bolt"""
 
+import hmac
 import json
 import re
+import threading
+import time
 from logging import getLogger
 from typing import Any, Optional
 
 import functions_framework
 from flask import Request, Response
+from opengpts_client.cache import CacheTTL, MemoryCache
 from opengpts_client.client import OpenGPTsClient
+from opengpts_client.pool import OpenGPTsClientPool
 from opengpts_client.schema import Message
+from opengpts_client.tracing import (
+    Tracer,
+    create_exporter,
+    current_span,
+    extract,
+    set_tracer,
+)
 from slack_bolt import App
 from slack_bolt.adapter.google_cloud_functions import SlackRequestHandler
 from slack_bolt.context.say import Say
-from slack_sdk.models.blocks import (
-    DividerBlock,
-    MarkdownTextObject,
-    SectionBlock,
-)
+from slack_sdk import WebClient
 
+from app.answer_cache import AnswerCache, assistant_fingerprint
 from app.constants import (
+    ADMIN_TOKEN,
+    ANSWER_CACHE_ENABLED,
+    ANSWER_CACHE_SIZE,
+    ANSWER_SEED_TTL,
+    ASSISTANT_CACHE_TTL,
+    DEPLOYED,
+    DEV_THREAD_STORE_PATH,
+    EVENT_DONE_TTL,
+    EVENT_IN_FLIGHT_TTL,
+    EVENT_PURGE_INTERVAL,
+    EVENT_STORE_PATH,
     OPENGPTS_BOT_ID,
+    OPENGPTS_BOT_OWNER_ID,
     OPENGPTS_URL,
+    SLACK_API_URL,
     SLACK_BOT_TOKEN,
     SLACK_SIGNING_SECRET,
+    THREAD_CACHE_SIZE,
+    THREAD_STORE_PATH,
+    TRACE_EXPORTER,
+    TRACE_FILE,
+    WARMUP_ON_START,
+    WORKER_MAX_QUEUE,
+    WORKER_THREADS,
+    WORKSPACE_CONCURRENCY,
 )
+from app.conversation import ConversationScheduler
+from app.dispatcher import WorkspaceDispatcher
+from app.idempotency import EventStore, SQLiteEventStore
+from app.latency import LatencyRecorder
+from app.streaming import SlackStreamingReply
+from app.thread_store import CachedThreadStore, SQLiteThreadStore, ThreadStore
 
 logger = getLogger(__name__)
 
+_init_started_at = time.perf_counter()
+
+tracer = Tracer(
+    create_exporter(TRACE_EXPORTER, TRACE_FILE),
+    service_name="slack-bot",
+)
+set_tracer(tracer)
+
 # setting App
 app = App(
-    token=SLACK_BOT_TOKEN,
+    client=WebClient(token=SLACK_BOT_TOKEN, base_url=SLACK_API_URL),
     signing_secret=SLACK_SIGNING_SECRET,
     process_before_response=True,
 )
 handler = SlackRequestHandler(app)
+dispatcher = WorkspaceDispatcher(
+    workers=WORKER_THREADS,
+    max_queue=WORKER_MAX_QUEUE,
+    per_workspace=WORKSPACE_CONCURRENCY,
+)
+
+Mention = tuple[dict[str, Any], Say]
+"""app_mention event (with event_id, traceparent) and say of the request"""
+
+_thread_store: Optional[ThreadStore] = None
+_thread_store_lock = threading.Lock()
+_event_store: Optional[EventStore] = None
+_event_store_lock = threading.Lock()
+_client_pool: Optional[OpenGPTsClientPool] = None
+_client_pool_lock = threading.Lock()
+
+answer_cache = AnswerCache(MemoryCache(max_entries=ANSWER_CACHE_SIZE))
+answer_seeds = MemoryCache(max_entries=ANSWER_CACHE_SIZE)
+"""question and cached answer of slack threads answered from the cache"""
+if ANSWER_CACHE_ENABLED and OPENGPTS_BOT_OWNER_ID is None:
+    # the assistant is read for its fingerprint, which only its owner can
+    # do unless it is public
+    raise ValueError(
+        "ANSWER_CACHE_ENABLED requires OPENGPTS_BOT_OWNER_ID, "
+        "the OpenGPTs user id owning OPENGPTS_BOT_ID",
+    )
+
+ADMIN_HEADER = "X-Admin-Token"
+"""header of the shared secret of /metrics and /warmup"""
+
+invocation_latency = LatencyRecorder()
+"""latency of slack_bot requests"""
+run_latency = LatencyRecorder()
+"""latency of answering mentions"""
+warmup_latency = LatencyRecorder()
+"""latency of the warmup"""
+
+
+def get_client_pool() -> OpenGPTsClientPool:
+    """Client pool reused by warm invocations (created on first use)
+
+    Every slack thread has its own OpenGPTs user, but all of them share
+    the pooled connections of the pool.
+
+    Returns:
+        OpenGPTsClientPool: client pool
+    """
+    global _client_pool
+    with _client_pool_lock:
+        if _client_pool is None:
+            _client_pool = OpenGPTsClientPool(
+                cache=MemoryCache(),
+                cache_ttl=CacheTTL(assistants=ASSISTANT_CACHE_TTL),
+            )
+        return _client_pool
+
+
+def opengpts_client(opengpts_user_id: str) -> OpenGPTsClient:
+    """OpenGPTs Client of a slack thread
+
+    Args:
+        opengpts_user_id (str): opengpts user id
+
+    Returns:
+        OpenGPTsClient: client sharing the pooled connections
+    """
+    return get_client_pool().client(
+        url=OPENGPTS_URL,
+        opengpts_user_id=opengpts_user_id,
+    )
+
+
+def warmup() -> dict[str, Any]:
+    """Prime DNS, TLS, pooled connections and local stores
+
+    Returns:
+        dict[str, Any]: OpenGPTs health and warmup latency
+    """
+    started_at = time.perf_counter()
+    get_thread_store()
+    get_event_store()
+    health = opengpts_client("warmup").health()
+    start = warmup_latency.since(started_at)
+    logger.info("warmup done (%s)", start)
+    return {"health": health, "start": start}
+
+
+def _warmup_in_background() -> None:
+    """Warm up without delaying the instance start"""
+    try:
+        warmup()
+    except Exception:
+        logger.exception("warmup failed")
+
+
+def set_thread_store(store: ThreadStore) -> None:
+    """Replace the thread mapping, e.g. with a managed store when deployed
+
+    Args:
+        store (ThreadStore): thread store
+    """
+    global _thread_store
+    with _thread_store_lock:
+        _thread_store = CachedThreadStore(
+            store,
+            max_entries=THREAD_CACHE_SIZE,
+        )
+
+
+def get_thread_store() -> ThreadStore:
+    """Slack thread → OpenGPTs thread mapping (created on first use)
+
+    Raises:
+        RuntimeError: deployed without a durable thread store
+
+    Returns:
+        ThreadStore: thread store
+    """
+    global _thread_store
+    with _thread_store_lock:
+        if _thread_store is None:
+            if DEPLOYED and THREAD_STORE_PATH is None:
+                raise RuntimeError(
+                    "set THREAD_STORE_PATH to a persistent volume or call "
+                    "set_thread_store: /tmp does not survive cold starts",
+                )
+            _thread_store = CachedThreadStore(
+                SQLiteThreadStore(THREAD_STORE_PATH or DEV_THREAD_STORE_PATH),
+                max_entries=THREAD_CACHE_SIZE,
+            )
+        return _thread_store
+
+
+def get_event_store() -> EventStore:
+    """Processed Slack event ids (created on first use)
+
+    Returns:
+        EventStore: event store
+    """
+    global _event_store
+    with _event_store_lock:
+        if _event_store is None:
+            _event_store = SQLiteEventStore(
+                EVENT_STORE_PATH,
+                purge_interval=EVENT_PURGE_INTERVAL,
+            )
+        return _event_store
+
+
+def get_or_create_thread_id(
+    client: OpenGPTsClient,
+    channel: str,
+    thread_ts: str,
+    name: str,
+) -> str:
+    """Get the OpenGPTs thread of a Slack thread, creating it if needed
+
+    Args:
+        client (OpenGPTsClient): OpenGPTs Client of the slack thread
+        channel (str): slack channel id
+        thread_ts (str): ts of the slack thread root message
+        name (str): thread name used on creation
+
+    Returns:
+        str: OpenGPTs thread id
+    """
+    store = get_thread_store()
+    thread_id = store.get(channel, thread_ts)
+    if thread_id is not None:
+        return thread_id
+
+    # slack threads started before the mapping existed own one thread
+    thread_list = client.get_thread_list()
+    if len(thread_list) > 0:
+        thread_id = thread_list[0].thread_id
+    else:
+        thread_id = create_thread(client, channel, thread_ts, name)
+    store.set(channel, thread_ts, thread_id)
+    return thread_id
+
+
+def create_thread(
+    client: OpenGPTsClient,
+    channel: str,
+    thread_ts: str,
+    name: str,
+) -> str:
+    """Create the OpenGPTs thread of a Slack thread
+
+    A slack thread answered from the answer cache has no OpenGPTs thread
+    yet; it is created on the first reply and seeded with the question
+    and the cached answer, so the reply continues that history.
+
+    Args:
+        client (OpenGPTsClient): OpenGPTs Client of the slack thread
+        channel (str): slack channel id
+        thread_ts (str): ts of the slack thread root message
+        name (str): thread name if the thread was not answered from cache
+
+    Returns:
+        str: OpenGPTs thread id
+    """
+    seed = answer_seeds.get(f"{channel}-{thread_ts}")
+    if seed is None:
+        return client.create_thread(
+            name=name,
+            assistant_id=OPENGPTS_BOT_ID,
+        ).thread_id
+
+    thread_id = client.create_thread(
+        name=seed["input"],
+        assistant_id=OPENGPTS_BOT_ID,
+    ).thread_id
+    question = Message(type="human", content=seed["input"])
+    answer = [Message.model_validate(m) for m in seed["messages"]]
+    client.add_messages(thread_id, [question, *answer])
+    answer_seeds.delete(f"{channel}-{thread_ts}")
+    return thread_id
 
 
 def remove_mention(message: str) -> str:
@@ -48,56 +310,312 @@ def remove_mention(message: str) -> str:
     return re.sub(r"^<.*>", "", message)
 
 
-@app.event("app_mention")
-def on_mention(event: dict[str, Any], say: Say) -> None:
-    """botメンション時のチャット
+def messages_since_last_human(messages: list[Message]) -> list[Message]:
+    """Messages produced by the latest run
 
     Args:
-        event (dict[str, Any]): event request https://api.slack.com/events/app_mention
-        say (Say): _description_
+        messages (list[Message]): thread messages
+
+    Returns:
+        list[Message]: messages after the last human message
     """
-    input_message: str = remove_mention(event["text"])
-    thread_ts: Optional[str] = event.get("thread_ts")
-    event_ts: str = event["ts"]
-    channel: str = event["channel"]
-    user_id: str = event["user"]
+    for idx in range(len(messages) - 1, -1, -1):
+        if messages[idx].type == "human":
+            return messages[idx + 1 :]
+    return messages
 
-    opengpts_user_id = f"{channel}-{thread_ts or event_ts}"
 
-    client = OpenGPTsClient(
-        url=OPENGPTS_URL,
-        opengpts_user_id=opengpts_user_id,
+class RunNotStartedError(Exception):
+    """Mentions failed before the OpenGPTs run was started"""
+
+
+def reply_to_mentions(mentions: list[Mention]) -> None:
+    """botメンション時のチャット (worker thread で実行)
+
+    Mentions of one slack thread that arrived together are answered by a
+    single run.
+
+    Args:
+        mentions (list[Mention]): mentions of one slack thread
+
+    Raises:
+        RunNotStartedError: failed before the run was started
+    """
+    first, say = mentions[0]
+    input_message = "\n".join(remove_mention(e["text"]) for e, _ in mentions)
+    thread_ts: Optional[str] = first.get("thread_ts")
+    event_ts: str = first["ts"]
+    channel: str = first["channel"]
+    user_ids = list(dict.fromkeys(e["user"] for e, _ in mentions))
+
+    reply = SlackStreamingReply(
+        say,
+        channel=channel,
+        thread_ts=thread_ts or event_ts,
+        user_ids=user_ids,
     )
 
-    if thread_ts is None:
-        thread = client.create_thread(
-            name=input_message,
-            assistant_id=OPENGPTS_BOT_ID,
+    # only questions starting a conversation do not depend on history
+    fingerprint = None
+    if ANSWER_CACHE_ENABLED and thread_ts is None and len(mentions) == 1:
+        fingerprint, cached = cached_answer(input_message)
+        if cached is not None:
+            reply.send(answer_text(cached), cached)
+            # no OpenGPTs thread until someone replies in the slack thread
+            answer_seeds.set(
+                f"{channel}-{event_ts}",
+                {
+                    "input": input_message,
+                    "messages": [m.model_dump(mode="json") for m in cached],
+                },
+                ANSWER_SEED_TTL,
+            )
+            return
+
+    try:
+        reply.start()
+    except Exception as e:
+        raise RunNotStartedError("failed to post the placeholder") from e
+
+    opengpts_user_id = f"{channel}-{thread_ts or event_ts}"
+
+    client = opengpts_client(opengpts_user_id)
+
+    try:
+        if thread_ts is None:
+            thread_id = client.create_thread(
+                name=input_message,
+                assistant_id=OPENGPTS_BOT_ID,
+            ).thread_id
+            get_thread_store().set(channel, event_ts, thread_id)
+        else:
+            thread_id = get_or_create_thread_id(
+                client,
+                channel=channel,
+                thread_ts=thread_ts,
+                name=input_message,
+            )
+    except Exception as e:
+        reply.update("エラーが発生しました。")
+        reply.finalize()
+        raise RunNotStartedError("failed to prepare the thread") from e
+
+    try:
+        result = stream_reply(client, thread_id, input_message, reply)
+    except Exception:
+        reply.update("エラーが発生しました。")
+        reply.finalize()
+        raise
+
+    answer = messages_since_last_human(result)
+    reply.finalize(messages=answer)
+    if fingerprint is not None and answer_text(answer) != "":
+        answer_cache.set(OPENGPTS_BOT_ID, fingerprint, input_message, answer)
+
+
+def answer_text(messages: list[Message]) -> str:
+    """Final answer of a run
+
+    Args:
+        messages (list[Message]): messages produced by the run
+
+    Returns:
+        str: content of the last ai message. Empty if there is none
+    """
+    for message in reversed(messages):
+        if message.type == "ai":
+            return str(message.content)
+    return ""
+
+
+def cached_answer(
+    input_message: str,
+) -> tuple[Optional[str], Optional[list[Message]]]:
+    """Look up the FAQ answer cache
+
+    The assistant is read as its owner through the client cache, so a hit
+    does not call the backend until ASSISTANT_CACHE_TTL has passed.
+
+    Args:
+        input_message (str): question
+
+    Returns:
+        tuple[Optional[str], Optional[list[Message]]]: \
+            assistant fingerprint (None if unavailable) and cached answer
+    """
+    if OPENGPTS_BOT_OWNER_ID is None:
+        return None, None
+    try:
+        assistant = opengpts_client(OPENGPTS_BOT_OWNER_ID).get_assistant(
+            OPENGPTS_BOT_ID,
         )
-    else:
-        thread = client.get_thread_list()[0]
+    except Exception:
+        logger.exception("failed to get assistant for the answer cache")
+        return None, None
+    fingerprint = assistant_fingerprint(assistant)
+    cached = answer_cache.get(OPENGPTS_BOT_ID, fingerprint, input_message)
+    if cached is not None:
+        logger.info("answer cache hit")
+    return fingerprint, cached
 
-    messages = client.run_and_get_messages(
-        assistant_id=OPENGPTS_BOT_ID,
-        thread_id=thread.thread_id,
-        messages=[Message(type="human", content=input_message)],
+
+def complete_mentions(mentions: list[Mention]) -> None:
+    """Remember events as processed
+
+    Args:
+        mentions (list[Mention]): mentions
+    """
+    store = get_event_store()
+    for event, _ in mentions:
+        if event.get("event_id") is not None:
+            store.complete(event["event_id"], EVENT_DONE_TTL)
+
+
+def release_mentions(mentions: list[Mention]) -> None:
+    """Drop the claims of events so that a redelivery is processed
+
+    Args:
+        mentions (list[Mention]): mentions
+    """
+    store = get_event_store()
+    for event, _ in mentions:
+        if event.get("event_id") is not None:
+            store.release(event["event_id"])
+
+
+def process_mentions(mentions: list[Mention]) -> None:
+    """Answer mentions and mark them processed
+
+    Mentions that failed before the run started are released instead,
+    since nothing was sent to OpenGPTs.
+
+    Args:
+        mentions (list[Mention]): mentions of one slack thread
+    """
+    started_at = time.perf_counter()
+    first, _ = mentions[0]
+    try:
+        # continue the trace of the request that received the mention
+        with tracer.span(
+            "slack.mentions",
+            attributes={
+                "channel": first["channel"],
+                "thread_ts": first.get("thread_ts") or first["ts"],
+                "mentions": len(mentions),
+            },
+            parent=extract(first),
+        ):
+            reply_to_mentions(mentions)
+        run_latency.since(started_at)
+    except RunNotStartedError:
+        release_mentions(mentions)
+        raise
+    except Exception:
+        # a failed run already replied with an error, do not rerun it
+        complete_mentions(mentions)
+        raise
+    complete_mentions(mentions)
+
+
+def reject_mentions(mentions: list[Mention]) -> None:
+    """Tell users that the bot is busy
+
+    The events are released, so a redelivery by Slack is processed.
+
+    Args:
+        mentions (list[Mention]): mentions dropped by the full queue
+    """
+    event, say = mentions[-1]
+    users = " ".join(
+        f"<@{user}>" for user in dict.fromkeys(e["user"] for e, _ in mentions)
     )
-    response_text = messages[-1].content
+    logger.warning("mention queue is full: %s", event["channel"])
+    try:
+        say(
+            thread_ts=event.get("thread_ts") or event["ts"],
+            channel=event["channel"],
+            text=f"{users} 混み合っています。しばらくしてから再度お試しください。",
+        )
+    finally:
+        release_mentions(mentions)
 
-    say(
-        thread_ts=thread_ts or event_ts,
-        channel=channel,
-        mrkdwn=True,
-        unfurl_links=True,
-        blocks=[
-            SectionBlock(
-                text=MarkdownTextObject(
-                    text=f"<@{user_id}>\n {response_text}",
-                ),
-            ),
-            DividerBlock(),
-        ],
+
+scheduler: ConversationScheduler[Mention] = ConversationScheduler(
+    dispatcher,
+    run=process_mentions,
+    reject=reject_mentions,
+)
+
+
+def stream_reply(
+    client: OpenGPTsClient,
+    thread_id: str,
+    input_message: str,
+    reply: SlackStreamingReply,
+) -> list[Message]:
+    """Run the bot and update the reply while it streams
+
+    Args:
+        client (OpenGPTsClient): OpenGPTs Client
+        thread_id (str): OpenGPTs thread id
+        input_message (str): user message
+        reply (SlackStreamingReply): reply to update
+
+    Returns:
+        list[Message]: thread messages after the run
+    """
+    # only the newest event matters: each one carries the whole thread
+    result: list[Message] = []
+    message = Message(type="human", content=input_message)
+    with client.run_stream(
+        assistant_id=OPENGPTS_BOT_ID,
+        thread_id=thread_id,
+        messages=[message],
+        prefetch="latest",
+    ) as response:
+        for messages in response:
+            result = messages
+            if len(messages) > 0 and messages[-1].type == "ai":
+                reply.update(str(messages[-1].content))
+    return result
+
+
+@app.event("app_mention")
+def on_mention(
+    event: dict[str, Any],
+    body: dict[str, Any],
+    say: Say,
+) -> None:
+    """botメンションを worker に渡してすぐに ack する
+
+    Args:
+        event (dict[str, Any]): event request https://api.slack.com/events/app_mention
+        body (dict[str, Any]): event callback
+        say (Say): _description_
+    """
+    event_id: Optional[str] = body.get("event_id")
+    if event_id is not None and not get_event_store().begin(
+        event_id,
+        EVENT_IN_FLIGHT_TTL,
+    ):
+        logger.info("duplicate slack event: %s", event_id)
+        return
+
+    span = current_span()
+    mention = (
+        {
+            **event,
+            "event_id": event_id,
+            "traceparent": None if span is None else span.context.traceparent,
+        },
+        say,
+    )
+    conversation = (
+        f"{event['channel']}-{event.get('thread_ts') or event['ts']}"
     )
+    workspace = body.get("team_id") or event.get("team", "")
+    if not scheduler.submit(conversation, workspace, mention):
+        reject_mentions([mention])
 
 
 @functions_framework.http
@@ -110,6 +628,44 @@ def slack_bot(request: Request) -> Response:
     Returns:
         SlackRequestHandler への接続
     """
+    started_at = time.perf_counter()
+    try:
+        with tracer.span(
+            "slack.request",
+            attributes={
+                "http.method": request.method,
+                "http.path": request.path,
+                "slack.retry_num": request.headers.get("x-slack-retry-num"),
+            },
+            parent=extract(request.headers),
+        ) as span:
+            response = handle_request(request)
+            span.set_attribute("http.status_code", response.status_code)
+            return response
+    finally:
+        elapsed = time.perf_counter() - started_at
+        start = invocation_latency.record(elapsed)
+        logger.info("invocation took %.3fs (%s)", elapsed, start)
+
+
+def handle_request(request: Request) -> Response:
+    """Slack のイベントリクエストを処理する
+
+    Args:
+        request: Slack のイベントリクエスト
+
+    Returns:
+        SlackRequestHandler への接続
+    """
+    if request.method == "GET" and request.path.endswith("/metrics"):
+        if not is_admin(request):
+            return json_response({"error": "forbidden"}, status=403)
+        return json_response(metrics())
+    if request.method == "GET" and request.path.endswith("/warmup"):
+        if not is_admin(request):
+            return json_response({"error": "forbidden"}, status=403)
+        return json_response(warmup())
+
     header = request.headers
     body = request.get_json()
 
@@ -121,14 +677,76 @@ def slack_bot(request: Request) -> Response:
             status=200,
             headers={"Content-Type": "application/json"},
         )
-    # ignore slack retry request
+    # slack retries are handled like first deliveries: duplicates are
+    # dropped by event_id in on_mention
     # https://api.slack.com/apis/connections/events-api#retries
-    elif header.get("x-slack-retry-num"):
-        logger.info("slack retry received")
-        return Response(
-            response=json.dumps({"message": "No need to resend"}),
-            status=200,
+    if header.get("x-slack-retry-num"):
+        logger.info(
+            "slack retry received: %s",
+            header.get("x-slack-retry-reason"),
         )
     # request to slack
     logger.info("exec slack bot")
     return handler.handle(request)
+
+
+def is_admin(request: Request) -> bool:
+    """Whether a request carries the shared secret of operational endpoints
+
+    Args:
+        request (Request): request
+
+    Returns:
+        bool: authorized or not. Always False if ADMIN_TOKEN is not set
+    """
+    token = request.headers.get(ADMIN_HEADER, "")
+    return ADMIN_TOKEN is not None and hmac.compare_digest(
+        token.encode("utf-8"),
+        ADMIN_TOKEN.encode("utf-8"),
+    )
+
+
+def json_response(body: dict[str, Any], status: int = 200) -> Response:
+    """JSON response
+
+    Args:
+        body (dict[str, Any]): body
+        status (int, optional): status code. Defaults to 200.
+
+    Returns:
+        Response: response
+    """
+    return Response(
+        response=json.dumps(body),
+        status=status,
+        headers={"Content-Type": "application/json"},
+    )
+
+
+def metrics() -> dict[str, Any]:
+    """Metrics of the instance
+
+    Returns:
+        dict[str, Any]: scheduling and latency metrics
+    """
+    return {
+        "scheduler": scheduler.metrics(),
+        "init_ms": init_ms,
+        "latency": {
+            "invocation": invocation_latency.metrics(),
+            "run": run_latency.metrics(),
+            "warmup": warmup_latency.metrics(),
+        },
+        "backends": get_client_pool().metrics(),
+    }
+
+
+init_ms = round((time.perf_counter() - _init_started_at) * 1000, 3)
+"""module initialization time (includes the slack auth.test of App)"""
+
+if WARMUP_ON_START:
+    threading.Thread(
+        target=_warmup_in_background,
+        name="opengpts-warmup",
+        daemon=True,
+    ).start()
@@ -0,0 +1,284 @@
+"""streamed Slack replies"""
+
+import time
+from logging import getLogger
+from typing import Any, Optional
+
+from opengpts_client.schema import Message
+from opengpts_client.tracing import get_tracer
+from slack_bolt.context.say import Say
+from slack_sdk.errors import SlackApiError
+from slack_sdk.models.blocks import (
+    Block,
+    ContextBlock,
+    DividerBlock,
+    MarkdownTextObject,
+    SectionBlock,
+)
+
+from app.constants import SLACK_FINALIZE_TIMEOUT, SLACK_UPDATE_INTERVAL
+
+logger = getLogger(__name__)
+
+PLACEHOLDER_TEXT = "考え中です… :hourglass_flowing_sand:"
+CURSOR = "▌"
+SECTION_TEXT_LIMIT = 3000
+MAX_SECTIONS = 40
+MAX_CONTEXT_ELEMENTS = 10
+
+
+def source_names(message: Message) -> list[str]:
+    """Sources of a tool / function result
+
+    Args:
+        message (Message): tool or function message
+
+    Returns:
+        list[str]: source names
+    """
+    if isinstance(message.content, list):
+        return [
+            (
+                content.metadata.get("source") or content.page_content[:15]
+            ).replace("\n", " ")
+            for content in message.content
+        ]
+    return [str(message.content)[:25].replace("\n", " ")]
+
+
+def sources_block(messages: list[Message]) -> Optional[ContextBlock]:
+    """Context block listing tool and retrieval sources
+
+    Args:
+        messages (list[Message]): messages produced by the run
+
+    Returns:
+        Optional[ContextBlock]: block. None if no tool was called
+    """
+    elements = []
+    for message in messages:
+        if message.type not in ("function", "tool"):
+            continue
+        name = message.name or (
+            message.additional_kwargs.name
+            if message.additional_kwargs is not None
+            else None
+        )
+        sources = ", ".join(dict.fromkeys(source_names(message)))
+        elements.append(
+            MarkdownTextObject(text=f"🔧 *{name}*: {sources}"[:2000]),
+        )
+    if len(elements) == 0:
+        return None
+    return ContextBlock(elements=elements[:MAX_CONTEXT_ELEMENTS])
+
+
+class SlackStreamingReply:
+    """Slack reply updated in place while a run streams
+
+    A placeholder is posted first, then `chat.update` is called at most
+    once per `interval` seconds with the latest answer. A rate-limited
+    update postpones the next one by `Retry-After`. `finalize` always
+    sends the complete answer with the tool and retrieval sources: it
+    retries the update for `finalize_timeout` seconds, then posts the
+    answer as a new message.
+    """
+
+    def __init__(
+        self,
+        say: Say,
+        channel: str,
+        thread_ts: str,
+        user_ids: list[str],
+        interval: float = SLACK_UPDATE_INTERVAL,
+        finalize_timeout: float = SLACK_FINALIZE_TIMEOUT,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            say (Say): say of the event
+            channel (str): slack channel id
+            thread_ts (str): ts of the slack thread root message
+            user_ids (list[str]): slack user ids to mention
+            interval (float, optional): min seconds between updates. \
+                Defaults to SLACK_UPDATE_INTERVAL.
+            finalize_timeout (float, optional): seconds the final update \
+                is retried. Defaults to SLACK_FINALIZE_TIMEOUT.
+
+        Raises:
+            ValueError: say is not bound to a client
+        """
+        if say.client is None:
+            raise ValueError("say has no slack client")
+        self.say = say
+        self.client = say.client
+        self.channel = channel
+        self.thread_ts = thread_ts
+        self.user_ids = user_ids
+        self.interval = interval
+        self.finalize_timeout = finalize_timeout
+        self.text = ""
+        self.updates = 0
+        self.ts = ""
+        self._sent_text = ""
+        self._next_update_at = 0.0
+
+    def start(self) -> None:
+        """Post the placeholder"""
+        with get_tracer().span("slack.chat.postMessage"):
+            response = self.say(
+                thread_ts=self.thread_ts,
+                channel=self.channel,
+                text=PLACEHOLDER_TEXT,
+                blocks=self._blocks(PLACEHOLDER_TEXT),
+            )
+        self.ts = response["ts"]
+        self.channel = response["channel"]
+        self._next_update_at = time.monotonic() + self.interval
+
+    def update(self, text: str) -> None:
+        """Set the latest answer and update the message if one is due
+
+        Args:
+            text (str): whole answer so far
+        """
+        self.text = text
+        if text == self._sent_text or time.monotonic() < self._next_update_at:
+            return
+        self._send(self._blocks(text + CURSOR), text)
+
+    def finalize(self, messages: Optional[list[Message]] = None) -> None:
+        """Send the complete answer with sources
+
+        Args:
+            messages (Optional[list[Message]], optional): \
+                messages produced by the run. Defaults to None.
+        """
+        blocks = self._final_blocks(messages or [])
+        deadline = time.monotonic() + self.finalize_timeout
+        while not self._send(blocks, self.text):
+            if self._next_update_at > deadline:
+                logger.error(
+                    "chat.update rate limited for %ss, posting the answer: %s",
+                    self.finalize_timeout,
+                    self.ts,
+                )
+                self._post(blocks)
+                return
+            time.sleep(max(0.0, self._next_update_at - time.monotonic()))
+
+    def send(self, text: str, messages: list[Message]) -> None:
+        """Post a complete answer at once instead of streaming it
+
+        Args:
+            text (str): answer
+            messages (list[Message]): messages of the answer
+        """
+        self.text = text
+        with get_tracer().span("slack.chat.postMessage"):
+            response = self.say(
+                thread_ts=self.thread_ts,
+                channel=self.channel,
+                text=text[:SECTION_TEXT_LIMIT],
+                blocks=self._final_blocks(messages),
+            )
+        self.ts = response["ts"]
+
+    def _post(self, blocks: list[Block]) -> None:
+        """Post the answer as a new message when it cannot be updated
+
+        Args:
+            blocks (list[Block]): blocks
+        """
+        with get_tracer().span("slack.chat.postMessage"):
+            response = self.say(
+                thread_ts=self.thread_ts,
+                channel=self.channel,
+                text=self.text[:SECTION_TEXT_LIMIT] or "(no answer)",
+                blocks=blocks,
+            )
+        self.ts = response["ts"]
+
+    def _final_blocks(self, messages: list[Message]) -> list[Block]:
+        """Blocks of the complete answer with sources
+
+        Args:
+            messages (list[Message]): messages produced by the run
+
+        Returns:
+            list[Block]: blocks
+        """
+        blocks = self._blocks(self.text or "(no answer)")
+        block = sources_block(messages)
+        if block is not None:
+            blocks.insert(-1, block)
+        return blocks
+
+    def _blocks(self, text: str) -> list[Block]:
+        """Message blocks
+
+        Args:
+            text (str): answer
+
+        Returns:
+            list[Block]: blocks
+        """
+        mentions = " ".join(f"<@{user_id}>" for user_id in self.user_ids)
+        text = f"{mentions}\n {text}"
+        chunks = [
+            text[i : i + SECTION_TEXT_LIMIT]
+            for i in range(0, len(text), SECTION_TEXT_LIMIT)
+        ][:MAX_SECTIONS]
+        blocks: list[Block] = [
+            SectionBlock(text=MarkdownTextObject(text=chunk))
+            for chunk in chunks
+        ]
+        blocks.append(DividerBlock())
+        return blocks
+
+    def _send(self, blocks: list[Block], text: str) -> bool:
+        """Update the message
+
+        Args:
+            blocks (list[Block]): blocks
+            text (str): fallback text
+
+        Returns:
+            bool: updated or not
+        """
+        try:
+            with get_tracer().span(
+                "slack.chat.update",
+                attributes={"chars": len(text), "updates": self.updates},
+            ):
+                self.client.chat_update(
+                    channel=self.channel,
+                    ts=self.ts,
+                    text=text[:SECTION_TEXT_LIMIT] or PLACEHOLDER_TEXT,
+                    blocks=blocks,
+                )
+        except SlackApiError as e:
+            retry_after = _retry_after(e.response)
+            if retry_after is None:
+                raise
+            logger.warning("chat.update rate limited: %ss", retry_after)
+            self._next_update_at = time.monotonic() + retry_after
+            return False
+        self.updates += 1
+        self._sent_text = text
+        self._next_update_at = time.monotonic() + self.interval
+        return True
+
+
+def _retry_after(response: Any) -> Optional[float]:
+    """Retry-After of a rate limited response
+
+    Args:
+        response (Any): slack response
+
+    Returns:
+        Optional[float]: seconds. None if not rate limited
+    """
+    if response.status_code != 429:
+        return None
+    return float(response.headers.get("Retry-After", 1))
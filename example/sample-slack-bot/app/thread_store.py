@@ -0,0 +1,180 @@
+"""Slack thread → OpenGPTs thread mapping"""
+
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional, Union
+
+DEFAULT_MAX_ENTRIES = 10000
+SQLITE_TIMEOUT = 5.0
+
+
+class ThreadStore(ABC):
+    """Store of OpenGPTs thread ids keyed by Slack (channel, thread_ts)
+
+    Implement this interface to back the mapping with a managed store
+    (e.g. Firestore) when the local disk does not survive cold starts.
+    """
+
+    @abstractmethod
+    def get(self, channel: str, thread_ts: str) -> Optional[str]:
+        """Get the OpenGPTs thread id of a Slack thread
+
+        Args:
+            channel (str): slack channel id
+            thread_ts (str): ts of the slack thread root message
+
+        Returns:
+            Optional[str]: OpenGPTs thread id. None if not mapped
+        """
+
+    @abstractmethod
+    def set(self, channel: str, thread_ts: str, thread_id: str) -> None:
+        """Map a Slack thread to an OpenGPTs thread
+
+        Args:
+            channel (str): slack channel id
+            thread_ts (str): ts of the slack thread root message
+            thread_id (str): OpenGPTs thread id
+        """
+
+
+class SQLiteThreadStore(ThreadStore):
+    """Thread mapping in a SQLite file
+
+    Durable only on a persistent disk. The instance disk of Cloud
+    Functions / Cloud Run is memory and is not shared by instances.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Union[str, Path]): database file
+        """
+        self.path = str(path)
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS slack_threads ("
+                "channel TEXT NOT NULL, thread_ts TEXT NOT NULL, "
+                "thread_id TEXT NOT NULL, PRIMARY KEY (channel, thread_ts))",
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the current thread
+
+        Returns:
+            sqlite3.Connection: connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+            self._local.conn = conn
+        return conn
+
+    def get(self, channel: str, thread_ts: str) -> Optional[str]:
+        """Get the OpenGPTs thread id of a Slack thread
+
+        Args:
+            channel (str): slack channel id
+            thread_ts (str): ts of the slack thread root message
+
+        Returns:
+            Optional[str]: OpenGPTs thread id. None if not mapped
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT thread_id FROM slack_threads "
+                "WHERE channel = ? AND thread_ts = ?",
+                (channel, thread_ts),
+            )
+            .fetchone()
+        )
+        return None if row is None else row[0]
+
+    def set(self, channel: str, thread_ts: str, thread_id: str) -> None:
+        """Map a Slack thread to an OpenGPTs thread
+
+        Args:
+            channel (str): slack channel id
+            thread_ts (str): ts of the slack thread root message
+            thread_id (str): OpenGPTs thread id
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO slack_threads "
+                "(channel, thread_ts, thread_id) VALUES (?, ?, ?)",
+                (channel, thread_ts, thread_id),
+            )
+
+
+class CachedThreadStore(ThreadStore):
+    """In-process LRU in front of a durable thread store"""
+
+    def __init__(
+        self,
+        backend: ThreadStore,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            backend (ThreadStore): durable store
+            max_entries (int, optional): \
+                max cached mappings. Defaults to DEFAULT_MAX_ENTRIES.
+        """
+        self.backend = backend
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], str] = OrderedDict()
+
+    def get(self, channel: str, thread_ts: str) -> Optional[str]:
+        """Get the OpenGPTs thread id of a Slack thread
+
+        Args:
+            channel (str): slack channel id
+            thread_ts (str): ts of the slack thread root message
+
+        Returns:
+            Optional[str]: OpenGPTs thread id. None if not mapped
+        """
+        key = (channel, thread_ts)
+        with self._lock:
+            thread_id = self._entries.get(key)
+            if thread_id is not None:
+                self._entries.move_to_end(key)
+                return thread_id
+
+        thread_id = self.backend.get(channel, thread_ts)
+        if thread_id is not None:
+            self._remember(key, thread_id)
+        return thread_id
+
+    def set(self, channel: str, thread_ts: str, thread_id: str) -> None:
+        """Map a Slack thread to an OpenGPTs thread
+
+        Args:
+            channel (str): slack channel id
+            thread_ts (str): ts of the slack thread root message
+            thread_id (str): OpenGPTs thread id
+        """
+        self.backend.set(channel, thread_ts, thread_id)
+        self._remember((channel, thread_ts), thread_id)
+
+    def _remember(self, key: tuple[str, str], thread_id: str) -> None:
+        """Put a mapping into the LRU
+
+        Args:
+            key (tuple[str, str]): (channel, thread_ts)
+            thread_id (str): OpenGPTs thread id
+        """
+        with self._lock:
+            self._entries[key] = thread_id
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,338 @@
+"""Load balancer across OpenGPTs backends"""
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from logging import getLogger
+from typing import Any, Iterator, Optional
+
+import requests
+
+from opengpts_client.session import create_session
+
+logger = getLogger(__name__)
+
+DEFAULT_HEALTH_INTERVAL = 10.0
+DEFAULT_MAX_FAILURES = 3
+DEFAULT_EJECT_COOLDOWN = 30.0
+DEFAULT_AFFINITY_SIZE = 10000
+HEALTH_TIMEOUT = 3
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class Backend:
+    """OpenGPTs backend state"""
+
+    def __init__(self, url: str) -> None:
+        """コンストラクタ
+
+        Args:
+            url (str): backend url
+        """
+        self.url = url
+        self.healthy = True
+        self.outstanding = 0
+        self.selected = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ejected_at: Optional[float] = None
+        self.latency_ewma: Optional[float] = None
+
+    def metrics(self) -> dict[str, Any]:
+        """Backend metrics
+
+        Returns:
+            dict[str, Any]: metrics
+        """
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "selected": self.selected,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency_ewma_ms": (
+                None
+                if self.latency_ewma is None
+                else round(self.latency_ewma * 1000, 3)
+            ),
+        }
+
+
+class BackendLease:
+    """A request in flight on a backend"""
+
+    def __init__(self, url: str) -> None:
+        """コンストラクタ
+
+        Args:
+            url (str): backend url
+        """
+        self.url = url
+        self.failed = False
+
+    def record_status(self, status_code: int) -> None:
+        """Treat 5xx responses as backend failures
+
+        Args:
+            status_code (int): response status code
+        """
+        self.failed = status_code >= 500
+
+
+class NoHealthyBackendError(Exception):
+    """All backends are ejected"""
+
+
+class LoadBalancer:
+    """Least-outstanding-requests balancer with health-aware ejection
+
+    A backend is ejected after `max_failures` consecutive failures
+    (connection errors or 5xx) or a failed `/health` probe, and comes back
+    once a probe succeeds. Without health probing an ejected backend is
+    re-admitted on trial after `eject_cooldown` seconds; one more failure
+    ejects it again. Runs of a thread can be pinned to one backend.
+    """
+
+    def __init__(
+        self,
+        urls: list[str],
+        health_interval: float = DEFAULT_HEALTH_INTERVAL,
+        max_failures: int = DEFAULT_MAX_FAILURES,
+        affinity_size: int = DEFAULT_AFFINITY_SIZE,
+        session: Optional[requests.Session] = None,
+        eject_cooldown: float = DEFAULT_EJECT_COOLDOWN,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            urls (list[str]): backend urls
+            health_interval (float, optional): health probe interval \
+                in seconds. 0 disables probing. \
+                Defaults to DEFAULT_HEALTH_INTERVAL.
+            max_failures (int, optional): consecutive failures before \
+                ejection. Defaults to DEFAULT_MAX_FAILURES.
+            affinity_size (int, optional): max pinned threads. \
+                Defaults to DEFAULT_AFFINITY_SIZE.
+            session (Optional[requests.Session], optional): \
+                session used for health probes. Defaults to None.
+            eject_cooldown (float, optional): seconds before an ejected \
+                backend is retried when probing is disabled. \
+                Defaults to DEFAULT_EJECT_COOLDOWN.
+        """
+        if len(urls) == 0:
+            raise ValueError("at least one backend url is required")
+
+        self.backends = [Backend(url) for url in urls]
+        self.health_interval = health_interval
+        self.max_failures = max_failures
+        self.affinity_size = affinity_size
+        self.eject_cooldown = eject_cooldown
+        self._session = session or create_session()
+        self._lock = threading.Lock()
+        self._affinity: OrderedDict[str, Backend] = OrderedDict()
+        self._stop = threading.Event()
+        self._health_thread: Optional[threading.Thread] = None
+
+        if health_interval > 0:
+            self._health_thread = threading.Thread(
+                target=self._health_loop,
+                name="opengpts-health-check",
+                daemon=True,
+            )
+            self._health_thread.start()
+
+    def select(self, thread_id: Optional[str] = None) -> Backend:
+        """Select a backend
+
+        Args:
+            thread_id (Optional[str], optional): \
+                pin the thread to the selected backend. Defaults to None.
+
+        Raises:
+            NoHealthyBackendError: no backend is available
+
+        Returns:
+            Backend: backend
+        """
+        with self._lock:
+            return self._select(thread_id)
+
+    def _select(self, thread_id: Optional[str]) -> Backend:
+        """Select a backend (lock held)
+
+        Args:
+            thread_id (Optional[str]): thread id to pin
+
+        Raises:
+            NoHealthyBackendError: no backend is available
+
+        Returns:
+            Backend: backend
+        """
+        if thread_id is not None:
+            pinned = self._affinity.get(thread_id)
+            if pinned is not None and pinned.healthy:
+                self._affinity.move_to_end(thread_id)
+                pinned.selected += 1
+                return pinned
+
+        if self._health_thread is None:
+            self._readmit()
+        candidates = [b for b in self.backends if b.healthy]
+        if len(candidates) == 0:
+            raise NoHealthyBackendError("no healthy OpenGPTs backend")
+        # ties are broken by selection count, i.e. round robin when idle
+        backend = min(candidates, key=lambda b: (b.outstanding, b.selected))
+        backend.selected += 1
+
+        if thread_id is not None:
+            self._affinity[thread_id] = backend
+            self._affinity.move_to_end(thread_id)
+            while len(self._affinity) > self.affinity_size:
+                self._affinity.popitem(last=False)
+        return backend
+
+    def _readmit(self) -> None:
+        """Re-admit backends whose ejection cooled down (lock held)
+
+        A re-admitted backend is one failure away from ejection, so a
+        backend that is still down costs at most one request per cooldown.
+        """
+        now = time.monotonic()
+        for backend in self.backends:
+            if (
+                backend.healthy
+                or backend.ejected_at is None
+                or now - backend.ejected_at < self.eject_cooldown
+            ):
+                continue
+            logger.info("retry OpenGPTs backend: %s", backend.url)
+            backend.healthy = True
+            backend.ejected_at = None
+            backend.consecutive_failures = self.max_failures - 1
+
+    @contextmanager
+    def acquire(
+        self,
+        thread_id: Optional[str] = None,
+    ) -> Iterator[BackendLease]:
+        """Select a backend and track the request lifetime
+
+        Args:
+            thread_id (Optional[str], optional): \
+                pin the thread to the selected backend. Defaults to None.
+
+        Yields:
+            Iterator[BackendLease]: lease of the selected backend
+        """
+        with self._lock:
+            backend = self._select(thread_id)
+            backend.outstanding += 1
+        lease = BackendLease(backend.url)
+        started_at = time.perf_counter()
+        try:
+            yield lease
+        except (requests.ConnectionError, requests.Timeout):
+            lease.failed = True
+            raise
+        finally:
+            self._record(
+                backend,
+                time.perf_counter() - started_at,
+                lease.failed,
+            )
+
+    def _record(self, backend: Backend, elapsed: float, failed: bool) -> None:
+        """Record request result
+
+        Args:
+            backend (Backend): backend
+            elapsed (float): elapsed seconds
+            failed (bool): request failed or not
+        """
+        with self._lock:
+            backend.outstanding -= 1
+            backend.requests += 1
+            if backend.latency_ewma is None:
+                backend.latency_ewma = elapsed
+            else:
+                backend.latency_ewma += LATENCY_EWMA_ALPHA * (
+                    elapsed - backend.latency_ewma
+                )
+            if failed:
+                self._fail(backend)
+            else:
+                backend.consecutive_failures = 0
+
+    def _fail(self, backend: Backend) -> None:
+        """Count a failure and eject the backend if needed (lock held)
+
+        Args:
+            backend (Backend): backend
+        """
+        backend.failures += 1
+        backend.consecutive_failures += 1
+        if backend.healthy and backend.consecutive_failures >= (
+            self.max_failures
+        ):
+            logger.warning("eject OpenGPTs backend: %s", backend.url)
+            backend.healthy = False
+            backend.ejected_at = time.monotonic()
+
+    def probe(self) -> None:
+        """Probe `/health` of every backend once"""
+        for backend in self.backends:
+            try:
+                response = self._session.get(
+                    f"{backend.url}/health",
+                    timeout=HEALTH_TIMEOUT,
+                )
+                ok = response.ok
+            except requests.RequestException:
+                ok = False
+
+            with self._lock:
+                if ok:
+                    if not backend.healthy:
+                        logger.info(
+                            "restore OpenGPTs backend: %s",
+                            backend.url,
+                        )
+                    backend.healthy = True
+                    backend.ejected_at = None
+                    backend.consecutive_failures = 0
+                else:
+                    backend.consecutive_failures = self.max_failures
+                    if backend.healthy:
+                        logger.warning(
+                            "eject OpenGPTs backend: %s",
+                            backend.url,
+                        )
+                        backend.ejected_at = time.monotonic()
+                    backend.healthy = False
+
+    def _health_loop(self) -> None:
+        """Health check loop"""
+        while not self._stop.wait(self.health_interval):
+            self.probe()
+
+    def metrics(self) -> dict[str, Any]:
+        """Balancing metrics
+
+        Returns:
+            dict[str, Any]: per-backend metrics and pinned thread count
+        """
+        with self._lock:
+            return {
+                "backends": [b.metrics() for b in self.backends],
+                "pinned_threads": len(self._affinity),
+            }
+
+    def close(self) -> None:
+        """Stop health probing"""
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join(timeout=HEALTH_TIMEOUT)
@@ -0,0 +1,478 @@
+"""Client response cache"""
+
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional, Protocol, Union
+
+import orjson
+from pydantic import BaseModel, Field
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_STATS_FLUSH_INTERVAL = 1.0
+DEFAULT_REDIS_PREFIX = "opengpts:"
+SQLITE_TIMEOUT = 5.0
+SQLITE_EVICT_INTERVAL = 100
+
+
+class CacheTTL(BaseModel):
+    """Cache TTL in seconds per resource"""
+
+    assistants: float = Field(300, title="assistant list / assistant")
+    threads: float = Field(30, title="thread list")
+    messages: float = Field(300, title="thread messages")
+
+
+class CacheBackend(ABC):
+    """Cache backend storing JSON-compatible values"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Any]:
+        """Get a value
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            Optional[Any]: value. None if missing or expired
+        """
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Set a value
+
+        Args:
+            key (str): cache key
+            value (Any): JSON-compatible value
+            ttl (float): time to live in seconds
+        """
+
+    @abstractmethod
+    def delete(self, *keys: str) -> None:
+        """Delete values
+
+        Args:
+            *keys (str): cache keys
+        """
+
+    @abstractmethod
+    def stats(self) -> dict[str, Any]:
+        """Cache statistics
+
+        Returns:
+            dict[str, Any]: hits, misses and size
+        """
+
+
+class MemoryCache(CacheBackend):
+    """Thread-safe in-process TTL cache with LRU eviction"""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES) -> None:
+        """コンストラクタ
+
+        Args:
+            max_entries (int, optional): \
+                max entries. Defaults to DEFAULT_MAX_ENTRIES.
+        """
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a value
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            Optional[Any]: value. None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Set a value
+
+        Args:
+            key (str): cache key
+            value (Any): JSON-compatible value
+            ttl (float): time to live in seconds
+        """
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys: str) -> None:
+        """Delete values
+
+        Args:
+            *keys (str): cache keys
+        """
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def stats(self) -> dict[str, Any]:
+        """Cache statistics
+
+        Returns:
+            dict[str, Any]: hits, misses and size
+        """
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._entries),
+            }
+
+
+class _SharedStats:
+    """Hit / miss counters flushed to a shared store in batches
+
+    Counting every lookup in the shared store would turn each cache hit
+    into a write, so counts are kept locally and flushed periodically.
+    """
+
+    def __init__(self, flush_interval: float) -> None:
+        """コンストラクタ
+
+        Args:
+            flush_interval (float): seconds between flushes
+        """
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._flushed_at = time.monotonic()
+
+    def count(self, hit: bool) -> Optional[tuple[int, int]]:
+        """Count a lookup
+
+        Args:
+            hit (bool): cache hit or not
+
+        Returns:
+            Optional[tuple[int, int]]: (hits, misses) to flush, if due
+        """
+        with self._lock:
+            if hit:
+                self._hits += 1
+            else:
+                self._misses += 1
+            if time.monotonic() - self._flushed_at < self.flush_interval:
+                return None
+            return self._take()
+
+    def take(self) -> tuple[int, int]:
+        """Take the pending counts
+
+        Returns:
+            tuple[int, int]: (hits, misses)
+        """
+        with self._lock:
+            return self._take()
+
+    def _take(self) -> tuple[int, int]:
+        """Take the pending counts (lock held)
+
+        Returns:
+            tuple[int, int]: (hits, misses)
+        """
+        counts = (self._hits, self._misses)
+        self._hits = self._misses = 0
+        self._flushed_at = time.monotonic()
+        return counts
+
+
+class SQLiteCache(CacheBackend):
+    """TTL cache in a local SQLite file shared by processes on one host
+
+    Every Streamlit worker process pointing at the same file sees the
+    entries and hit / miss counts of the others. The database runs in WAL
+    mode so readers do not block the writer. Entries closest to expiry are
+    evicted first when `max_entries` is exceeded.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        stats_flush_interval: float = DEFAULT_STATS_FLUSH_INTERVAL,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Union[str, Path]): database file
+            max_entries (int, optional): \
+                max entries. Defaults to DEFAULT_MAX_ENTRIES.
+            stats_flush_interval (float, optional): \
+                seconds between hit / miss count flushes. \
+                Defaults to DEFAULT_STATS_FLUSH_INTERVAL.
+        """
+        self.path = str(path)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._stats = _SharedStats(stats_flush_interval)
+        self._sets = 0
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "key TEXT PRIMARY KEY, value BLOB NOT NULL, "
+                "expires_at REAL NOT NULL)",
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS cache_entries_expires_at "
+                "ON cache_entries (expires_at)",
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_stats ("
+                "name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the current thread
+
+        Returns:
+            sqlite3.Connection: connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a value
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            Optional[Any]: value. None if missing or expired
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT value FROM cache_entries "
+                "WHERE key = ? AND expires_at > ?",
+                (key, time.time()),
+            )
+            .fetchone()
+        )
+        counts = self._stats.count(row is not None)
+        if counts is not None:
+            self._flush_stats(*counts)
+        return None if row is None else orjson.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Set a value
+
+        Args:
+            key (str): cache key
+            value (Any): JSON-compatible value
+            ttl (float): time to live in seconds
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(key, value, expires_at) VALUES (?, ?, ?)",
+                (key, orjson.dumps(value), time.time() + ttl),
+            )
+            self._sets += 1
+            if self._sets % SQLITE_EVICT_INTERVAL == 0:
+                self._evict(conn)
+
+    def _evict(self, conn: sqlite3.Connection) -> None:
+        """Drop expired entries and entries over `max_entries`
+
+        Args:
+            conn (sqlite3.Connection): connection in a transaction
+        """
+        conn.execute(
+            "DELETE FROM cache_entries WHERE expires_at <= ?",
+            (time.time(),),
+        )
+        conn.execute(
+            "DELETE FROM cache_entries WHERE key IN ("
+            "SELECT key FROM cache_entries ORDER BY expires_at LIMIT max("
+            "0, (SELECT COUNT(*) FROM cache_entries) - ?))",
+            (self.max_entries,),
+        )
+
+    def delete(self, *keys: str) -> None:
+        """Delete values
+
+        Args:
+            *keys (str): cache keys
+        """
+        with self._connection() as conn:
+            conn.executemany(
+                "DELETE FROM cache_entries WHERE key = ?",
+                [(key,) for key in keys],
+            )
+
+    def _flush_stats(self, hits: int, misses: int) -> None:
+        """Add counts to the shared statistics
+
+        Args:
+            hits (int): hits
+            misses (int): misses
+        """
+        with self._connection() as conn:
+            conn.executemany(
+                "INSERT INTO cache_stats (name, value) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET value = value + excluded.value",
+                [("hits", hits), ("misses", misses)],
+            )
+
+    def stats(self) -> dict[str, Any]:
+        """Cache statistics of all processes sharing the file
+
+        Returns:
+            dict[str, Any]: hits, misses and size
+        """
+        self._flush_stats(*self._stats.take())
+        conn = self._connection()
+        stats = dict(conn.execute("SELECT name, value FROM cache_stats"))
+        size = conn.execute(
+            "SELECT COUNT(*) FROM cache_entries WHERE expires_at > ?",
+            (time.time(),),
+        ).fetchone()[0]
+        return {
+            "hits": stats.get("hits", 0),
+            "misses": stats.get("misses", 0),
+            "size": size,
+        }
+
+
+class RedisLike(Protocol):
+    """Subset of the redis-py client API used by `RedisCache`
+
+    Any Redis-compatible server (Redis, Valkey, KeyDB, ...) through a
+    redis-py compatible client satisfies it.
+    """
+
+    def get(self, name: str) -> Optional[bytes]:
+        """GET"""
+
+    def set(self, name: str, value: bytes, px: int) -> Any:
+        """SET with expiry in milliseconds"""
+
+    def delete(self, *names: str) -> Any:
+        """DEL"""
+
+    def incrby(self, name: str, amount: int) -> Any:
+        """INCRBY"""
+
+    def mget(self, keys: list[str]) -> list[Optional[bytes]]:
+        """MGET"""
+
+
+class RedisCache(CacheBackend):
+    """TTL cache in a Redis-compatible store shared by hosts
+
+    The server handles expiry and eviction (configure `maxmemory-policy`).
+    """
+
+    def __init__(
+        self,
+        client: RedisLike,
+        prefix: str = DEFAULT_REDIS_PREFIX,
+        stats_flush_interval: float = DEFAULT_STATS_FLUSH_INTERVAL,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            client (RedisLike): redis-py compatible client
+            prefix (str, optional): \
+                key prefix. Defaults to DEFAULT_REDIS_PREFIX.
+            stats_flush_interval (float, optional): \
+                seconds between hit / miss count flushes. \
+                Defaults to DEFAULT_STATS_FLUSH_INTERVAL.
+        """
+        self.client = client
+        self.prefix = prefix
+        self._stats = _SharedStats(stats_flush_interval)
+
+    def get(self, key: str) -> Optional[Any]:
+        """Get a value
+
+        Args:
+            key (str): cache key
+
+        Returns:
+            Optional[Any]: value. None if missing or expired
+        """
+        value = self.client.get(self.prefix + key)
+        counts = self._stats.count(value is not None)
+        if counts is not None:
+            self._flush_stats(*counts)
+        return None if value is None else orjson.loads(value)
+
+    def set(self, key: str, value: Any, ttl: float) -> None:
+        """Set a value
+
+        Args:
+            key (str): cache key
+            value (Any): JSON-compatible value
+            ttl (float): time to live in seconds
+        """
+        self.client.set(
+            self.prefix + key,
+            orjson.dumps(value),
+            px=max(1, int(ttl * 1000)),
+        )
+
+    def delete(self, *keys: str) -> None:
+        """Delete values
+
+        Args:
+            *keys (str): cache keys
+        """
+        if len(keys) > 0:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def _flush_stats(self, hits: int, misses: int) -> None:
+        """Add counts to the shared statistics
+
+        Args:
+            hits (int): hits
+            misses (int): misses
+        """
+        if hits > 0:
+            self.client.incrby(f"{self.prefix}stats:hits", hits)
+        if misses > 0:
+            self.client.incrby(f"{self.prefix}stats:misses", misses)
+
+    def stats(self) -> dict[str, Any]:
+        """Cache statistics of all processes sharing the store
+
+        Returns:
+            dict[str, Any]: hits and misses (size is not tracked)
+        """
+        self._flush_stats(*self._stats.take())
+        hits, misses = self.client.mget(
+            [f"{self.prefix}stats:hits", f"{self.prefix}stats:misses"],
+        )
+        return {
+            "hits": int(hits or 0),
+            "misses": int(misses or 0),
+            "size": None,
+        }
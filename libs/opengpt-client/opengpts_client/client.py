@@ -1,16 +1,38 @@
 """OpenGPTs Client"""
 
 import json
-import mimetypes
 import uuid
-from io import BytesIO
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from typing import Any, Generator, Optional
+from typing import (
+    Any,
+    Callable,
+    Generator,
+    Iterator,
+    Optional,
+    Union,
+    overload,
+)
 
 import orjson
 import requests
 from requests.exceptions import HTTPError
 
+from opengpts_client.balancer import BackendLease, LoadBalancer
+from opengpts_client.cache import CacheBackend, CacheTTL
+from opengpts_client.compression import CompressionConfig
+from opengpts_client.multipart import MultipartBody, ProgressCallback
+from opengpts_client.prefetch import (
+    DEFAULT_PREFETCH_SIZE,
+    PrefetchingIterator,
+    PrefetchPolicy,
+)
+from opengpts_client.scheduler import (
+    EndpointClass,
+    Priority,
+    RequestScheduler,
+    current_priority,
+)
 from opengpts_client.schema import (
     Assistant,
     Message,
@@ -18,10 +40,19 @@ from opengpts_client.schema import (
     ThreadHistory,
     ThreadMessages,
 )
+from opengpts_client.session import create_session
+from opengpts_client.tracing import (
+    Span,
+    Tracer,
+    get_tracer,
+    inject,
+    use_span,
+)
 
 DEFAULT_TIMEOUT = 10
 CHAT_TIMEOUT = 30
 INGEST_TIMEOUT = 60
+MAX_RATE_LIMIT_RETRIES = 3
 
 
 class OpenGPTsClient:
@@ -29,18 +60,89 @@ class OpenGPTsClient:
 
     def __init__(
         self,
-        url: str = "http://localhost:8100",
+        url: Union[str, list[str]] = "http://localhost:8100",
         opengpts_user_id: Optional[str] = None,
+        compression: Optional[CompressionConfig] = None,
+        session: Optional[requests.Session] = None,
+        balancer: Optional[LoadBalancer] = None,
+        thread_affinity: bool = False,
+        scheduler: Optional[RequestScheduler] = None,
+        priority: Priority = Priority.INTERACTIVE,
+        cache: Optional[CacheBackend] = None,
+        cache_ttl: Optional[CacheTTL] = None,
+        tracer: Optional[Tracer] = None,
     ) -> None:
         """コンストラクタ
 
         Args:
-            url (str, optional): url. Defaults to "http://localhost:8100".
+            url (Union[str, list[str]], optional): url or backend url list. \
+                Defaults to "http://localhost:8100".
             opengpts_user_id (str, optional): \
                 opengpts_user_id. Defaults to "None".
+            compression (Optional[CompressionConfig], optional): \
+                transport compression setting. Defaults to None \
+                (negotiate compressed responses only).
+            session (Optional[requests.Session], optional): \
+                shared transport (see `OpenGPTsClientPool`). \
+                Defaults to None (the client owns a session).
+            balancer (Optional[LoadBalancer], optional): \
+                shared load balancer. Defaults to None (created by the \
+                client when several urls are given).
+            thread_affinity (bool, optional): \
+                route all requests of a thread to the same backend. \
+                Defaults to False.
+            scheduler (Optional[RequestScheduler], optional): \
+                shared rate limiter / priority queue. Defaults to None.
+            priority (Priority, optional): priority of calls made outside \
+                of `scheduling_priority`. Defaults to Priority.INTERACTIVE.
+            cache (Optional[CacheBackend], optional): cache of assistants, \
+                thread list and messages, keyed per user. \
+                Defaults to None (no caching).
+            cache_ttl (Optional[CacheTTL], optional): \
+                TTL per resource. Defaults to None (CacheTTL()).
+            tracer (Optional[Tracer], optional): tracer of requests and \
+                runs. Defaults to None (the process-wide tracer).
         """
-        self.url = url
+        urls = [url] if isinstance(url, str) else list(url)
+        self.url = urls[0]
         self.opengpts_user_id = opengpts_user_id or str(uuid.uuid4())
+        self.compression = compression or CompressionConfig()
+        self.thread_affinity = thread_affinity
+        self.scheduler = scheduler
+        self.priority = priority
+        self.cache = cache
+        self.cache_ttl = cache_ttl or CacheTTL()
+        self._tracer = tracer
+        self._owns_session = session is None
+        self._session = session or create_session()
+        self._owns_balancer = balancer is None and len(urls) > 1
+        self.balancer = balancer
+        if self._owns_balancer:
+            self.balancer = LoadBalancer(urls, session=self._session)
+
+    def close(self) -> None:
+        """Close the session and balancer if they are owned by this client"""
+        if self._owns_balancer and self.balancer is not None:
+            self.balancer.close()
+        if self._owns_session:
+            self._session.close()
+
+    def __enter__(self) -> "OpenGPTsClient":
+        """Enter context"""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Exit context"""
+        self.close()
+
+    @property
+    def tracer(self) -> Tracer:
+        """Tracer of requests and runs
+
+        Returns:
+            Tracer: tracer given to the client or the process-wide one
+        """
+        return self._tracer or get_tracer()
 
     @property
     def headers(self) -> dict[str, str]:
@@ -51,20 +153,240 @@ class OpenGPTsClient:
         """
         return {
             "Content-Type": "application/json",
+            "Accept-Encoding": self.compression.accept_encoding,
             "Cookie": f"opengpts_user_id={self.opengpts_user_id}",
         }
 
+    @contextmanager
+    def _backend(
+        self,
+        thread_id: Optional[str] = None,
+    ) -> Iterator[BackendLease]:
+        """Select the backend for a request
+
+        Args:
+            thread_id (Optional[str], optional): \
+                thread id used for affinity. Defaults to None.
+
+        Yields:
+            Iterator[BackendLease]: lease of the selected backend
+        """
+        if self.balancer is None:
+            yield BackendLease(self.url)
+            return
+        with self.balancer.acquire(
+            thread_id if self.thread_affinity else None,
+        ) as lease:
+            yield lease
+
+    @contextmanager
+    def _slot(
+        self,
+        endpoint_class: EndpointClass,
+        priority: Priority,
+    ) -> Iterator[None]:
+        """Wait for the scheduler to admit a call
+
+        Args:
+            endpoint_class (EndpointClass): endpoint class
+            priority (Priority): priority
+
+        Yields:
+            Iterator[None]: context
+        """
+        if self.scheduler is None:
+            yield
+            return
+        with self.scheduler.slot(endpoint_class, priority):
+            yield
+
+    def _throttled(
+        self,
+        response: requests.Response,
+        endpoint_class: EndpointClass,
+        attempt: int,
+    ) -> bool:
+        """Pause the endpoint class when the backend answered 429
+
+        Args:
+            response (requests.Response): response
+            endpoint_class (EndpointClass): endpoint class
+            attempt (int): retry count
+
+        Returns:
+            bool: whether the response was 429
+        """
+        if response.status_code != 429:
+            return False
+        if self.scheduler is not None:
+            retry_after = response.headers.get("Retry-After", "")
+            self.scheduler.penalize(
+                endpoint_class,
+                float(retry_after) if retry_after.isdigit() else 2**attempt,
+            )
+        return True
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        json_body: Any = None,
+        timeout: float = DEFAULT_TIMEOUT,
+        **kwargs: Any,
+    ) -> requests.Response:
+        """Send a request to OpenGPTs
+
+        JSON bodies are serialized with orjson and compressed according to
+        `self.compression`. The current span is propagated as traceparent.
+
+        Args:
+            method (str): HTTP method
+            url (str): url
+            json_body (Any, optional): JSON request body. Defaults to None.
+            timeout (float, optional): timeout. Defaults to DEFAULT_TIMEOUT.
+            **kwargs (Any): extra arguments of `requests.Session.request`
+
+        Returns:
+            requests.Response: response
+        """
+        headers = inject({**self.headers, **kwargs.pop("headers", {})})
+        if json_body is not None:
+            body, content_encoding = self.compression.compress(
+                orjson.dumps(json_body),
+            )
+            if content_encoding is not None:
+                headers["Content-Encoding"] = content_encoding
+            kwargs["data"] = body
+
+        return self._session.request(
+            method,
+            url=url,
+            headers=headers,
+            timeout=timeout,
+            **kwargs,
+        )
+
+    def _request(
+        self,
+        method: str,
+        path: str,
+        thread_id: Optional[str] = None,
+        endpoint_class: EndpointClass = "reads",
+        **kwargs: Any,
+    ) -> requests.Response:
+        """Send a request to the selected OpenGPTs backend
+
+        Batch calls answered with 429 are retried once the scheduler lets
+        the endpoint class through again; interactive calls are not.
+
+        Args:
+            method (str): HTTP method
+            path (str): url path
+            thread_id (Optional[str], optional): \
+                thread id used for affinity. Defaults to None.
+            endpoint_class (EndpointClass, optional): \
+                rate limit class. Defaults to "reads".
+            **kwargs (Any): extra arguments of `_send`
+
+        Returns:
+            requests.Response: response
+        """
+        priority = current_priority(self.priority)
+        with self.tracer.span(
+            "opengpts.request",
+            attributes={
+                "http.method": method,
+                "http.path": path,
+                "endpoint_class": endpoint_class,
+            },
+        ) as span:
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                with self._slot(endpoint_class, priority):
+                    if self.scheduler is not None:
+                        span.add_event("admitted", attempt=attempt)
+                    with self._backend(thread_id) as lease:
+                        response = self._send(
+                            method,
+                            f"{lease.url}{path}",
+                            **kwargs,
+                        )
+                        lease.record_status(response.status_code)
+                throttled = self._throttled(response, endpoint_class, attempt)
+                if not throttled or priority != Priority.BATCH:
+                    break
+                if self.scheduler is None:
+                    break
+            span.set_attribute("http.status_code", response.status_code)
+            span.set_attribute("backend", lease.url)
+            if response.status_code >= 500:
+                span.status = "error"
+        return response
+
+    def _cache_key(self, name: str) -> str:
+        """Cache key of the current user
+
+        Args:
+            name (str): resource name
+
+        Returns:
+            str: cache key
+        """
+        return f"{self.opengpts_user_id}:{name}"
+
+    def _get_json(
+        self,
+        path: str,
+        cache_name: str,
+        ttl: float,
+        thread_id: Optional[str] = None,
+    ) -> Any:
+        """GET a JSON resource through the cache
+
+        Args:
+            path (str): url path
+            cache_name (str): resource name used in the cache key
+            ttl (float): time to live in seconds
+            thread_id (Optional[str], optional): \
+                thread id used for affinity. Defaults to None.
+
+        Returns:
+            Any: decoded JSON
+        """
+        key = self._cache_key(cache_name)
+        if self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        response = self._request("GET", path, thread_id=thread_id)
+        data = response.json()
+        if self.cache is not None and response.ok:
+            self.cache.set(key, data, ttl)
+        return data
+
+    def invalidate(self, thread_id: Optional[str] = None) -> None:
+        """Drop cached thread list (and messages of a thread)
+
+        Called automatically after `create_thread` and runs.
+
+        Args:
+            thread_id (Optional[str], optional): \
+                thread whose messages changed. Defaults to None.
+        """
+        if self.cache is None:
+            return
+        keys = [self._cache_key("threads")]
+        if thread_id is not None:
+            keys.append(self._cache_key(f"messages:{thread_id}"))
+        self.cache.delete(*keys)
+
     def health(self) -> dict:
         """Health check
 
         Returns:
             dict: {'status': 'ok'}
         """
-        response = requests.get(
-            url=f"{self.url}/health",
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT,
-        )
+        response = self._request("GET", "/health")
         return dict(response.json())
 
     def ingest_retrivers_files(
@@ -74,9 +396,13 @@ class OpenGPTsClient:
         chunk_size: int = 1000,
         chunk_overlap: int = 200,
         separators: Optional[list[str]] = None,
+        progress: Optional[ProgressCallback] = None,
     ) -> dict:
         """Ingest files
 
+        Files are streamed from disk while uploading, so memory use does
+        not grow with the file size.
+
         Args:
             files (list[Path]): filepath list
             assistant_id (str): assistant id
@@ -84,55 +410,91 @@ class OpenGPTsClient:
             chunk_overlap (int, optional): chunk overlap size. Defaults to 200.
             separators (Optional[list[str]], optional): \
                 chunk separators. Defaults to None.
+            progress (Optional[ProgressCallback], optional): called with \
+                (sent bytes, total bytes) while uploading. Defaults to None.
         """
-        request_files = [
-            (
-                "files",
-                (
-                    file.name,
-                    BytesIO(file.read_bytes()),
-                    mimetypes.guess_type(file)[0],
-                ),
-            )
-            for file in files
-        ]
-        payload = {
-            "config": json.dumps(
-                {
-                    "configurable": {
-                        "assistant_id": assistant_id,
-                        "chunk_size": chunk_size,
-                        "chunk_overlap": chunk_overlap,
-                        "separators": separators,
+        body = MultipartBody(
+            fields={
+                "config": json.dumps(
+                    {
+                        "configurable": {
+                            "assistant_id": assistant_id,
+                            "chunk_size": chunk_size,
+                            "chunk_overlap": chunk_overlap,
+                            "separators": separators,
+                        },
                     },
-                },
-            ),
-        }
+                ),
+            },
+            files=files,
+            progress=progress,
+        )
+
+        with self.tracer.span(
+            "opengpts.ingest",
+            attributes={"assistant_id": assistant_id, "files": len(files)},
+        ) as span:
+            with self._slot("ingest", current_priority(self.priority)):
+                with self._backend() as lease:
+                    response = self._send_ingest(lease, body)
+                    lease.record_status(response.status_code)
+            span.set_attribute("http.status_code", response.status_code)
+            span.set_attribute("bytes", len(body))
+        self._throttled(response, "ingest", 0)
 
-        response = requests.post(
-            url=f"{self.url}/ingest",
-            headers={
+        return {"status": response.status_code}
+
+    def _send_ingest(
+        self,
+        lease: BackendLease,
+        body: MultipartBody,
+    ) -> requests.Response:
+        """Send multipart ingest request
+
+        Args:
+            lease (BackendLease): selected backend
+            body (MultipartBody): streaming multipart body
+
+        Returns:
+            requests.Response: response
+        """
+        headers = inject(
+            {
                 "accept": "application/json",
+                "Accept-Encoding": self.compression.accept_encoding,
+                "Content-Type": body.content_type,
             },
-            data=payload,
-            files=request_files,
+        )
+        data: Any = body
+        chunks, content_encoding = self.compression.compress_stream(
+            body,
+            size=len(body),
+        )
+        if content_encoding is not None:
+            # compressed length is unknown, send chunked; small bodies stay
+            # uncompressed with their Content-Length
+            headers["Content-Encoding"] = content_encoding
+            data = chunks
+
+        return self._session.post(
+            f"{lease.url}/ingest",
+            headers=headers,
+            data=data,
             timeout=INGEST_TIMEOUT,
         )
 
-        return {"status": response.status_code}
-
     def get_assistant_list(self) -> list[Assistant]:
         """List all assistants for the current user.
 
         Returns:
             list[Assistant]: assistant list
         """
-        response = requests.get(
-            url=f"{self.url}/assistants/",
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT,
+        data = self._get_json(
+            "/assistants/",
+            cache_name="assistants",
+            ttl=self.cache_ttl.assistants,
         )
-        return [Assistant(**res) for res in response.json()]
+        return [Assistant(**res) for res in data]
 
     def get_public_assistant_list(self, assistant_id: str) -> list[Assistant]:
         """List all public assistants.
@@ -143,11 +505,10 @@ class OpenGPTsClient:
         Returns:
             list[Assistant]: public assistant list
         """
-        response = requests.get(
-            url=f"{self.url}/assistants/public/",
-            headers=self.headers,
+        response = self._request(
+            "GET",
+            "/assistants/public/",
             params={"shared_id": assistant_id},
-            timeout=DEFAULT_TIMEOUT,
         )
         return [Assistant(**res) for res in response.json()]
 
@@ -160,12 +521,12 @@ class OpenGPTsClient:
         Returns:
             Assistant: assistant info
         """
-        response = requests.get(
-            url=f"{self.url}/assistants/{assistant_id}",
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT,
+        data = self._get_json(
+            f"/assistants/{assistant_id}",
+            cache_name=f"assistant:{assistant_id}",
+            ttl=self.cache_ttl.assistants,
         )
-        return Assistant(**response.json())
+        return Assistant(**data)
 
     def delete_assistant(self, assistant_id: str):
         """_summary_
@@ -191,16 +552,17 @@ class OpenGPTsClient:
         Returns:
             Assistant: _description_
         """
-        response = requests.post(
-            url=f"{self.url}/assistants",
-            headers=self.headers,
-            json={
+        response = self._request(
+            "POST",
+            "/assistants",
+            json_body={
                 "name": name,
                 "config": config,
                 "public": public,
             },
-            timeout=DEFAULT_TIMEOUT,
         )
+        if self.cache is not None:
+            self.cache.delete(self._cache_key("assistants"))
         return Assistant(**response.json())
 
     def get_thread_list(self) -> list[Thread]:
@@ -209,12 +571,12 @@ class OpenGPTsClient:
         Returns:
             list[Thread]: all threads
         """
-        response = requests.get(
-            url=f"{self.url}/threads/",
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT,
+        data = self._get_json(
+            "/threads/",
+            cache_name="threads",
+            ttl=self.cache_ttl.threads,
         )
-        return [Thread(**res) for res in response.json()]
+        return [Thread(**res) for res in data]
 
     def get_thread(self, thread_id: str) -> Thread:
         """Get a thread by ID.
@@ -225,10 +587,10 @@ class OpenGPTsClient:
         Returns:
             Thread: thread info
         """
-        response = requests.get(
-            url=f"{self.url}/threads/{thread_id}",
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT,
+        response = self._request(
+            "GET",
+            f"/threads/{thread_id}",
+            thread_id=thread_id,
         )
         return Thread(**response.json())
 
@@ -241,12 +603,13 @@ class OpenGPTsClient:
         Returns:
             ThreadMessages: Thred Messages
         """
-        response = requests.get(
-            url=f"{self.url}/threads/{thread_id}/messages",
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT,
+        data = self._get_json(
+            f"/threads/{thread_id}/messages",
+            cache_name=f"messages:{thread_id}",
+            ttl=self.cache_ttl.messages,
+            thread_id=thread_id,
         )
-        return ThreadMessages(**response.json())
+        return ThreadMessages(**data)
 
     def get_thread_history(self, thread_id: str) -> list[ThreadHistory]:
         """Get all past states for a thread.
@@ -257,10 +620,10 @@ class OpenGPTsClient:
         Returns:
             list[ThreadHistory]: thread history
         """
-        response = requests.get(
-            url=f"{self.url}/threads/{thread_id}/history",
-            headers=self.headers,
-            timeout=DEFAULT_TIMEOUT,
+        response = self._request(
+            "GET",
+            f"/threads/{thread_id}/history",
+            thread_id=thread_id,
         )
         return [ThreadHistory(**res) for res in response.json()]
 
@@ -274,17 +637,36 @@ class OpenGPTsClient:
         Returns:
             Thread: thread info
         """
-        response = requests.post(
-            url=f"{self.url}/threads",
-            headers=self.headers,
-            json={
+        response = self._request(
+            "POST",
+            "/threads",
+            json_body={
                 "name": name,
                 "assistant_id": assistant_id,
             },
-            timeout=DEFAULT_TIMEOUT,
         )
+        self.invalidate()
         return Thread(**response.json())
 
+    def add_messages(self, thread_id: str, messages: list[Message]) -> None:
+        """Append messages to a thread without running the assistant
+
+        Args:
+            thread_id (str): thread id
+            messages (list[Message]): messages
+
+        Raises:
+            HTTPError: the messages were not added
+        """
+        response = self._request(
+            "POST",
+            f"/threads/{thread_id}/messages",
+            thread_id=thread_id,
+            json_body={"messages": [m.to_request_params() for m in messages]},
+        )
+        response.raise_for_status()
+        self.invalidate(thread_id)
+
     def run(
         self,
         assistant_id: str,
@@ -301,10 +683,12 @@ class OpenGPTsClient:
         Returns:
             dict: _description_
         """
-        response = requests.post(
-            f"{self.url}/runs",
-            headers=self.headers,
-            json={
+        response = self._request(
+            "POST",
+            "/runs",
+            thread_id=thread_id,
+            endpoint_class="runs",
+            json_body={
                 "input": [m.to_request_params() for m in messages],
                 "assistant_id": assistant_id,
                 "thread_id": thread_id,
@@ -312,39 +696,223 @@ class OpenGPTsClient:
             stream=True,
             timeout=CHAT_TIMEOUT,
         )
+        self.invalidate(thread_id)
 
-        return str(response.text())
+        return str(response.text)
 
+    @overload
     def run_stream(
         self,
         assistant_id: str,
         thread_id: str,
         messages: list[Message],
-    ) -> Generator[list[Message], Any, None]:
+        prefetch: None = None,
+        prefetch_size: int = DEFAULT_PREFETCH_SIZE,
+    ) -> Iterator[list[Message]]: ...
+
+    @overload
+    def run_stream(
+        self,
+        assistant_id: str,
+        thread_id: str,
+        messages: list[Message],
+        prefetch: PrefetchPolicy,
+        prefetch_size: int = DEFAULT_PREFETCH_SIZE,
+    ) -> PrefetchingIterator[list[Message]]: ...
+
+    def run_stream(
+        self,
+        assistant_id: str,
+        thread_id: str,
+        messages: list[Message],
+        prefetch: Optional[PrefetchPolicy] = None,
+        prefetch_size: int = DEFAULT_PREFETCH_SIZE,
+    ) -> Iterator[list[Message]]:
         """Creat Run stream
 
+        By default events are read lazily while iterating. With `prefetch`
+        a background thread keeps reading the socket into a bounded buffer
+        while the consumer is busy; close the returned iterator when
+        stopping early. The scheduler slot of the run is released once the
+        response headers arrive, so the client can be used while iterating.
+
         Args:
             assistant_id (str): assisntant id
             thread_id (str): thread id
             messages (list[Message]): input message list
+            prefetch (Optional[PrefetchPolicy], optional): "all" buffers \
+                every event, "latest" keeps only the newest one. \
+                Defaults to None (no background reader).
+            prefetch_size (int, optional): max buffered events of "all". \
+                Defaults to DEFAULT_PREFETCH_SIZE.
 
         Raises:
-            HTTPError: _description_
+            HTTPError: error event, or 429 that was not retried
+
+        Returns:
+            Iterator[list[Message]]: thread messages of each event
+        """
+        if prefetch is None:
+            return self._run_stream(assistant_id, thread_id, messages)
+
+        responses: list[requests.Response] = []
+
+        def close_responses() -> None:
+            # the response only exists once the reader thread has sent
+            for response in responses:
+                response.close()
+
+        return PrefetchingIterator(
+            self._run_stream(
+                assistant_id,
+                thread_id,
+                messages,
+                on_response=responses.append,
+            ),
+            policy=prefetch,
+            maxsize=prefetch_size,
+            on_close=close_responses,
+        )
+
+    def _run_stream(
+        self,
+        assistant_id: str,
+        thread_id: str,
+        messages: list[Message],
+        on_response: Optional[Callable[[requests.Response], None]] = None,
+    ) -> Generator[list[Message], Any, None]:
+        """Creat Run stream
+
+        Args:
+            assistant_id (str): assisntant id
+            thread_id (str): thread id
+            messages (list[Message]): input message list
+            on_response (Optional[Callable]): \
+                called with the streaming response. Defaults to None.
 
         Yields:
-            Generator[list[Massage], Any, None]: _description_
+            Generator[list[Message], Any, None]: thread messages
         """
-        response = requests.post(
-            f"{self.url}/runs/stream",
-            headers=self.headers,
-            json={
-                "input": [m.to_request_params() for m in messages],
-                "assistant_id": assistant_id,
-                "thread_id": thread_id,
-            },
-            stream=True,
-            timeout=CHAT_TIMEOUT,
+        # the span is only made current while sending: the generator may be
+        # resumed from another context (e.g. the prefetch thread)
+        span = self.tracer.start_span(
+            "opengpts.run_stream",
+            attributes={"assistant_id": assistant_id, "thread_id": thread_id},
         )
+        events = 0
+        last_event_at: Optional[float] = None
+        priority = current_priority(self.priority)
+        body = {
+            "input": [m.to_request_params() for m in messages],
+            "assistant_id": assistant_id,
+            "thread_id": thread_id,
+        }
+        try:
+            for attempt in range(MAX_RATE_LIMIT_RETRIES + 1):
+                lease_stack, lease, response = self._open_run_stream(
+                    thread_id,
+                    body,
+                    priority,
+                    span,
+                    attempt,
+                )
+                span.add_event("response", status_code=response.status_code)
+                lease.record_status(response.status_code)
+                if not self._throttled(response, "runs", attempt):
+                    break
+                # a 429 body is not an event stream
+                response.close()
+                lease_stack.close()
+                if (
+                    priority != Priority.BATCH
+                    or self.scheduler is None
+                    or attempt == MAX_RATE_LIMIT_RETRIES
+                ):
+                    raise HTTPError(
+                        f"429 Too Many Requests for url: {response.url}",
+                        response=response,
+                    )
+
+            if on_response is not None:
+                on_response(response)
+            with lease_stack, response:
+                try:
+                    for stream_messages in self._iter_stream(response):
+                        last_event_at = span.elapsed()
+                        if events == 0:
+                            span.add_event("first_event")
+                        events += 1
+                        yield stream_messages
+                finally:
+                    self.invalidate(thread_id)
+        except GeneratorExit:
+            span.set_attribute("cancelled", True)
+            raise
+        except Exception as e:
+            span.record_exception(e)
+            raise
+        finally:
+            if last_event_at is not None:
+                span.add_event("last_event", elapsed=last_event_at)
+            span.set_attribute("sse.events", events)
+            self.tracer.finish(span)
+
+    def _open_run_stream(
+        self,
+        thread_id: str,
+        body: dict[str, Any],
+        priority: Priority,
+        span: Span,
+        attempt: int,
+    ) -> tuple[ExitStack, BackendLease, requests.Response]:
+        """Start a run stream
+
+        The scheduler slot is only held until the response headers arrive,
+        so a consumer may call the client while iterating the stream
+        without waiting for a slot its own stream holds. The backend lease
+        stays open in the returned stack until the stream is closed, so
+        open streams keep counting as outstanding requests of the backend.
+
+        Args:
+            thread_id (str): thread id
+            body (dict[str, Any]): run request body
+            priority (Priority): priority
+            span (Span): span of the stream
+            attempt (int): retry count
+
+        Returns:
+            tuple[ExitStack, BackendLease, requests.Response]: \
+                stack holding the lease, the lease and the response
+        """
+        with ExitStack() as stack, self._slot("runs", priority):
+            if self.scheduler is not None:
+                span.add_event("admitted", attempt=attempt)
+            lease = stack.enter_context(self._backend(thread_id))
+            with use_span(span):
+                response = self._send(
+                    "POST",
+                    f"{lease.url}/runs/stream",
+                    json_body=body,
+                    stream=True,
+                    timeout=CHAT_TIMEOUT,
+                )
+            return stack.pop_all(), lease, response
+
+    def _iter_stream(
+        self,
+        response: requests.Response,
+    ) -> Generator[list[Message], Any, None]:
+        """Parse SSE events of a run stream
+
+        Args:
+            response (requests.Response): streaming response
+
+        Raises:
+            HTTPError: error event
+
+        Yields:
+            Generator[list[Message], Any, None]: thread messages
+        """
         event_type = None
         for msg in response.iter_lines(chunk_size=None, decode_unicode=True):
             if msg.strip():
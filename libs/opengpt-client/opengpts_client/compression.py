@@ -0,0 +1,142 @@
+"""Compression"""
+
+import gzip
+import zlib
+from typing import Any, Iterable, Iterator, Literal, Optional
+
+from pydantic import BaseModel, Field
+from urllib3 import response as urllib3_response
+
+try:
+    import zstandard
+
+    HAS_ZSTANDARD = True
+except ImportError:  # zstandard is an optional dependency
+    HAS_ZSTANDARD = False
+
+Encoding = Literal["gzip", "zstd"]
+
+# urllib3 decodes the response stream incrementally, so only advertise the
+# encodings it is able to decode.
+DECODABLE_ENCODINGS: set[str] = {"gzip", "deflate"}
+if getattr(urllib3_response, "HAS_ZSTD", False):
+    DECODABLE_ENCODINGS.add("zstd")
+
+DEFAULT_MIN_SIZE = 1024
+
+
+class CompressionConfig(BaseModel):
+    """Compression Config
+
+    Response bodies are negotiated with `Accept-Encoding` and decoded while
+    streaming (including the SSE stream of `run_stream`). Request bodies are
+    only compressed when `request_encoding` is set, because the OpenGPTs
+    backend has to be configured to accept `Content-Encoding`.
+    """
+
+    accept_encodings: list[Encoding] = Field(
+        ["zstd", "gzip"],
+        title="accepted response encodings in order of preference",
+    )
+    request_encoding: Optional[Encoding] = Field(
+        None,
+        title="request body encoding. None disables request compression",
+    )
+    min_size: int = Field(
+        DEFAULT_MIN_SIZE,
+        title="request bodies smaller than this are sent uncompressed",
+    )
+    level: Optional[int] = Field(None, title="compression level")
+
+    @property
+    def accept_encoding(self) -> str:
+        """Accept-Encoding header value
+
+        Returns:
+            str: header value. "identity" if nothing can be decoded
+        """
+        encodings = [
+            encoding
+            for encoding in self.accept_encodings
+            if encoding in DECODABLE_ENCODINGS
+        ]
+        return ", ".join(encodings) or "identity"
+
+    def should_compress(self, size: Optional[int]) -> bool:
+        """Whether a request body of the given size should be compressed
+
+        Args:
+            size (Optional[int]): body size. None if unknown (streaming)
+
+        Returns:
+            bool: compress or not
+        """
+        if self.request_encoding is None:
+            return False
+        if self.request_encoding == "zstd" and not HAS_ZSTANDARD:
+            return False
+        return size is None or size >= self.min_size
+
+    def compress(self, body: bytes) -> tuple[bytes, Optional[str]]:
+        """Compress request body
+
+        Args:
+            body (bytes): request body
+
+        Returns:
+            tuple[bytes, Optional[str]]: \
+                body and Content-Encoding (None if left uncompressed)
+        """
+        if not self.should_compress(len(body)):
+            return body, None
+        if self.request_encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=self.level or 3)
+            return compressor.compress(body), "zstd"
+        level = 6 if self.level is None else self.level
+        return gzip.compress(body, compresslevel=level, mtime=0), "gzip"
+
+    def compress_stream(
+        self,
+        chunks: Iterable[bytes],
+        size: Optional[int] = None,
+    ) -> tuple[Iterator[bytes], Optional[str]]:
+        """Compress a streaming request body chunk by chunk
+
+        Args:
+            chunks (Iterable[bytes]): request body chunks
+            size (Optional[int], optional): \
+                body size if known. Defaults to None.
+
+        Returns:
+            tuple[Iterator[bytes], Optional[str]]: \
+                body chunks and Content-Encoding (None if left uncompressed)
+        """
+        if not self.should_compress(size):
+            return iter(chunks), None
+        if self.request_encoding == "zstd":
+            compressor = zstandard.ZstdCompressor(level=self.level or 3)
+            return _iter_compress(chunks, compressor.compressobj()), "zstd"
+        level = 6 if self.level is None else self.level
+        # wbits=31 writes a gzip container
+        compressobj = zlib.compressobj(level, zlib.DEFLATED, 31)
+        return _iter_compress(chunks, compressobj), "gzip"
+
+
+def _iter_compress(
+    chunks: Iterable[bytes],
+    compressobj: Any,
+) -> Iterator[bytes]:
+    """Compress chunks incrementally
+
+    Args:
+        chunks (Iterable[bytes]): raw chunks
+        compressobj (Any): zlib / zstandard compress object
+
+    Yields:
+        Iterator[bytes]: compressed chunks
+    """
+    for chunk in chunks:
+        data = compressobj.compress(chunk)
+        if data:
+            yield data
+    yield compressobj.flush()
@@ -0,0 +1,720 @@
+"""Streaming bulk export of threads and messages"""
+
+import argparse
+import os
+import sys
+from abc import ABC, abstractmethod
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from logging import getLogger
+from pathlib import Path
+from typing import IO, Any, Iterable, Iterator, Optional, Union
+
+import orjson
+from pydantic import BaseModel, Field
+
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.pool import OpenGPTsClientPool
+from opengpts_client.scheduler import Priority, scheduling_priority
+from opengpts_client.schema import Message, Thread
+from opengpts_client.tracing import get_tracer
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+
+    HAS_PYARROW = True
+except ImportError:  # pyarrow is an optional dependency
+    HAS_PYARROW = False
+
+logger = getLogger(__name__)
+
+DEFAULT_EXPORT_CONCURRENCY = 4
+DEFAULT_COMMIT_EVERY = 100
+
+RECORD_FIELDS = [
+    "user_id",
+    "thread_id",
+    "assistant_id",
+    "thread_name",
+    "thread_updated_at",
+    "position",
+    "message_id",
+    "type",
+    "name",
+    "content",
+    "example",
+    "additional_kwargs",
+]
+"""fields of an exported record, one record per message"""
+
+
+def message_records(
+    thread: Thread,
+    messages: list[Message],
+) -> list[dict[str, Any]]:
+    """Flatten a thread into records
+
+    A thread without messages yields one record whose message fields are
+    None, so it is still part of the export.
+
+    Args:
+        thread (Thread): thread
+        messages (list[Message]): messages of the thread
+
+    Returns:
+        list[dict[str, Any]]: records
+    """
+    base = {
+        "user_id": thread.user_id,
+        "thread_id": thread.thread_id,
+        "assistant_id": thread.assistant_id,
+        "thread_name": thread.name,
+        "thread_updated_at": thread.updated_at.isoformat(),
+    }
+    if len(messages) == 0:
+        return [{**base, **{f: None for f in RECORD_FIELDS if f not in base}}]
+    return [
+        {
+            **base,
+            "position": position,
+            "message_id": message.id,
+            "type": message.type,
+            "name": message.name,
+            "content": message.model_dump(mode="json")["content"],
+            "example": message.example,
+            "additional_kwargs": (
+                None
+                if message.additional_kwargs is None
+                else message.additional_kwargs.model_dump(mode="json")
+            ),
+        }
+        for position, message in enumerate(messages)
+    ]
+
+
+class RecordWriter(ABC):
+    """Destination of exported records
+
+    `flush` makes everything written so far durable and returns a position
+    which `open` can roll back to when an interrupted export resumes.
+    """
+
+    @abstractmethod
+    def open(self, position: Optional[int] = None) -> None:
+        """Open for writing
+
+        Args:
+            position (Optional[int], optional): position of the last \
+                checkpoint to resume from. Defaults to None (start over).
+        """
+
+    @abstractmethod
+    def write(self, records: list[dict[str, Any]]) -> None:
+        """Write records
+
+        Args:
+            records (list[dict[str, Any]]): records
+        """
+
+    @abstractmethod
+    def flush(self) -> int:
+        """Persist written records
+
+        Returns:
+            int: position to resume from
+        """
+
+    @abstractmethod
+    def close(self) -> None:
+        """Flush and close"""
+
+
+class NDJSONWriter(RecordWriter):
+    """Write one JSON object per line
+
+    The position is the file size, so bytes written after the last
+    checkpoint are truncated on resume.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Union[str, Path]): output file. "-" writes to stdout
+        """
+        self.path = path
+        self._file: Optional[IO[bytes]] = None
+
+    def open(self, position: Optional[int] = None) -> None:
+        """Open for writing
+
+        Args:
+            position (Optional[int], optional): position of the last \
+                checkpoint to resume from. Defaults to None (start over).
+
+        Raises:
+            ValueError: resume requested on stdout
+        """
+        if self.path == "-":
+            if position is not None:
+                raise ValueError("an export to stdout cannot be resumed")
+            self._file = sys.stdout.buffer
+            return
+        path = Path(self.path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if position is None or not path.exists():
+            self._file = path.open("wb")
+            return
+        self._file = path.open("r+b")
+        self._file.truncate(position)
+        self._file.seek(position)
+
+    def write(self, records: list[dict[str, Any]]) -> None:
+        """Write records
+
+        Args:
+            records (list[dict[str, Any]]): records
+        """
+        if self._file is None:
+            raise ValueError("writer is not open")
+        self._file.write(
+            b"".join(orjson.dumps(record) + b"\n" for record in records),
+        )
+
+    def flush(self) -> int:
+        """Persist written records
+
+        Returns:
+            int: file size
+        """
+        if self._file is None:
+            raise ValueError("writer is not open")
+        self._file.flush()
+        if self._file is sys.stdout.buffer:
+            return 0
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self) -> None:
+        """Flush and close"""
+        if self._file is None:
+            return
+        self.flush()
+        if self._file is not sys.stdout.buffer:
+            self._file.close()
+        self._file = None
+
+
+class ParquetWriter(RecordWriter):
+    """Write a directory of Parquet part files (requires pyarrow)
+
+    Records are buffered and written as one part file per flush, so memory
+    is bounded by the checkpoint interval. The position is the number of
+    part files; parts written after the last checkpoint are removed on
+    resume. `content` and `additional_kwargs` that are not plain strings
+    are stored as JSON strings.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Union[str, Path]): output directory
+
+        Raises:
+            ImportError: pyarrow is not installed
+        """
+        if not HAS_PYARROW:
+            raise ImportError(
+                "parquet export requires pyarrow: "
+                "pip install 'opengpts-client[parquet]'",
+            )
+        self.path = Path(path)
+        self.parts = 0
+        self._rows: list[dict[str, Any]] = []
+
+    @property
+    def schema(self) -> Any:
+        """Arrow schema of the part files
+
+        Returns:
+            Any: pyarrow.Schema
+        """
+        types = {"position": pyarrow.int64(), "example": pyarrow.bool_()}
+        return pyarrow.schema(
+            [(f, types.get(f, pyarrow.string())) for f in RECORD_FIELDS],
+        )
+
+    def _part(self, index: int) -> Path:
+        """Path of a part file
+
+        Args:
+            index (int): part index
+
+        Returns:
+            Path: path
+        """
+        return self.path / f"part-{index:06d}.parquet"
+
+    def open(self, position: Optional[int] = None) -> None:
+        """Open for writing
+
+        Args:
+            position (Optional[int], optional): position of the last \
+                checkpoint to resume from. Defaults to None (start over).
+        """
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.parts = position or 0
+        for part in self.path.glob("part-*.parquet"):
+            if int(part.stem.split("-")[1]) >= self.parts:
+                part.unlink()
+        self._rows = []
+
+    def write(self, records: list[dict[str, Any]]) -> None:
+        """Buffer records until the next flush
+
+        Args:
+            records (list[dict[str, Any]]): records
+        """
+        for record in records:
+            self._rows.append(
+                {
+                    **record,
+                    "content": _as_text(record["content"]),
+                    "additional_kwargs": _as_text(
+                        record["additional_kwargs"],
+                    ),
+                },
+            )
+
+    def flush(self) -> int:
+        """Write buffered records as a part file
+
+        Returns:
+            int: number of part files
+        """
+        if len(self._rows) == 0:
+            return self.parts
+        table = pyarrow.Table.from_pylist(self._rows, schema=self.schema)
+        pyarrow.parquet.write_table(table, self._part(self.parts))
+        self.parts += 1
+        self._rows = []
+        return self.parts
+
+    def close(self) -> None:
+        """Flush and close"""
+        self.flush()
+
+
+def _as_text(value: Any) -> Optional[str]:
+    """Store a JSON value in a string column
+
+    Args:
+        value (Any): value
+
+    Returns:
+        Optional[str]: the string itself or its JSON
+    """
+    if value is None or isinstance(value, str):
+        return value
+    return orjson.dumps(value).decode()
+
+
+class ExportCheckpoint:
+    """Append-only log of exported threads
+
+    Each line holds the threads persisted by one writer flush, grouped by
+    user, the users finished by then and the writer position after it. A
+    resumed export skips finished users and the exported threads of the
+    others, and rolls the output back to the last consistent position.
+    Thread ids of finished users are dropped while loading, so memory is
+    bounded by the number of users, not threads.
+    """
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Union[str, Path]): checkpoint file
+        """
+        self.path = Path(path)
+
+    def load(
+        self,
+    ) -> tuple[set[str], dict[str, set[str]], Optional[int]]:
+        """Read the checkpoint
+
+        A partially written last line (crash while appending) is ignored.
+
+        Returns:
+            tuple[set[str], dict[str, set[str]], Optional[int]]: \
+                finished user ids, exported thread ids of unfinished users \
+                and the writer position (None if empty)
+        """
+        finished: set[str] = set()
+        done: dict[str, set[str]] = {}
+        position: Optional[int] = None
+        if not self.path.exists():
+            return finished, done, position
+        with self.path.open("rb") as f:
+            for line in f:
+                try:
+                    entry = orjson.loads(line)
+                except orjson.JSONDecodeError:
+                    logger.warning("ignore broken checkpoint line")
+                    break
+                for user_id, thread_ids in entry["thread_ids"].items():
+                    done.setdefault(user_id, set()).update(thread_ids)
+                for user_id in entry["finished_users"]:
+                    finished.add(user_id)
+                    done.pop(user_id, None)
+                position = entry["position"]
+        return finished, done, position
+
+    def reset(self) -> None:
+        """Forget all progress"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.path.write_bytes(b"")
+
+    def commit(
+        self,
+        thread_ids: dict[str, list[str]],
+        finished_users: list[str],
+        position: int,
+    ) -> None:
+        """Record persisted threads
+
+        Args:
+            thread_ids (dict[str, list[str]]): \
+                threads persisted since the last commit by user id
+            finished_users (list[str]): \
+                users whose threads were all persisted since the last commit
+            position (int): writer position
+        """
+        line = orjson.dumps(
+            {
+                "thread_ids": thread_ids,
+                "finished_users": finished_users,
+                "position": position,
+            },
+        )
+        with self.path.open("ab") as f:
+            f.write(line + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+class ExportStats(BaseModel):
+    """Export progress"""
+
+    users: int = Field(0, title="exported users")
+    threads: int = Field(0, title="exported threads")
+    messages: int = Field(0, title="exported messages")
+    skipped: int = Field(0, title="threads already exported (resume)")
+    skipped_users: int = Field(0, title="users already exported (resume)")
+    failed: int = Field(0, title="threads that could not be read")
+
+
+class ThreadExporter:
+    """Export every thread of users with bounded concurrency
+
+    Messages are fetched for at most `concurrency` threads at a time and
+    written as soon as they arrive, so memory does not grow with the
+    number of threads. Every `commit_every` threads the writer is flushed
+    and the checkpoint updated; failed threads are not checkpointed and
+    are retried by the next run. Only the ids of finished users are kept
+    across users.
+    """
+
+    def __init__(
+        self,
+        writer: RecordWriter,
+        checkpoint: Optional[ExportCheckpoint] = None,
+        concurrency: int = DEFAULT_EXPORT_CONCURRENCY,
+        commit_every: int = DEFAULT_COMMIT_EVERY,
+        resume: bool = True,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            writer (RecordWriter): destination
+            checkpoint (Optional[ExportCheckpoint], optional): \
+                progress log. Defaults to None (no resume).
+            concurrency (int, optional): threads fetched at a time. \
+                Defaults to DEFAULT_EXPORT_CONCURRENCY.
+            commit_every (int, optional): threads per checkpoint. \
+                Defaults to DEFAULT_COMMIT_EVERY.
+            resume (bool, optional): continue from the checkpoint instead \
+                of starting over. Defaults to True.
+        """
+        self.writer = writer
+        self.checkpoint = checkpoint
+        self.concurrency = max(1, concurrency)
+        self.commit_every = max(1, commit_every)
+        self.resume = resume
+        self.stats = ExportStats()
+        self._finished: set[str] = set()
+        self._done: dict[str, set[str]] = {}
+        self._uncommitted: dict[str, list[str]] = {}
+        self._uncommitted_count = 0
+        self._finished_uncommitted: list[str] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __enter__(self) -> "ThreadExporter":
+        """Open the writer (rolled back to the checkpoint)"""
+        position = None
+        if self.checkpoint is not None:
+            if self.resume:
+                self._finished, self._done, position = self.checkpoint.load()
+            else:
+                self.checkpoint.reset()
+        self.writer.open(position)
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.concurrency,
+            thread_name_prefix="opengpts-export",
+        )
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Commit and close"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+        self.commit()
+        self.writer.close()
+
+    def export(self, client: OpenGPTsClient) -> None:
+        """Export all threads of the client's user
+
+        Args:
+            client (OpenGPTsClient): client of the user
+
+        Raises:
+            ValueError: not opened or the client has no user id
+        """
+        if self._executor is None:
+            raise ValueError("use the exporter as a context manager")
+        user_id = client.opengpts_user_id
+        if user_id is None:
+            raise ValueError("client has no opengpts_user_id")
+        if user_id in self._finished:
+            self.stats.skipped_users += 1
+            return
+        done = self._done.pop(user_id, set())
+        with get_tracer().span(
+            "opengpts.export",
+            attributes={"user_id": user_id},
+        ) as span:
+            failed = self.stats.failed
+            listed = client.get_thread_list()
+            threads = [t for t in listed if t.thread_id not in done]
+            self.stats.skipped += len(listed) - len(threads)
+            span.set_attribute("threads", len(threads))
+            for thread, messages in self._fetch(client, threads):
+                if messages is None:
+                    self.stats.failed += 1
+                    continue
+                self.writer.write(message_records(thread, messages))
+                self.stats.threads += 1
+                self.stats.messages += len(messages)
+                self._uncommitted.setdefault(user_id, []).append(
+                    thread.thread_id,
+                )
+                self._uncommitted_count += 1
+                if self._uncommitted_count >= self.commit_every:
+                    self.commit()
+        self.stats.users += 1
+        self._finished.add(user_id)
+        if self.stats.failed == failed:
+            self._finished_uncommitted.append(user_id)
+
+    def _fetch(
+        self,
+        client: OpenGPTsClient,
+        threads: Iterable[Thread],
+    ) -> Iterator[tuple[Thread, Optional[list[Message]]]]:
+        """Fetch messages keeping at most `concurrency` requests in flight
+
+        Args:
+            client (OpenGPTsClient): client of the user
+            threads (Iterable[Thread]): threads to fetch
+
+        Yields:
+            Iterator[tuple[Thread, Optional[list[Message]]]]: \
+                thread and messages (None if the request failed)
+        """
+        if self._executor is None:
+            raise ValueError("use the exporter as a context manager")
+        pending: dict[Future, Thread] = {}
+        remaining = iter(threads)
+        while True:
+            for thread in remaining:
+                pending[self._executor.submit(_messages, client, thread)] = (
+                    thread
+                )
+                if len(pending) >= self.concurrency:
+                    break
+            if len(pending) == 0:
+                return
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                thread = pending.pop(future)
+                messages: Optional[list[Message]] = None
+                try:
+                    messages = future.result()
+                except Exception:
+                    logger.exception("failed to export %s", thread.thread_id)
+                yield thread, messages
+
+    def commit(self) -> None:
+        """Flush the writer and checkpoint exported threads"""
+        position = self.writer.flush()
+        if self.checkpoint is not None and (
+            self._uncommitted_count > 0 or len(self._finished_uncommitted) > 0
+        ):
+            self.checkpoint.commit(
+                self._uncommitted,
+                self._finished_uncommitted,
+                position,
+            )
+        self._uncommitted = {}
+        self._uncommitted_count = 0
+        self._finished_uncommitted = []
+
+
+def _messages(client: OpenGPTsClient, thread: Thread) -> list[Message]:
+    """Messages of a thread read as batch work
+
+    Args:
+        client (OpenGPTsClient): client of the user
+        thread (Thread): thread
+
+    Returns:
+        list[Message]: messages
+    """
+    with scheduling_priority(Priority.BATCH):
+        return client.get_messages(thread.thread_id).messages
+
+
+def parse_args(argv: Optional[list[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments
+
+    Args:
+        argv (Optional[list[str]], optional): \
+            arguments. Defaults to None (sys.argv).
+
+    Returns:
+        argparse.Namespace: arguments
+    """
+    parser = argparse.ArgumentParser(
+        prog="opengpts-export",
+        description="Export threads and messages of OpenGPTs users",
+    )
+    parser.add_argument("--url", default="http://localhost:8100")
+    parser.add_argument(
+        "--user-id",
+        action="append",
+        default=[],
+        help="opengpts_user_id to export (repeatable)",
+    )
+    parser.add_argument(
+        "--user-ids-file",
+        type=Path,
+        help="file with one opengpts_user_id per line",
+    )
+    parser.add_argument(
+        "--output",
+        required=True,
+        help="NDJSON file ('-' for stdout) or Parquet directory",
+    )
+    parser.add_argument(
+        "--format",
+        choices=["ndjson", "parquet"],
+        default="ndjson",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        type=Path,
+        help="progress file; an interrupted export resumes from it",
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="ignore the checkpoint and start over",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=DEFAULT_EXPORT_CONCURRENCY,
+    )
+    parser.add_argument(
+        "--commit-every",
+        type=int,
+        default=DEFAULT_COMMIT_EVERY,
+    )
+    return parser.parse_args(argv)
+
+
+def _user_ids(args: argparse.Namespace) -> Iterator[str]:
+    """User ids given on the command line, read lazily from the file
+
+    Args:
+        args (argparse.Namespace): arguments
+
+    Yields:
+        Iterator[str]: user ids
+    """
+    yield from args.user_id
+    if args.user_ids_file is not None:
+        with args.user_ids_file.open() as f:
+            for line in f:
+                if line.strip():
+                    yield line.strip()
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    """Entry point of `opengpts-export`
+
+    Args:
+        argv (Optional[list[str]], optional): \
+            arguments. Defaults to None (sys.argv).
+    """
+    args = parse_args(argv)
+    if len(args.user_id) == 0 and args.user_ids_file is None:
+        raise SystemExit("--user-id or --user-ids-file is required")
+    if args.output == "-" and args.checkpoint is not None:
+        raise SystemExit("--checkpoint cannot be used with --output -")
+
+    writer: RecordWriter = (
+        ParquetWriter(args.output)
+        if args.format == "parquet"
+        else NDJSONWriter(args.output)
+    )
+    # no response cache: every thread is read once
+    pool = OpenGPTsClientPool(pool_maxsize=max(args.concurrency, 1))
+    exporter = ThreadExporter(
+        writer,
+        checkpoint=(
+            None
+            if args.checkpoint is None
+            else ExportCheckpoint(args.checkpoint)
+        ),
+        concurrency=args.concurrency,
+        commit_every=args.commit_every,
+        resume=not args.restart,
+    )
+    try:
+        with exporter:
+            for user_id in _user_ids(args):
+                exporter.export(pool.client(args.url, user_id))
+    finally:
+        pool.close()
+        sys.stderr.write(exporter.stats.model_dump_json() + "\n")
+
+
+if __name__ == "__main__":
+    main()
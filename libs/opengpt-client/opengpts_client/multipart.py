@@ -0,0 +1,145 @@
+"""Streaming multipart body"""
+
+import mimetypes
+import uuid
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Union
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+ProgressCallback = Callable[[int, int], None]
+"""called with (sent bytes, total bytes)"""
+
+
+def _quote(value: str) -> str:
+    """Escape a Content-Disposition parameter value
+
+    Quotes and line breaks are percent-encoded as browsers do (RFC 7578
+    section 4.2), so a filename cannot end the quoted string or inject
+    headers.
+
+    Args:
+        value (str): field name or filename
+
+    Returns:
+        str: value safe inside double quotes
+    """
+    return value.replace("\r", "%0D").replace("\n", "%0A").replace('"', "%22")
+
+
+class MultipartBody:
+    """multipart/form-data body streamed from disk
+
+    Unlike `requests`' `files=` argument the files are never loaded into
+    memory; they are read chunk by chunk while the request is sent. The
+    total length is known up front, so no chunked encoding is needed.
+    """
+
+    def __init__(
+        self,
+        fields: dict[str, str],
+        files: list[Path],
+        file_field: str = "files",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress: Optional[ProgressCallback] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            fields (dict[str, str]): form fields
+            files (list[Path]): filepath list
+            file_field (str, optional): \
+                form field name of the files. Defaults to "files".
+            chunk_size (int, optional): \
+                read size. Defaults to DEFAULT_CHUNK_SIZE.
+            progress (Optional[ProgressCallback], optional): \
+                upload progress callback. Defaults to None.
+        """
+        self.boundary = uuid.uuid4().hex
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self._parts: list[Union[bytes, Path]] = []
+
+        for name, value in fields.items():
+            self._parts.append(
+                self._part_header(name) + value.encode("utf-8") + b"\r\n",
+            )
+        for file in files:
+            content_type = (
+                mimetypes.guess_type(file)[0] or "application/octet-stream"
+            )
+            self._parts.append(
+                self._part_header(file_field, file.name, content_type),
+            )
+            self._parts.append(file)
+            self._parts.append(b"\r\n")
+        self._parts.append(f"--{self.boundary}--\r\n".encode())
+
+    def _part_header(
+        self,
+        name: str,
+        filename: Optional[str] = None,
+        content_type: Optional[str] = None,
+    ) -> bytes:
+        """Part header
+
+        Args:
+            name (str): field name
+            filename (Optional[str], optional): filename. Defaults to None.
+            content_type (Optional[str], optional): \
+                content type of the part. Defaults to None.
+
+        Returns:
+            bytes: part header
+        """
+        disposition = f'form-data; name="{_quote(name)}"'
+        if filename is not None:
+            disposition += f'; filename="{_quote(filename)}"'
+        header = (
+            f"--{self.boundary}\r\n" f"Content-Disposition: {disposition}\r\n"
+        )
+        if content_type is not None:
+            header += f"Content-Type: {content_type}\r\n"
+        return (header + "\r\n").encode("utf-8")
+
+    @property
+    def content_type(self) -> str:
+        """Content-Type header value
+
+        Returns:
+            str: content type
+        """
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self) -> int:
+        """Body length
+
+        Returns:
+            int: bytes
+        """
+        return sum(
+            part.stat().st_size if isinstance(part, Path) else len(part)
+            for part in self._parts
+        )
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Body chunks
+
+        Yields:
+            Iterator[bytes]: chunk
+        """
+        total = len(self)
+        sent = 0
+        for part in self._parts:
+            if isinstance(part, bytes):
+                sent += len(part)
+                yield part
+                continue
+            with part.open("rb") as f:
+                while chunk := f.read(self.chunk_size):
+                    sent += len(chunk)
+                    yield chunk
+                    if self.progress is not None:
+                        self.progress(sent, total)
+        if self.progress is not None:
+            self.progress(sent, total)
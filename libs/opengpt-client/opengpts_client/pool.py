@@ -0,0 +1,186 @@
+"""OpenGPTs client pool"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Optional, Union
+
+import requests
+
+from opengpts_client.balancer import LoadBalancer
+from opengpts_client.cache import CacheBackend, CacheTTL
+from opengpts_client.client import OpenGPTsClient
+from opengpts_client.compression import CompressionConfig
+from opengpts_client.scheduler import RequestScheduler
+from opengpts_client.session import (
+    DEFAULT_POOL_CONNECTIONS,
+    DEFAULT_POOL_MAXSIZE,
+    create_session,
+)
+from opengpts_client.tracing import Tracer
+
+DEFAULT_MAX_CLIENTS = 1024
+
+
+class OpenGPTsClientPool:
+    """Factory of per-identity clients sharing one transport per backend
+
+    `client()` returns lightweight `OpenGPTsClient` views which hold only the
+    identity; connections live in one pooled session per backend URL.
+    Views are kept in a bounded LRU so memory stays flat with many users.
+    When a backend url list is given, all views of the list share one
+    `LoadBalancer` so outstanding requests are counted across identities.
+    """
+
+    def __init__(
+        self,
+        pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+        pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+        max_clients: int = DEFAULT_MAX_CLIENTS,
+        compression: Optional[CompressionConfig] = None,
+        thread_affinity: bool = False,
+        scheduler: Optional[RequestScheduler] = None,
+        cache: Optional[CacheBackend] = None,
+        cache_ttl: Optional[CacheTTL] = None,
+        tracer: Optional[Tracer] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            pool_connections (int, optional): \
+                number of host pools. Defaults to DEFAULT_POOL_CONNECTIONS.
+            pool_maxsize (int, optional): \
+                connections per host. Defaults to DEFAULT_POOL_MAXSIZE.
+            max_clients (int, optional): \
+                max cached identity views. Defaults to DEFAULT_MAX_CLIENTS.
+            compression (Optional[CompressionConfig], optional): \
+                compression setting of every view. Defaults to None.
+            thread_affinity (bool, optional): \
+                route all requests of a thread to the same backend. \
+                Defaults to False.
+            scheduler (Optional[RequestScheduler], optional): \
+                rate limiter / priority queue shared by every view. \
+                Defaults to None.
+            cache (Optional[CacheBackend], optional): \
+                response cache shared by every view (keys are per user). \
+                Defaults to None.
+            cache_ttl (Optional[CacheTTL], optional): \
+                TTL per resource. Defaults to None.
+            tracer (Optional[Tracer], optional): tracer of every view. \
+                Defaults to None (the process-wide tracer).
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.max_clients = max_clients
+        self.compression = compression or CompressionConfig()
+        self.thread_affinity = thread_affinity
+        self.scheduler = scheduler
+        self.cache = cache
+        self.cache_ttl = cache_ttl
+        self.tracer = tracer
+        self._lock = threading.Lock()
+        self._sessions: dict[str, requests.Session] = {}
+        self._balancers: dict[tuple[str, ...], LoadBalancer] = {}
+        self._clients: OrderedDict[
+            tuple[tuple[str, ...], str],
+            OpenGPTsClient,
+        ] = OrderedDict()
+
+    def session(self, url: str) -> requests.Session:
+        """Get the pooled session of a backend
+
+        Args:
+            url (str): backend url
+
+        Returns:
+            requests.Session: session
+        """
+        with self._lock:
+            if url not in self._sessions:
+                self._sessions[url] = create_session(
+                    pool_connections=self.pool_connections,
+                    pool_maxsize=self.pool_maxsize,
+                )
+            return self._sessions[url]
+
+    def balancer(self, urls: list[str]) -> LoadBalancer:
+        """Get the shared load balancer of a backend url list
+
+        Args:
+            urls (list[str]): backend urls
+
+        Returns:
+            LoadBalancer: load balancer
+        """
+        key = tuple(urls)
+        session = self.session(",".join(key))
+        with self._lock:
+            if key not in self._balancers:
+                self._balancers[key] = LoadBalancer(urls, session=session)
+            return self._balancers[key]
+
+    def client(
+        self,
+        url: Union[str, list[str]],
+        opengpts_user_id: str,
+    ) -> OpenGPTsClient:
+        """Get a client view for an identity
+
+        Args:
+            url (Union[str, list[str]]): backend url or backend url list
+            opengpts_user_id (str): opengpts_user_id
+
+        Returns:
+            OpenGPTsClient: client sharing the pooled session
+        """
+        urls = [url] if isinstance(url, str) else list(url)
+        key = (tuple(urls), opengpts_user_id)
+        with self._lock:
+            client = self._clients.get(key)
+            if client is not None:
+                self._clients.move_to_end(key)
+                return client
+
+        client = OpenGPTsClient(
+            url=urls,
+            opengpts_user_id=opengpts_user_id,
+            compression=self.compression,
+            session=self.session(",".join(urls)),
+            balancer=self.balancer(urls) if len(urls) > 1 else None,
+            thread_affinity=self.thread_affinity,
+            scheduler=self.scheduler,
+            cache=self.cache,
+            cache_ttl=self.cache_ttl,
+            tracer=self.tracer,
+        )
+        with self._lock:
+            client = self._clients.setdefault(key, client)
+            self._clients.move_to_end(key)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        return client
+
+    def metrics(self) -> dict[str, Any]:
+        """Balancing metrics of every backend url list
+
+        Returns:
+            dict[str, Any]: metrics keyed by comma separated backend urls
+        """
+        with self._lock:
+            balancers = dict(self._balancers)
+        return {
+            ",".join(urls): balancer.metrics()
+            for urls, balancer in balancers.items()
+        }
+
+    def close(self) -> None:
+        """Close all pooled sessions and balancers"""
+        with self._lock:
+            sessions = list(self._sessions.values())
+            balancers = list(self._balancers.values())
+            self._sessions.clear()
+            self._balancers.clear()
+            self._clients.clear()
+        for balancer in balancers:
+            balancer.close()
+        for session in sessions:
+            session.close()
@@ -0,0 +1,185 @@
+"""Background prefetching of stream events"""
+
+import contextvars
+import threading
+from collections import deque
+from logging import getLogger
+from typing import Any, Callable, Generic, Iterator, Literal, Optional, TypeVar
+
+logger = getLogger(__name__)
+
+T = TypeVar("T")
+
+PrefetchPolicy = Literal["all", "latest"]
+
+DEFAULT_PREFETCH_SIZE = 64
+JOIN_TIMEOUT = 5.0
+
+
+class _PrefetchBuffer(Generic[T]):
+    """Buffer shared by the reader thread and the consumer"""
+
+    def __init__(
+        self,
+        source: Iterator[T],
+        policy: PrefetchPolicy,
+        maxsize: int,
+        on_close: Optional[Callable[[], None]],
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            source (Iterator[T]): source iterator
+            policy (PrefetchPolicy): buffering policy
+            maxsize (int): max buffered items
+            on_close (Optional[Callable[[], None]]): unblocks the reader
+        """
+        self.source = source
+        self.policy = policy
+        self.maxsize = 1 if policy == "latest" else max(1, maxsize)
+        self.on_close = on_close
+        self.items: deque[T] = deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        self.done = False
+        self.closed = False
+        self.error: Optional[BaseException] = None
+
+    def read(self) -> None:
+        """Read the source into the buffer (reader thread)"""
+        try:
+            for item in self.source:
+                with self.condition:
+                    if self.policy == "latest":
+                        self.dropped += len(self.items)
+                        self.items.clear()
+                    while len(self.items) >= self.maxsize and not self.closed:
+                        self.condition.wait()
+                    if self.closed:
+                        break
+                    self.items.append(item)
+                    self.condition.notify_all()
+        except BaseException as e:  # noqa: B036
+            with self.condition:
+                if not self.closed:
+                    self.error = e
+        finally:
+            close = getattr(self.source, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception:
+                    logger.debug("failed to close prefetch source")
+            with self.condition:
+                self.done = True
+                self.condition.notify_all()
+
+    def close(self) -> None:
+        """Stop the reader"""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.items.clear()
+            done = self.done
+            self.condition.notify_all()
+        if not done and self.on_close is not None:
+            self.on_close()
+
+
+class PrefetchingIterator(Generic[T]):
+    """Iterate a source on a background thread through a bounded buffer
+
+    With the "all" policy every item is delivered and the reader blocks
+    when `maxsize` items are buffered. With the "latest" policy only the
+    newest unread item is kept, which suits run streams where every event
+    carries the whole message list.
+
+    Call `close()` (or use it as a context manager) when stopping early;
+    it unblocks the reader via `on_close` and joins the thread. An iterator
+    dropped without closing is closed when garbage collected.
+    """
+
+    def __init__(
+        self,
+        source: Iterator[T],
+        policy: PrefetchPolicy = "all",
+        maxsize: int = DEFAULT_PREFETCH_SIZE,
+        on_close: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            source (Iterator[T]): source iterator (e.g. run stream)
+            policy (PrefetchPolicy, optional): \
+                buffering policy. Defaults to "all".
+            maxsize (int, optional): \
+                max buffered items. Defaults to DEFAULT_PREFETCH_SIZE.
+            on_close (Optional[Callable[[], None]], optional): called on \
+                early close to unblock the reader, e.g. closing the \
+                response. Defaults to None.
+        """
+        self._buffer = _PrefetchBuffer(source, policy, maxsize, on_close)
+        # the thread only references the buffer, so this iterator can be
+        # garbage collected (and closed) while the reader is running
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(
+            target=context.run,
+            args=(self._buffer.read,),
+            name="opengpts-prefetch",
+            daemon=True,
+        )
+        self._thread.start()
+
+    @property
+    def dropped(self) -> int:
+        """Items skipped by the "latest" policy
+
+        Returns:
+            int: dropped item count
+        """
+        return self._buffer.dropped
+
+    def __iter__(self) -> "PrefetchingIterator[T]":
+        """Iterator"""
+        return self
+
+    def __next__(self) -> T:
+        """Next buffered item
+
+        Raises:
+            StopIteration: source exhausted or closed
+
+        Returns:
+            T: item
+        """
+        buffer = self._buffer
+        with buffer.condition:
+            while not buffer.items and not buffer.done:
+                buffer.condition.wait()
+            if buffer.items:
+                item = buffer.items.popleft()
+                buffer.condition.notify_all()
+                return item
+            if buffer.error is not None:
+                error, buffer.error = buffer.error, None
+                raise error
+            raise StopIteration
+
+    def close(self) -> None:
+        """Stop reading and release the source"""
+        self._buffer.close()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout=JOIN_TIMEOUT)
+
+    def __enter__(self) -> "PrefetchingIterator[T]":
+        """Enter context"""
+        return self
+
+    def __exit__(self, *args: Any) -> None:
+        """Exit context"""
+        self.close()
+
+    def __del__(self) -> None:
+        """Close on garbage collection"""
+        self._buffer.close()
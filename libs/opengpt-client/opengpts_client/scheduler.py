@@ -0,0 +1,350 @@
+"""Client-side request scheduling"""
+
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from enum import IntEnum
+from typing import Any, Iterator, Literal, Optional
+
+EndpointClass = Literal["runs", "reads", "ingest"]
+
+DEFAULT_RATES: dict[str, tuple[float, float]] = {
+    "runs": (2.0, 10.0),
+    "reads": (20.0, 50.0),
+    "ingest": (0.5, 2.0),
+}
+"""(tokens per second, bucket capacity) per endpoint class"""
+
+DEFAULT_MAX_CONCURRENCY = 8
+DEFAULT_MAX_QUEUE = 64
+DEFAULT_QUEUE_TIMEOUT = 60.0
+DEFAULT_BATCH_RESERVE = 0.2
+MAX_BACKOFF = 5.0
+
+
+class Priority(IntEnum):
+    """Request priority (lower value is served first)"""
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+_priority: ContextVar[Optional[Priority]] = ContextVar(
+    "opengpts_priority",
+    default=None,
+)
+
+
+@contextmanager
+def scheduling_priority(priority: Priority) -> Iterator[None]:
+    """Set the priority of calls made in this context
+
+    Args:
+        priority (Priority): priority
+
+    Yields:
+        Iterator[None]: context
+    """
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority(default: Priority = Priority.INTERACTIVE) -> Priority:
+    """Priority of the current context
+
+    Args:
+        default (Priority, optional): \
+            priority outside of `scheduling_priority`. \
+            Defaults to Priority.INTERACTIVE.
+
+    Returns:
+        Priority: priority
+    """
+    priority = _priority.get()
+    return default if priority is None else priority
+
+
+class RateLimitExceeded(Exception):
+    """Request could not be scheduled in time"""
+
+
+class TokenBucket:
+    """Thread-safe token bucket"""
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        """コンストラクタ
+
+        Args:
+            rate (float): tokens added per second
+            capacity (float): max tokens
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def tokens(self) -> float:
+        """Available tokens
+
+        Returns:
+            float: tokens
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+    def _refill(self, now: float) -> None:
+        """Refill tokens (lock held)
+
+        Args:
+            now (float): monotonic time
+        """
+        elapsed = max(0.0, now - self._updated_at)
+        self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+        self._updated_at = now
+
+    def try_acquire(self, reserve: float = 0.0) -> float:
+        """Take one token
+
+        Args:
+            reserve (float, optional): \
+                tokens that must remain after taking one. Defaults to 0.0.
+
+        Returns:
+            float: 0 if a token was taken, else seconds to wait
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._refill(now)
+            if self._tokens - 1 >= reserve:
+                self._tokens -= 1
+                return 0.0
+            return (1 + reserve - self._tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Stop handing out tokens, e.g. after a 429 response
+
+        Args:
+            seconds (float): pause duration
+        """
+        with self._lock:
+            self._paused_until = max(
+                self._paused_until,
+                time.monotonic() + seconds,
+            )
+            self._tokens = 0.0
+
+
+class RequestScheduler:
+    """Token-bucket rate limits and a priority queue shared by clients
+
+    Every call takes a token of its endpoint class and then waits for one of
+    `max_concurrency` slots in a bounded priority queue, so interactive
+    calls are always admitted before queued batch work. Batch calls may
+    only take a token while `batch_reserve` of the bucket stays available
+    for interactive calls, and back off with jitter instead of failing.
+    """
+
+    def __init__(
+        self,
+        rates: Optional[dict[str, tuple[float, float]]] = None,
+        max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+        batch_reserve: float = DEFAULT_BATCH_RESERVE,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            rates (Optional[dict[str, tuple[float, float]]], optional): \
+                (tokens per second, capacity) per endpoint class. \
+                Defaults to None (DEFAULT_RATES).
+            max_concurrency (int, optional): \
+                max requests in flight. Defaults to DEFAULT_MAX_CONCURRENCY.
+            max_queue (int, optional): \
+                max waiting requests. Defaults to DEFAULT_MAX_QUEUE.
+            queue_timeout (float, optional): max seconds to wait before \
+                `RateLimitExceeded`. Defaults to DEFAULT_QUEUE_TIMEOUT.
+            batch_reserve (float, optional): fraction of each bucket \
+                reserved for interactive calls. \
+                Defaults to DEFAULT_BATCH_RESERVE.
+        """
+        self.buckets = {
+            endpoint_class: TokenBucket(rate=rate, capacity=capacity)
+            for endpoint_class, (rate, capacity) in (
+                rates or DEFAULT_RATES
+            ).items()
+        }
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.batch_reserve = batch_reserve
+        self._condition = threading.Condition()
+        self._queue: list[tuple[int, int]] = []
+        self._counter = itertools.count()
+        self._active = 0
+        self._throttled = 0
+        self._rejected = 0
+
+    @contextmanager
+    def slot(
+        self,
+        endpoint_class: EndpointClass,
+        priority: Priority = Priority.INTERACTIVE,
+    ) -> Iterator[None]:
+        """Wait for a token and a concurrency slot
+
+        Args:
+            endpoint_class (EndpointClass): endpoint class
+            priority (Priority, optional): \
+                priority. Defaults to Priority.INTERACTIVE.
+
+        Raises:
+            RateLimitExceeded: not scheduled within `queue_timeout`
+
+        Yields:
+            Iterator[None]: context holding the slot
+        """
+        deadline = time.monotonic() + self.queue_timeout
+        self._take_token(endpoint_class, priority, deadline)
+        ticket = self._enqueue(priority, deadline)
+        try:
+            with self._condition:
+                while self._active >= self.max_concurrency or (
+                    self._queue[0] != ticket
+                ):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._rejected += 1
+                        raise RateLimitExceeded(
+                            f"{endpoint_class} request was not scheduled",
+                        )
+                    self._condition.wait(remaining)
+                heapq.heappop(self._queue)
+                self._active += 1
+                self._condition.notify_all()
+        except BaseException:
+            with self._condition:
+                if ticket in self._queue:
+                    self._queue.remove(ticket)
+                    heapq.heapify(self._queue)
+                self._condition.notify_all()
+            raise
+
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._condition.notify_all()
+
+    def _take_token(
+        self,
+        endpoint_class: EndpointClass,
+        priority: Priority,
+        deadline: float,
+    ) -> None:
+        """Take a token, backing off while the bucket is empty
+
+        Args:
+            endpoint_class (EndpointClass): endpoint class
+            priority (Priority): priority
+            deadline (float): monotonic deadline
+
+        Raises:
+            RateLimitExceeded: no token before the deadline
+        """
+        bucket = self.buckets.get(endpoint_class)
+        if bucket is None:
+            return
+        reserve = (
+            bucket.capacity * self.batch_reserve
+            if priority == Priority.BATCH
+            else 0.0
+        )
+        while (wait := bucket.try_acquire(reserve=reserve)) > 0:
+            with self._condition:
+                self._throttled += 1
+            if time.monotonic() + wait > deadline:
+                with self._condition:
+                    self._rejected += 1
+                raise RateLimitExceeded(f"{endpoint_class} rate limit")
+            # jitter spreads batch callers so they do not retry in lockstep
+            if priority == Priority.BATCH:
+                wait *= 1 + random.random()  # noqa: S311
+            time.sleep(min(wait, MAX_BACKOFF))
+
+    def _enqueue(self, priority: Priority, deadline: float) -> tuple[int, int]:
+        """Put a ticket into the bounded priority queue
+
+        Args:
+            priority (Priority): priority
+            deadline (float): monotonic deadline
+
+        Raises:
+            RateLimitExceeded: queue stayed full until the deadline
+
+        Returns:
+            tuple[int, int]: ticket
+        """
+        ticket = (int(priority), next(self._counter))
+        backoff = 0.05
+        while True:
+            with self._condition:
+                if len(self._queue) < self.max_queue:
+                    heapq.heappush(self._queue, ticket)
+                    return ticket
+                self._throttled += 1
+            if time.monotonic() + backoff > deadline:
+                with self._condition:
+                    self._rejected += 1
+                raise RateLimitExceeded("request queue is full")
+            time.sleep(backoff * (1 + random.random()))  # noqa: S311
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def penalize(self, endpoint_class: EndpointClass, seconds: float) -> None:
+        """Pause an endpoint class after the backend answered 429
+
+        Args:
+            endpoint_class (EndpointClass): endpoint class
+            seconds (float): pause duration
+        """
+        bucket = self.buckets.get(endpoint_class)
+        if bucket is not None:
+            bucket.pause(seconds)
+
+    def metrics(self) -> dict[str, Any]:
+        """Scheduling metrics
+
+        Returns:
+            dict[str, Any]: metrics
+        """
+        with self._condition:
+            waiting = {
+                priority.name.lower(): sum(
+                    1 for p, _ in self._queue if p == priority
+                )
+                for priority in Priority
+            }
+            return {
+                "active": self._active,
+                "waiting": waiting,
+                "throttled": self._throttled,
+                "rejected": self._rejected,
+                "tokens": {
+                    endpoint_class: round(bucket.tokens, 3)
+                    for endpoint_class, bucket in self.buckets.items()
+                },
+            }
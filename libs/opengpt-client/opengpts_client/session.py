@@ -0,0 +1,39 @@
+"""HTTP session"""
+
+from http.cookiejar import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_POOL_CONNECTIONS = 10
+DEFAULT_POOL_MAXSIZE = 32
+
+
+def create_session(
+    pool_connections: int = DEFAULT_POOL_CONNECTIONS,
+    pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+) -> requests.Session:
+    """Create a keep-alive session shareable across identities
+
+    The cookie jar rejects every cookie, so the `opengpts_user_id` cookie
+    is only ever applied per request by `OpenGPTsClient.headers` and one
+    identity can never leak into another.
+
+    Args:
+        pool_connections (int, optional): \
+            number of host pools. Defaults to DEFAULT_POOL_CONNECTIONS.
+        pool_maxsize (int, optional): \
+            connections per host. Defaults to DEFAULT_POOL_MAXSIZE.
+
+    Returns:
+        requests.Session: session
+    """
+    session = requests.Session()
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    adapter = HTTPAdapter(
+        pool_connections=pool_connections,
+        pool_maxsize=pool_maxsize,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
@@ -0,0 +1,473 @@
+"""Tracing with W3C trace context propagation"""
+
+import re
+import secrets
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import IO, Any, Iterator, Optional, Protocol, Union
+
+import orjson
+from pydantic import BaseModel, Field
+
+TRACEPARENT_HEADER = "traceparent"
+
+_TRACEPARENT = re.compile(
+    r"^00-(?P<trace_id>[0-9a-f]{32})-(?P<span_id>[0-9a-f]{16})"
+    r"-(?P<flags>[0-9a-f]{2})$",
+)
+
+
+class SpanContext(BaseModel):
+    """Identity of a span shared across processes"""
+
+    trace_id: str = Field(..., title="32 hex digit trace id")
+    span_id: str = Field(..., title="16 hex digit span id")
+    sampled: bool = Field(True, title="sampled flag")
+
+    @property
+    def traceparent(self) -> str:
+        """W3C traceparent header value
+
+        Returns:
+            str: header value
+        """
+        flags = "01" if self.sampled else "00"
+        return f"00-{self.trace_id}-{self.span_id}-{flags}"
+
+
+class Span:
+    """Timed operation of a trace"""
+
+    def __init__(
+        self,
+        name: str,
+        parent: Optional[SpanContext] = None,
+        attributes: Optional[dict[str, Any]] = None,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            name (str): operation name
+            parent (Optional[SpanContext], optional): \
+                parent span. Defaults to None (starts a new trace).
+            attributes (Optional[dict[str, Any]], optional): \
+                attributes. Defaults to None.
+        """
+        self.name = name
+        self.context = SpanContext(
+            trace_id=(
+                secrets.token_hex(16) if parent is None else parent.trace_id
+            ),
+            span_id=secrets.token_hex(8),
+            sampled=True if parent is None else parent.sampled,
+        )
+        self.parent_id = None if parent is None else parent.span_id
+        self.attributes: dict[str, Any] = dict(attributes or {})
+        self.events: list[dict[str, Any]] = []
+        self.status = "ok"
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self._started_at = time.perf_counter()
+        self.duration: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        """Set an attribute
+
+        Args:
+            key (str): key
+            value (Any): JSON-compatible value
+        """
+        self.attributes[key] = value
+
+    def elapsed(self) -> float:
+        """Seconds since the span started
+
+        Returns:
+            float: seconds
+        """
+        return time.perf_counter() - self._started_at
+
+    def add_event(
+        self,
+        name: str,
+        elapsed: Optional[float] = None,
+        **attributes: Any,
+    ) -> None:
+        """Record a point in time of the span
+
+        Args:
+            name (str): event name
+            elapsed (Optional[float], optional): seconds since the span \
+                started. Defaults to None (now).
+            **attributes (Any): event attributes
+        """
+        self.events.append(
+            {
+                "name": name,
+                "elapsed_ms": round(
+                    (self.elapsed() if elapsed is None else elapsed) * 1000,
+                    3,
+                ),
+                **attributes,
+            },
+        )
+
+    def record_exception(self, error: BaseException) -> None:
+        """Mark the span failed
+
+        Args:
+            error (BaseException): exception
+        """
+        self.status = "error"
+        self.add_event(
+            "exception",
+            type=type(error).__name__,
+            message=str(error)[:500],
+        )
+
+    def end(self) -> bool:
+        """End the span
+
+        Returns:
+            bool: False if it had already ended
+        """
+        if self.duration is not None:
+            return False
+        self.duration = self.elapsed()
+        self.end_time = self.start_time + self.duration
+        return True
+
+    def to_dict(self) -> dict[str, Any]:
+        """Exported representation
+
+        Returns:
+            dict[str, Any]: span
+        """
+        return {
+            "name": self.name,
+            "trace_id": self.context.trace_id,
+            "span_id": self.context.span_id,
+            "parent_id": self.parent_id,
+            "start_time": self.start_time,
+            "duration_ms": (
+                None
+                if self.duration is None
+                else round(self.duration * 1000, 3)
+            ),
+            "status": self.status,
+            "attributes": self.attributes,
+            "events": self.events,
+        }
+
+
+class SpanExporter(ABC):
+    """Destination of ended spans"""
+
+    @abstractmethod
+    def export(self, span: dict[str, Any]) -> None:
+        """Export a span
+
+        Args:
+            span (dict[str, Any]): exported representation
+        """
+
+    def close(self) -> None:  # noqa: B027
+        """Release resources"""
+
+
+class ConsoleExporter(SpanExporter):
+    """Write one JSON line per span to a stream (stderr by default)"""
+
+    def __init__(self, stream: Optional[IO[str]] = None) -> None:
+        """コンストラクタ
+
+        Args:
+            stream (Optional[IO[str]], optional): \
+                text stream. Defaults to None (sys.stderr).
+        """
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def export(self, span: dict[str, Any]) -> None:
+        """Export a span
+
+        Args:
+            span (dict[str, Any]): exported representation
+        """
+        line = orjson.dumps(span, default=str).decode()
+        stream = self.stream or sys.stderr
+        with self._lock:
+            stream.write(line + "\n")
+            stream.flush()
+
+
+class FileExporter(SpanExporter):
+    """Append one JSON line per span to a file"""
+
+    def __init__(self, path: Union[str, Path]) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Union[str, Path]): JSON lines file
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = self.path.open("ab")
+        self._lock = threading.Lock()
+
+    def export(self, span: dict[str, Any]) -> None:
+        """Export a span
+
+        Args:
+            span (dict[str, Any]): exported representation
+        """
+        line = orjson.dumps(span, default=str) + b"\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        """Close the file"""
+        with self._lock:
+            self._file.close()
+
+
+def create_exporter(
+    kind: str,
+    path: Optional[Union[str, Path]] = None,
+) -> Optional[SpanExporter]:
+    """Create an exporter from a setting value
+
+    Args:
+        kind (str): "console", "file" or "none"
+        path (Optional[Union[str, Path]], optional): \
+            file of the "file" exporter. Defaults to None.
+
+    Raises:
+        ValueError: unknown kind or missing path
+
+    Returns:
+        Optional[SpanExporter]: exporter. None for "none"
+    """
+    if kind == "none":
+        return None
+    if kind == "console":
+        return ConsoleExporter()
+    if kind == "file":
+        if path is None:
+            raise ValueError("file exporter needs a path")
+        return FileExporter(path)
+    raise ValueError(f"unknown trace exporter: {kind}")
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar(
+    "opengpts_current_span",
+    default=None,
+)
+
+
+def current_span() -> Optional[Span]:
+    """Span of the current context
+
+    Returns:
+        Optional[Span]: span. None outside of any span
+    """
+    return _current_span.get()
+
+
+@contextmanager
+def use_span(span: Span) -> Iterator[Span]:
+    """Make a span current without ending it
+
+    Args:
+        span (Span): span
+
+    Yields:
+        Iterator[Span]: the span
+    """
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+class Tracer:
+    """Create spans and hand ended ones to an exporter
+
+    Without an exporter spans are still created, so trace context keeps
+    being propagated to OpenGPTs, but nothing is written.
+    """
+
+    def __init__(
+        self,
+        exporter: Optional[SpanExporter] = None,
+        service_name: str = "",
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            exporter (Optional[SpanExporter], optional): \
+                exporter. Defaults to None (spans are not exported).
+            service_name (str, optional): \
+                service attribute of every span. Defaults to "".
+        """
+        self.exporter = exporter
+        self.service_name = service_name
+
+    def start_span(
+        self,
+        name: str,
+        attributes: Optional[dict[str, Any]] = None,
+        parent: Optional[Union[Span, SpanContext]] = None,
+    ) -> Span:
+        """Start a span without making it current
+
+        Args:
+            name (str): operation name
+            attributes (Optional[dict[str, Any]], optional): \
+                attributes. Defaults to None.
+            parent (Optional[Union[Span, SpanContext]], optional): \
+                parent. Defaults to None (the current span).
+
+        Returns:
+            Span: span, ended by `finish`
+        """
+        if parent is None:
+            parent = current_span()
+        return Span(
+            name,
+            parent=parent.context if isinstance(parent, Span) else parent,
+            attributes=attributes,
+        )
+
+    def finish(self, span: Span) -> None:
+        """End and export a span
+
+        Args:
+            span (Span): span
+        """
+        if not span.end() or self.exporter is None:
+            return
+        if not span.context.sampled:
+            return
+        exported = span.to_dict()
+        if self.service_name:
+            exported["service"] = self.service_name
+        self.exporter.export(exported)
+
+    @contextmanager
+    def span(
+        self,
+        name: str,
+        attributes: Optional[dict[str, Any]] = None,
+        parent: Optional[Union[Span, SpanContext]] = None,
+    ) -> Iterator[Span]:
+        """Run a block in a new current span
+
+        Exceptions mark the span failed; control flow exceptions deriving
+        from BaseException (e.g. Streamlit reruns) do not.
+
+        Args:
+            name (str): operation name
+            attributes (Optional[dict[str, Any]], optional): \
+                attributes. Defaults to None.
+            parent (Optional[Union[Span, SpanContext]], optional): \
+                parent. Defaults to None (the current span).
+
+        Yields:
+            Iterator[Span]: span
+        """
+        span = self.start_span(name, attributes=attributes, parent=parent)
+        try:
+            with use_span(span):
+                yield span
+        except Exception as e:
+            span.record_exception(e)
+            raise
+        finally:
+            self.finish(span)
+
+    def close(self) -> None:
+        """Close the exporter"""
+        if self.exporter is not None:
+            self.exporter.close()
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """Process-wide tracer
+
+    Returns:
+        Tracer: tracer
+    """
+    return _tracer
+
+
+def set_tracer(tracer: Tracer) -> None:
+    """Replace the process-wide tracer
+
+    Args:
+        tracer (Tracer): tracer
+    """
+    global _tracer
+    _tracer = tracer
+
+
+def inject(headers: dict[str, str]) -> dict[str, str]:
+    """Add the traceparent of the current span to request headers
+
+    Args:
+        headers (dict[str, str]): headers to update
+
+    Returns:
+        dict[str, str]: the headers
+    """
+    span = current_span()
+    if span is not None:
+        headers[TRACEPARENT_HEADER] = span.context.traceparent
+    return headers
+
+
+class HeaderLookup(Protocol):
+    """Headers or a mapping, e.g. a dict or werkzeug `Headers`"""
+
+    def get(self, key: str, /) -> Any:
+        """Value of a key
+
+        Args:
+            key (str): key
+
+        Returns:
+            Any: value. None if missing
+        """
+
+
+def extract(headers: HeaderLookup) -> Optional[SpanContext]:
+    """Trace context of an incoming request
+
+    Args:
+        headers (HeaderLookup): request headers, or an event carrying \
+            a traceparent
+
+    Returns:
+        Optional[SpanContext]: parent. None if absent or malformed
+    """
+    value = headers.get(TRACEPARENT_HEADER)
+    if not isinstance(value, str):
+        return None
+    match = _TRACEPARENT.match(value.strip().lower())
+    if match is None or set(match["trace_id"]) == {"0"}:
+        return None
+    return SpanContext(
+        trace_id=match["trace_id"],
+        span_id=match["span_id"],
+        sampled=int(match["flags"], 16) & 1 == 1,
+    )
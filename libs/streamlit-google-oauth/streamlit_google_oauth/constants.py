@@ -18,3 +18,26 @@ ENVIRONMENT = os.getenv("ENV", "dev")
 GOOGLE_CLIENT_ID = os.environ.get("GOOGLE_CLIENT_ID")
 GOOGLE_CLIENT_SECRET = os.environ.get("GOOGLE_CLIENT_SECRET")
 REDIRECT_URI = os.environ.get("REDIRECT_URI")
+
+# login session
+SESSION_COOKIE_NAME = os.environ.get("SESSION_COOKIE_NAME", "oauth_session")
+SESSION_COOKIE_SECURE = (
+    os.environ.get("SESSION_COOKIE_SECURE", "true") == "true"
+)
+SESSION_TTL_DAYS = int(os.environ.get("SESSION_TTL_DAYS", "30"))
+# SQLite file of the login sessions. Put it on a private, persistent disk
+SESSION_STORE_PATH = os.environ.get("SESSION_STORE_PATH")
+# Fernet key encrypting the stored tokens (Fernet.generate_key())
+SESSION_ENCRYPTION_KEY = os.environ.get("SESSION_ENCRYPTION_KEY")
+# refresh access tokens this many seconds before they expire
+TOKEN_REFRESH_MARGIN = int(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+
+# ID token verification
+GOOGLE_JWKS_URI = os.environ.get(
+    "GOOGLE_JWKS_URI",
+    "https://www.googleapis.com/oauth2/v3/certs",
+)
+GOOGLE_ISSUERS = ["https://accounts.google.com", "accounts.google.com"]
+JWKS_CACHE_LIFESPAN = int(os.environ.get("JWKS_CACHE_LIFESPAN", "3600"))
+# seconds between JWKS fetches triggered by unknown key ids
+JWKS_REFETCH_COOLDOWN = int(os.environ.get("JWKS_REFETCH_COOLDOWN", "10"))
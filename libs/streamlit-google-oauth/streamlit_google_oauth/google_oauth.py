@@ -2,19 +2,47 @@
 
 # 参考 https://github.com/yagays/streamlit-google-oauth/blob/main/streamlit_google_oauth.py
 import asyncio
-from typing import Any, Callable, Optional, Union
+import secrets
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+from typing import Any, Callable, Coroutine, Literal, Optional, TypeVar, Union
 
 import streamlit as st
 from httpx_oauth.clients.google import GoogleOAuth2
 from httpx_oauth.oauth2 import OAuth2Token
+from streamlit_cookies_controller import CookieController
 
 from streamlit_google_oauth.constants import (
     ENVIRONMENT,
     GOOGLE_CLIENT_ID,
     GOOGLE_CLIENT_SECRET,
     REDIRECT_URI,
+    SESSION_COOKIE_NAME,
+    SESSION_COOKIE_SECURE,
+    SESSION_ENCRYPTION_KEY,
+    SESSION_STORE_PATH,
+    SESSION_TTL_DAYS,
+    TOKEN_REFRESH_MARGIN,
+)
+from streamlit_google_oauth.id_token import (
+    IDTokenVerifier,
+    InvalidIDTokenError,
 )
 from streamlit_google_oauth.message import get_login_message
+from streamlit_google_oauth.session_store import (
+    SessionStore,
+    SQLiteSessionStore,
+)
+
+T = TypeVar("T")
+
+OAUTH_TIMEOUT = 30
+SESSION_ID_KEY = "oauth_session_id"
+COOKIE_CONTROLLER_KEY = "oauth_cookie_controller"
+COOKIE_COMPONENT_KEY = "cookies"
+COOKIES_REPORTED_KEY = "oauth_cookies_reported"
 
 
 def verify_oauth2_setting() -> tuple[str, str, str]:
@@ -51,7 +79,7 @@ async def write_authorization_url(
     """
     authorization_url = await client.get_authorization_url(
         redirect_uri,
-        scope=["profile", "email"],
+        scope=["openid", "profile", "email"],
         extras_params={"access_type": "offline"},
     )
     return authorization_url
@@ -93,77 +121,491 @@ async def get_email(
     return user_id, user_email
 
 
+class _EventLoopThread:
+    """Event loop running on a daemon thread, reused by every rerun"""
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self.loop.run_forever,
+            name="google-oauth-loop",
+            daemon=True,
+        )
+        self._thread.start()
+
+    def submit(self, coro: Coroutine[Any, Any, T]) -> Future[T]:
+        """Schedule a coroutine on the loop
+
+        Args:
+            coro (Coroutine[Any, Any, T]): coroutine
+
+        Returns:
+            Future[T]: result
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+
+_loop_lock = threading.Lock()
+_loop: Optional[_EventLoopThread] = None
+
+
+def submit_async(coro: Coroutine[Any, Any, T]) -> Future[T]:
+    """Schedule a coroutine on the shared event loop
+
+    Args:
+        coro (Coroutine[Any, Any, T]): coroutine
+
+    Returns:
+        Future[T]: result
+    """
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = _EventLoopThread()
+    return _loop.submit(coro)
+
+
+def run_async(coro: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine on the shared event loop and wait for the result
+
+    Args:
+        coro (Coroutine[Any, Any, T]): coroutine
+
+    Returns:
+        T: result
+    """
+    return submit_async(coro).result(timeout=OAUTH_TIMEOUT)
+
+
+@st.cache_resource(show_spinner=False)
+def oauth_client() -> GoogleOAuth2:
+    """GoogleOAuth2 クライアント (プロセスで共有)
+
+    Returns:
+        GoogleOAuth2: GoogleOAuth2 クライアント
+    """
+    client_id, client_secret, _ = verify_oauth2_setting()
+    return GoogleOAuth2(client_id, client_secret)
+
+
+@st.cache_resource(show_spinner=False)
+def id_token_verifier() -> IDTokenVerifier:
+    """ID トークン検証 (JWKS をプロセスでキャッシュ)
+
+    Returns:
+        IDTokenVerifier: ID トークン検証
+    """
+    client_id, _, _ = verify_oauth2_setting()
+    return IDTokenVerifier(audience=client_id)
+
+
+def get_user(
+    client: GoogleOAuth2,
+    token: OAuth2Token,
+) -> tuple[str, Optional[str]]:
+    """ユーザーID、メールアドレス取得
+
+    ID トークンがあればローカルで検証してクレームから読み取り、
+    なければ Google の userinfo を呼び出す。
+
+    Args:
+        client (GoogleOAuth2): GoogleOAuth2 クライアント
+        token (OAuth2Token): トークン
+
+    Raises:
+        InvalidIDTokenError: ID トークンの検証に失敗
+
+    Returns:
+        tuple[str, Optional[str]]: ユーザーID、メールアドレス
+    """
+    id_token = token.get("id_token")
+    if id_token is None:
+        return run_async(get_email(client=client, token=token["access_token"]))
+
+    claims = id_token_verifier().verify(id_token)
+    return claims["sub"], claims.get("email")
+
+
+@st.cache_resource(show_spinner=False)
+def authorization_url() -> str:
+    """Authorization URL (プロセスで共有)
+
+    Returns:
+        str: Authorization URL
+    """
+    _, _, redirect_uri = verify_oauth2_setting()
+    return run_async(
+        write_authorization_url(
+            client=oauth_client(),
+            redirect_uri=redirect_uri,
+        ),
+    )
+
+
+def show_login_message(
+    login_type: Literal["initial", "retry", "expired"],
+) -> None:
+    """ログインメッセージ表示
+
+    Args:
+        login_type (Literal["initial", "retry", "expired"]): ログインタイプ
+    """
+    st.markdown(
+        get_login_message(authorization_url(), login_type=login_type),
+        unsafe_allow_html=True,
+    )
+
+
+_session_store_lock = threading.Lock()
+_session_store: Optional[SessionStore] = None
+_refreshing: dict[str, Future[OAuth2Token]] = {}
+_refreshing_lock = threading.Lock()
+
+
+def set_session_store(store: SessionStore) -> None:
+    """Replace the login session store (default: SQLiteSessionStore)
+
+    Args:
+        store (SessionStore): session store
+    """
+    global _session_store
+    with _session_store_lock:
+        _session_store = store
+
+
+def session_store() -> SessionStore:
+    """Login session store shared by the process
+
+    Raises:
+        ValueError: SESSION_STORE_PATH / SESSION_ENCRYPTION_KEY not set
+
+    Returns:
+        SessionStore: session store
+    """
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            if SESSION_STORE_PATH is None or SESSION_ENCRYPTION_KEY is None:
+                raise ValueError("session store setting error")
+            _session_store = SQLiteSessionStore(
+                SESSION_STORE_PATH,
+                SESSION_ENCRYPTION_KEY,
+            )
+        return _session_store
+
+
+def mount_cookie_controller() -> CookieController:
+    """Create the cookie controller of this script run
+
+    The controller is a component, so it must be created once per run;
+    google_oauth2_required does it before anything reads a cookie.
+
+    Returns:
+        CookieController: cookie controller
+    """
+    # the component state stays None until the browser reports its cookies
+    reported = st.session_state.get(COOKIE_COMPONENT_KEY) is not None
+    if not reported:
+        # render the component again instead of reading None
+        st.session_state.pop(COOKIE_COMPONENT_KEY, None)
+    st.session_state[COOKIES_REPORTED_KEY] = reported
+    controller = CookieController(key=COOKIE_COMPONENT_KEY)
+    st.session_state[COOKIE_CONTROLLER_KEY] = controller
+    return controller
+
+
+def cookies_reported() -> bool:
+    """Whether the browser cookies are known in this run
+
+    On the first run of a tab the component has not reported yet and
+    every cookie reads as missing; it reruns the script once it has.
+
+    Returns:
+        bool: reported or not
+    """
+    return bool(st.session_state.get(COOKIES_REPORTED_KEY, False))
+
+
+def cookie_controller() -> CookieController:
+    """Cookie controller shared by the login and the app in this run
+
+    Returns:
+        CookieController: cookie controller
+    """
+    controller: Optional[CookieController] = st.session_state.get(
+        COOKIE_CONTROLLER_KEY,
+    )
+    if controller is None:
+        return mount_cookie_controller()
+    return controller
+
+
+def save_session(session_id: str) -> None:
+    """Save the login of this Streamlit session to the store
+
+    Args:
+        session_id (str): session id
+    """
+    session_store().set(
+        session_id,
+        {
+            "token": dict(st.session_state["token"]),
+            "user_id": st.session_state.get("user_id"),
+            "user_email": st.session_state.get("user_email"),
+        },
+        ttl=SESSION_TTL_DAYS * 24 * 60 * 60,
+    )
+
+
+def start_session(
+    token: OAuth2Token,
+    user_id: str,
+    user_email: Optional[str],
+) -> None:
+    """Keep the login in session state, the store and a cookie
+
+    Args:
+        token (OAuth2Token): token
+        user_id (str): user id
+        user_email (Optional[str]): user email
+    """
+    session_id = secrets.token_urlsafe(32)
+    st.session_state["token"] = token
+    st.session_state.user_id = user_id
+    st.session_state.user_email = user_email
+    st.session_state[SESSION_ID_KEY] = session_id
+    save_session(session_id)
+    cookie_controller().set(
+        SESSION_COOKIE_NAME,
+        session_id,
+        expires=datetime.now() + timedelta(days=SESSION_TTL_DAYS),
+        secure=SESSION_COOKIE_SECURE,
+        same_site="lax",
+    )
+
+
+def restore_session() -> bool:
+    """Restore the login from the session cookie (new tab / reload)
+
+    Returns:
+        bool: restored or not
+    """
+    session_id = cookie_controller().get(SESSION_COOKIE_NAME)
+    if not isinstance(session_id, str):
+        return False
+    data = session_store().get(session_id)
+    if data is None:
+        return False
+    st.session_state["token"] = OAuth2Token(data["token"])
+    st.session_state.user_id = data["user_id"]
+    st.session_state.user_email = data["user_email"]
+    st.session_state[SESSION_ID_KEY] = session_id
+    return True
+
+
+def expires_soon(token: OAuth2Token) -> bool:
+    """Whether the token expires within TOKEN_REFRESH_MARGIN
+
+    Args:
+        token (OAuth2Token): token
+
+    Returns:
+        bool: expires soon or not
+    """
+    expires_at = token.get("expires_at")
+    return expires_at is not None and (
+        expires_at - TOKEN_REFRESH_MARGIN < time.time()
+    )
+
+
+async def refresh_access_token(
+    client: GoogleOAuth2,
+    token: OAuth2Token,
+) -> OAuth2Token:
+    """アクセストークン更新
+
+    Args:
+        client (GoogleOAuth2): GoogleOAuth2 クライアント
+        token (OAuth2Token): 更新前のトークン
+
+    Returns:
+        OAuth2Token: 更新後のトークン
+    """
+    refreshed = await client.refresh_token(token["refresh_token"])
+    # Google does not return the refresh token again. The old expiry is
+    # dropped so that it is recomputed from the new `expires_in`.
+    previous = {k: v for k, v in token.items() if k != "expires_at"}
+    return OAuth2Token({**previous, **refreshed})
+
+
+def schedule_refresh(
+    session_id: str,
+    token: OAuth2Token,
+) -> Future[OAuth2Token]:
+    """Refresh a token in the background, once per session
+
+    The refreshed token is saved to the store, so every tab and worker
+    process of the session picks it up.
+
+    Args:
+        session_id (str): session id
+        token (OAuth2Token): token
+
+    Returns:
+        Future[OAuth2Token]: refreshed token
+    """
+    data = {
+        "user_id": st.session_state.get("user_id"),
+        "user_email": st.session_state.get("user_email"),
+    }
+
+    def done(future: Future[OAuth2Token]) -> None:
+        with _refreshing_lock:
+            _refreshing.pop(session_id, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        session_store().set(
+            session_id,
+            {"token": dict(future.result()), **data},
+            ttl=SESSION_TTL_DAYS * 24 * 60 * 60,
+        )
+
+    with _refreshing_lock:
+        future = _refreshing.get(session_id)
+        if future is not None:
+            return future
+        future = submit_async(refresh_access_token(oauth_client(), token))
+        _refreshing[session_id] = future
+    # outside the lock: a finished future runs the callback immediately
+    future.add_done_callback(done)
+    return future
+
+
+def ensure_fresh_token() -> bool:
+    """Refresh the access token ahead of expiry
+
+    A token close to expiry is refreshed in the background while it is
+    still used; only an already expired token waits for the refresh.
+
+    Returns:
+        bool: the session holds a usable token or not
+    """
+    token: OAuth2Token = st.session_state["token"]
+    session_id = st.session_state.get(SESSION_ID_KEY)
+    if not expires_soon(token) or session_id is None:
+        return not token.is_expired()
+
+    # another tab or process may have refreshed it already
+    data = session_store().get(session_id)
+    if data is not None and not expires_soon(OAuth2Token(data["token"])):
+        st.session_state["token"] = OAuth2Token(data["token"])
+        return True
+    if "refresh_token" not in token:
+        return not token.is_expired()
+
+    future = schedule_refresh(session_id, token)
+    if not token.is_expired():
+        return True
+    try:
+        st.session_state["token"] = future.result(timeout=OAUTH_TIMEOUT)
+    except Exception:
+        return False
+    return True
+
+
+def logout() -> None:
+    """Drop the login of this browser"""
+    session_id = st.session_state.pop(SESSION_ID_KEY, None)
+    if session_id is not None:
+        session_store().delete(session_id)
+    controller = cookie_controller()
+    if controller.get(SESSION_COOKIE_NAME) is not None:
+        controller.remove(
+            SESSION_COOKIE_NAME,
+            secure=SESSION_COOKIE_SECURE,
+            same_site="lax",
+        )
+    st.session_state["token"] = None
+
+
+def login() -> bool:
+    """認可コードからログイン
+
+    認可コードは一度しか使えないため、交換後にクエリパラメータから消す。
+    リロードで同じコードを Google に送り直さない。
+
+    Returns:
+        bool: ログインできたかどうか
+    """
+    code = st.query_params.get("code")
+    if code is None:
+        show_login_message("initial")
+        return False
+    st.query_params.clear()
+
+    _, _, redirect_uri = verify_oauth2_setting()
+    client = oauth_client()
+    # Verify token is correct:
+    try:
+        token = run_async(
+            write_access_token(
+                client=client,
+                redirect_uri=redirect_uri,
+                code=code,
+            ),
+        )
+    except Exception:
+        show_login_message("retry")
+        return False
+
+    # Check if token has expired:
+    if token.is_expired():
+        show_login_message("expired")
+        return False
+
+    try:
+        user_id, user_email = get_user(client, token)
+    except InvalidIDTokenError:
+        show_login_message("retry")
+        return False
+    start_session(token, user_id, user_email)
+    return True
+
+
 def google_oauth2_required(func: Callable) -> Callable:
     """Google OAuth2.0認証デコーダー
 
+    ログイン済みの再実行では OAuth の処理を一切行わない。
+    ログインはクッキーのセッション ID でサーバー側ストアに保存され、
+    新しいタブやリロードでも Google へのリクエストなしで復元される。
+    アクセストークンは期限切れ前にリフレッシュトークンで更新する。
+    クッキーは cookie_controller() で読み書きすること。
+
     Args:
         func (Callable): 関数
     """
 
     def wrapper(*args: Any, **kwargs: Any) -> None:
         """デコーダー"""
+        mount_cookie_controller()
         # skip authorization if local environment variables are not set
         if ENVIRONMENT == "local":
             func(*args, **kwargs)
             return
 
-        client_id, client_secret, redirect_uri = verify_oauth2_setting()
-
-        client = GoogleOAuth2(client_id, client_secret)
-        authorization_url = asyncio.run(
-            write_authorization_url(client=client, redirect_uri=redirect_uri),
-        )
+        if st.session_state.get("token") is None and not restore_session():
+            # wait for the rerun with the browser cookies before logging in
+            if not cookies_reported():
+                return
+            if login():
+                func(*args, **kwargs)
+            return
 
-        if "token" not in st.session_state:
-            st.session_state.token = None
-
-        if st.session_state.token is None:
-            try:
-                code = st.query_params["code"]
-            except Exception:
-                login_message = get_login_message(
-                    authorization_url,
-                    login_type="initial",
-                )
-                st.markdown(login_message, unsafe_allow_html=True)
-            else:
-                # Verify token is correct:
-                try:
-                    token = asyncio.run(
-                        write_access_token(
-                            client=client,
-                            redirect_uri=redirect_uri,
-                            code=code,
-                        ),
-                    )
-                except Exception:
-                    retry_ms = get_login_message(
-                        authorization_url,
-                        login_type="retry",
-                    )
-                    st.markdown(retry_ms, unsafe_allow_html=True)
-                else:
-                    # Check if token has expired:
-                    if token.is_expired():
-                        st.markdown(
-                            get_login_message(
-                                authorization_url,
-                                login_type="expired",
-                            ),
-                            unsafe_allow_html=True,
-                        )
-                    else:
-                        st.session_state["token"] = token
-                        user_id, user_email = asyncio.run(
-                            get_email(
-                                client=client,
-                                token=token["access_token"],
-                            ),
-                        )
-                        st.session_state.user_id = user_id
-                        st.session_state.user_email = user_email
-                        func(*args, **kwargs)
-        else:
+        if ensure_fresh_token():
             func(*args, **kwargs)
+        else:
+            logout()
+            show_login_message("expired")
 
     return wrapper
@@ -0,0 +1,89 @@
+"""ID token verification"""
+
+from typing import Any, Optional
+
+import jwt
+
+from streamlit_google_oauth.constants import (
+    GOOGLE_ISSUERS,
+    GOOGLE_JWKS_URI,
+    JWKS_CACHE_LIFESPAN,
+    JWKS_REFETCH_COOLDOWN,
+)
+
+ID_TOKEN_ALGORITHMS = ["RS256"]
+ID_TOKEN_LEEWAY = 30
+
+
+class InvalidIDTokenError(Exception):
+    """ID token could not be verified"""
+
+
+class IDTokenVerifier:
+    """Verify ID tokens locally against a cached JWKS
+
+    The JWKS is fetched once and refreshed after `lifespan` seconds, or
+    earlier when a token is signed with an unknown key (key rotation).
+    Such refetches happen at most once per `refetch_cooldown` seconds, so
+    tokens with made-up key ids cannot flood the JWKS endpoint.
+    """
+
+    def __init__(
+        self,
+        audience: str,
+        jwks_uri: str = GOOGLE_JWKS_URI,
+        issuers: Optional[list[str]] = None,
+        lifespan: float = JWKS_CACHE_LIFESPAN,
+        refetch_cooldown: float = JWKS_REFETCH_COOLDOWN,
+    ) -> None:
+        """コンストラクタ
+
+        Args:
+            audience (str): OAuth client id
+            jwks_uri (str, optional): JWKS url. Defaults to GOOGLE_JWKS_URI.
+            issuers (Optional[list[str]], optional): \
+                accepted issuers. Defaults to None (GOOGLE_ISSUERS).
+            lifespan (float, optional): \
+                JWKS cache lifespan in seconds. \
+                Defaults to JWKS_CACHE_LIFESPAN.
+            refetch_cooldown (float, optional): \
+                min seconds between fetches for unknown key ids. \
+                Defaults to JWKS_REFETCH_COOLDOWN.
+        """
+        self.audience = audience
+        self.issuers = issuers or GOOGLE_ISSUERS
+        self.jwks_client = jwt.PyJWKClient(
+            jwks_uri,
+            cache_jwk_set=True,
+            lifespan=lifespan,
+            cooldown_duration=refetch_cooldown,
+        )
+
+    def verify(self, id_token: str) -> dict[str, Any]:
+        """Verify signature, audience, issuer and expiry of an ID token
+
+        Args:
+            id_token (str): ID token
+
+        Raises:
+            InvalidIDTokenError: verification failed
+
+        Returns:
+            dict[str, Any]: claims
+        """
+        try:
+            signing_key = self.jwks_client.get_signing_key_from_jwt(id_token)
+            claims: dict[str, Any] = jwt.decode(
+                id_token,
+                key=signing_key.key,
+                algorithms=ID_TOKEN_ALGORITHMS,
+                audience=self.audience,
+                leeway=ID_TOKEN_LEEWAY,
+                options={"require": ["iss", "sub", "aud", "exp", "iat"]},
+            )
+        except jwt.PyJWTError as e:
+            raise InvalidIDTokenError(str(e)) from e
+
+        if claims["iss"] not in self.issuers:
+            raise InvalidIDTokenError(f"invalid issuer: {claims['iss']}")
+        return claims
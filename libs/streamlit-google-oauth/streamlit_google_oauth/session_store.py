@@ -0,0 +1,164 @@
+"""login session store"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Optional, Union
+
+from cryptography.fernet import Fernet, InvalidToken
+
+SQLITE_TIMEOUT = 5.0
+SQLITE_FILE_MODE = 0o600
+
+
+def session_key(session_id: str) -> str:
+    """Store key of a session id
+
+    Only the hash is stored, so a leaked store does not leak cookies.
+
+    Args:
+        session_id (str): session id in the cookie
+
+    Returns:
+        str: store key
+    """
+    return hashlib.sha256(session_id.encode("utf-8")).hexdigest()
+
+
+class SessionStore(ABC):
+    """Server-side store of login sessions keyed by session id"""
+
+    @abstractmethod
+    def get(self, session_id: str) -> Optional[dict[str, Any]]:
+        """Get a session
+
+        Args:
+            session_id (str): session id
+
+        Returns:
+            Optional[dict[str, Any]]: session data. None if missing / expired
+        """
+
+    @abstractmethod
+    def set(self, session_id: str, data: dict[str, Any], ttl: float) -> None:
+        """Save a session
+
+        Args:
+            session_id (str): session id
+            data (dict[str, Any]): JSON-compatible session data
+            ttl (float): time to live in seconds
+        """
+
+    @abstractmethod
+    def delete(self, session_id: str) -> None:
+        """Delete a session
+
+        Args:
+            session_id (str): session id
+        """
+
+
+class SQLiteSessionStore(SessionStore):
+    """Session store in a local SQLite file shared by processes
+
+    Session data holds OAuth tokens, so it is encrypted with a Fernet key
+    and the file is readable by its owner only.
+    """
+
+    def __init__(self, path: Union[str, Path], key: Union[str, bytes]) -> None:
+        """コンストラクタ
+
+        Args:
+            path (Union[str, Path]): database file
+            key (Union[str, bytes]): Fernet key (Fernet.generate_key())
+        """
+        self.path = str(path)
+        self._fernet = Fernet(key)
+        self._local = threading.local()
+        Path(self.path).touch(mode=SQLITE_FILE_MODE, exist_ok=True)
+        Path(self.path).chmod(SQLITE_FILE_MODE)
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS oauth_sessions ("
+                "key TEXT PRIMARY KEY, data BLOB NOT NULL, "
+                "expires_at REAL NOT NULL)",
+            )
+            conn.execute(
+                "DELETE FROM oauth_sessions WHERE expires_at <= ?",
+                (time.time(),),
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        """Connection of the current thread
+
+        Returns:
+            sqlite3.Connection: connection
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+            self._local.conn = conn
+        return conn
+
+    def get(self, session_id: str) -> Optional[dict[str, Any]]:
+        """Get a session
+
+        Args:
+            session_id (str): session id
+
+        Returns:
+            Optional[dict[str, Any]]: session data. None if missing / expired
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT data FROM oauth_sessions "
+                "WHERE key = ? AND expires_at > ?",
+                (session_key(session_id), time.time()),
+            )
+            .fetchone()
+        )
+        if row is None:
+            return None
+        try:
+            data = self._fernet.decrypt(row[0])
+        except InvalidToken:
+            # written with another key, e.g. before a key rotation
+            return None
+        return dict(json.loads(data))
+
+    def set(self, session_id: str, data: dict[str, Any], ttl: float) -> None:
+        """Save a session
+
+        Args:
+            session_id (str): session id
+            data (dict[str, Any]): JSON-compatible session data
+            ttl (float): time to live in seconds
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO oauth_sessions "
+                "(key, data, expires_at) VALUES (?, ?, ?)",
+                (
+                    session_key(session_id),
+                    self._fernet.encrypt(json.dumps(data).encode("utf-8")),
+                    time.time() + ttl,
+                ),
+            )
+
+    def delete(self, session_id: str) -> None:
+        """Delete a session
+
+        Args:
+            session_id (str): session id
+        """
+        with self._connection() as conn:
+            conn.execute(
+                "DELETE FROM oauth_sessions WHERE key = ?",
+                (session_key(session_id),),
+            )
@@ -0,0 +1,378 @@
+"""google_oauth tests"""
+
+import asyncio
+import threading
+import time
+from typing import Any, Coroutine, Optional
+
+import pytest
+from httpx_oauth.oauth2 import OAuth2Token
+from streamlit.testing.v1 import AppTest
+
+from streamlit_google_oauth import google_oauth
+from streamlit_google_oauth.constants import (
+    SESSION_COOKIE_NAME,
+    TOKEN_REFRESH_MARGIN,
+)
+from streamlit_google_oauth.session_store import SessionStore
+
+AUTHORIZATION_URL = "https://accounts.google.com/o/oauth2/v2/auth"
+
+
+class MemorySessionStore(SessionStore):
+    """Session store in a dict"""
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self.sessions: dict[str, dict[str, Any]] = {}
+
+    def get(self, session_id: str) -> Optional[dict[str, Any]]:
+        """Get a session
+
+        Args:
+            session_id (str): session id
+
+        Returns:
+            Optional[dict[str, Any]]: session data
+        """
+        return self.sessions.get(session_id)
+
+    def set(self, session_id: str, data: dict[str, Any], ttl: float) -> None:
+        """Save a session
+
+        Args:
+            session_id (str): session id
+            data (dict[str, Any]): session data
+            ttl (float): ignored
+        """
+        self.sessions[session_id] = data
+
+    def delete(self, session_id: str) -> None:
+        """Delete a session
+
+        Args:
+            session_id (str): session id
+        """
+        self.sessions.pop(session_id, None)
+
+
+class FakeGoogle:
+    """GoogleOAuth2 stand-in counting code exchanges and refreshes"""
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self.exchanges = 0
+        self.refreshes = 0
+        self.fail = False
+        self.release = threading.Event()
+        self.release.set()
+
+    def run_async(self, coro: Coroutine[Any, Any, Any]) -> Any:
+        """Exchange an authorization code
+
+        Args:
+            coro (Coroutine[Any, Any, Any]): ignored coroutine
+
+        Returns:
+            Any: token
+        """
+        coro.close()
+        self.exchanges += 1
+        return OAuth2Token(
+            {"access_token": "access", "expires_at": time.time() + 3600},
+        )
+
+    async def refresh_token(self, refresh_token: str) -> dict[str, Any]:
+        """Refresh a token once `release` is set
+
+        Args:
+            refresh_token (str): refresh token
+
+        Raises:
+            RuntimeError: fail is set
+
+        Returns:
+            dict[str, Any]: token response
+        """
+        self.refreshes += 1
+        while not self.release.is_set():
+            await asyncio.sleep(0.01)
+        if self.fail:
+            raise RuntimeError("invalid_grant")
+        return {"access_token": "refreshed", "expires_in": 3600}
+
+
+@pytest.fixture
+def google(monkeypatch: Any) -> FakeGoogle:
+    """Replace Google with a fake"""
+    fake = FakeGoogle()
+    monkeypatch.setattr(
+        google_oauth,
+        "verify_oauth2_setting",
+        lambda: ("client-id", "client-secret", "http://localhost"),
+    )
+    monkeypatch.setattr(google_oauth, "oauth_client", lambda: fake)
+    monkeypatch.setattr(google_oauth, "run_async", fake.run_async)
+    monkeypatch.setattr(
+        google_oauth,
+        "authorization_url",
+        lambda: AUTHORIZATION_URL,
+    )
+    monkeypatch.setattr(
+        google_oauth,
+        "get_user",
+        lambda client, token: ("user-1", "user@example.com"),
+    )
+    return fake
+
+
+@pytest.fixture
+def store() -> MemorySessionStore:
+    """Use an in-memory session store"""
+    memory = MemorySessionStore()
+    google_oauth.set_session_store(memory)
+    return memory
+
+
+def app() -> None:
+    """Page showing the login and reading its own cookie"""
+    import streamlit as st
+
+    from streamlit_google_oauth.google_oauth import (
+        cookie_controller,
+        google_oauth2_required,
+    )
+
+    @google_oauth2_required
+    def main() -> None:
+        st.write(st.session_state.user_email)
+        st.write(st.session_state["token"]["access_token"])
+        st.write(str(cookie_controller().get("opengpts_user_id")))
+
+    main()
+
+
+def save_session(
+    store: MemorySessionStore,
+    session_id: str,
+    expires_in: float,
+    refresh_token: Optional[str] = "refresh",  # noqa: S107
+) -> None:
+    """Store a login as if another tab had logged in
+
+    Args:
+        store (MemorySessionStore): session store
+        session_id (str): session id
+        expires_in (float): seconds until the access token expires
+        refresh_token (Optional[str], optional): \
+            refresh token. Defaults to "refresh".
+    """
+    token: dict[str, Any] = {
+        "access_token": "access",
+        "expires_at": time.time() + expires_in,
+    }
+    if refresh_token is not None:
+        token["refresh_token"] = refresh_token
+    store.set(
+        session_id,
+        {
+            "token": token,
+            "user_id": "user-1",
+            "user_email": "user@example.com",
+        },
+        ttl=60,
+    )
+
+
+def open_tab(session_id: str) -> AppTest:
+    """A tab whose browser reported the session cookie
+
+    Args:
+        session_id (str): session id in the cookie
+
+    Returns:
+        AppTest: tab
+    """
+    tab = AppTest.from_function(app)
+    tab.session_state["cookies"] = {SESSION_COOKIE_NAME: session_id}
+    return tab
+
+
+def wait_until(condition: Any, timeout: float = 5) -> None:
+    """Wait for a background refresh
+
+    Args:
+        condition (Any): callable returning True when done
+        timeout (float, optional): seconds. Defaults to 5.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def markdown(tab: AppTest) -> list[str]:
+    """Markdown values of the last run
+
+    Args:
+        tab (AppTest): tab
+
+    Returns:
+        list[str]: values
+    """
+    return [m.value for m in tab.markdown]
+
+
+def test_login_restore_and_read_app_cookie(
+    google: FakeGoogle,
+    store: MemorySessionStore,
+) -> None:
+    """Log in, restore in a new tab and read an app cookie in both runs"""
+    login = AppTest.from_function(app)
+    login.query_params["code"] = "code"
+    login.run()
+    # the cookie component reports and reruns the page
+    login.session_state["cookies"] = {}
+    login.run()
+    assert not login.exception
+    assert markdown(login) == ["user@example.com", "access", "None"]
+    (session_id,) = store.sessions
+
+    tab = open_tab(session_id)
+    tab.session_state["cookies"]["opengpts_user_id"] = "opengpts-1"
+    for _ in range(2):
+        tab.run()
+        assert not tab.exception
+        assert markdown(tab) == ["user@example.com", "access", "opengpts-1"]
+    assert google.exchanges == 1
+
+
+def test_login_waits_for_cookies_and_clears_code(
+    google: FakeGoogle,
+    store: MemorySessionStore,
+) -> None:
+    """The code is used once; a reload restores from the cookie"""
+    login = AppTest.from_function(app)
+    login.query_params["code"] = "code"
+    login.run()
+    assert markdown(login) == []
+    assert google.exchanges == 0
+
+    login.session_state["cookies"] = {}
+    login.run()
+    assert google.exchanges == 1
+    assert "code" not in login.query_params
+    (session_id,) = store.sessions
+
+    # reload of a URL that still has the code, before the cookies arrive
+    reload = AppTest.from_function(app)
+    reload.query_params["code"] = "code"
+    reload.run()
+    assert markdown(reload) == []
+    reload.session_state["cookies"] = {SESSION_COOKIE_NAME: session_id}
+    reload.run()
+    assert markdown(reload) == ["user@example.com", "access", "None"]
+    assert google.exchanges == 1
+
+
+def test_login_prompt_after_cookies_reported(
+    google: FakeGoogle,
+    store: MemorySessionStore,
+) -> None:
+    """The login prompt waits for the browser cookies"""
+    tab = AppTest.from_function(app)
+    tab.run()
+    assert markdown(tab) == []
+    tab.run()
+    assert markdown(tab) == []
+    tab.session_state["cookies"] = {}
+    tab.run()
+    (prompt,) = markdown(tab)
+    assert AUTHORIZATION_URL in prompt
+
+
+@pytest.mark.parametrize(
+    ("expires_in", "expected"),
+    [(TOKEN_REFRESH_MARGIN + 60, False), (TOKEN_REFRESH_MARGIN - 60, True)],
+)
+def test_expires_soon(expires_in: float, expected: bool) -> None:
+    """Tokens are refreshed TOKEN_REFRESH_MARGIN seconds ahead"""
+    token = OAuth2Token({"access_token": "a", "expires_in": expires_in})
+    assert google_oauth.expires_soon(token) is expected
+    assert not google_oauth.expires_soon(OAuth2Token({"access_token": "a"}))
+
+
+def test_refresh_access_token_keeps_refresh_token(google: FakeGoogle) -> None:
+    """Google omits the refresh token; the expiry is recomputed"""
+    token = OAuth2Token(
+        {"access_token": "a", "refresh_token": "r", "expires_at": 1},
+    )
+    refreshed = asyncio.run(google_oauth.refresh_access_token(google, token))
+    assert refreshed["access_token"] == "refreshed"  # noqa: S105
+    assert refreshed["refresh_token"] == "r"  # noqa: S105
+    assert not refreshed.is_expired()
+
+
+def test_refresh_ahead_of_expiry_once_per_session(
+    google: FakeGoogle,
+    store: MemorySessionStore,
+) -> None:
+    """Tabs keep the old token while one refresh runs for the session"""
+    save_session(store, "session-1", expires_in=TOKEN_REFRESH_MARGIN / 2)
+    google.release.clear()
+
+    first = open_tab("session-1")
+    first.run()
+    second = open_tab("session-1")
+    second.run()
+    for tab in (first, second):
+        assert markdown(tab) == ["user@example.com", "access", "None"]
+    wait_until(lambda: google.refreshes == 1)
+
+    google.release.set()
+    wait_until(
+        lambda: store.sessions["session-1"]["token"]["access_token"]
+        == "refreshed",  # noqa: S105
+    )
+    # the other tab and a new tab pick the refreshed token from the store
+    third = open_tab("session-1")
+    for tab in (first, third):
+        tab.run()
+        assert markdown(tab) == ["user@example.com", "refreshed", "None"]
+    assert google.refreshes == 1
+
+
+def test_expired_token_waits_for_refresh(
+    google: FakeGoogle,
+    store: MemorySessionStore,
+) -> None:
+    """An expired token cannot be used until it is refreshed"""
+    save_session(store, "session-1", expires_in=-10)
+    tab = open_tab("session-1")
+    tab.run()
+    assert markdown(tab) == ["user@example.com", "refreshed", "None"]
+    assert google.refreshes == 1
+
+
+@pytest.mark.parametrize("refresh_token", ["refresh", None])
+def test_expired_token_logs_out(
+    google: FakeGoogle,
+    store: MemorySessionStore,
+    refresh_token: Optional[str],
+) -> None:
+    """A token that cannot be refreshed ends the login and its cookie"""
+    google.fail = True
+    save_session(
+        store,
+        "session-1",
+        expires_in=-10,
+        refresh_token=refresh_token,
+    )
+    tab = open_tab("session-1")
+    tab.run()
+    assert not tab.exception
+    (prompt,) = markdown(tab)
+    assert AUTHORIZATION_URL in prompt
+    assert store.sessions == {}
+    assert SESSION_COOKIE_NAME not in tab.session_state["cookies"]
+    assert tab.session_state["token"] is None
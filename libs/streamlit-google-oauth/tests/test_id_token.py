@@ -0,0 +1,220 @@
+"""id_token tests"""
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator
+
+import jwt
+import pytest
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+from streamlit_google_oauth.id_token import (
+    IDTokenVerifier,
+    InvalidIDTokenError,
+)
+
+AUDIENCE = "client-id"
+ISSUER = "https://accounts.google.com"
+
+
+class TokenIssuer:
+    """Stand-in for Google: signing keys, ID tokens and the JWKS"""
+
+    def __init__(self) -> None:
+        """コンストラクタ"""
+        self.keys: dict[str, rsa.RSAPrivateKey] = {}
+        self.published: list[str] = []
+        self.jwks_requests = 0
+
+    def add_key(self, kid: str, publish: bool = True) -> None:
+        """Create a signing key
+
+        Args:
+            kid (str): key id
+            publish (bool, optional): \
+                list it in the JWKS. Defaults to True.
+        """
+        self.keys[kid] = rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=2048,
+        )
+        if publish:
+            self.published.append(kid)
+
+    def jwks(self) -> dict[str, Any]:
+        """JWKS of the published keys
+
+        Returns:
+            dict[str, Any]: JWKS
+        """
+        keys = []
+        for kid in self.published:
+            jwk = json.loads(RSAAlgorithm.to_jwk(self.keys[kid].public_key()))
+            keys.append({**jwk, "kid": kid, "use": "sig", "alg": "RS256"})
+        return {"keys": keys}
+
+    def token(self, kid: str, **claims: Any) -> str:
+        """Signed ID token
+
+        Args:
+            kid (str): signing key id
+            **claims (Any): claims overriding the defaults
+
+        Returns:
+            str: ID token
+        """
+        now = int(time.time())
+        payload = {
+            "iss": ISSUER,
+            "sub": "user-1",
+            "aud": AUDIENCE,
+            "email": "user@example.com",
+            "iat": now,
+            "exp": now + 3600,
+            **claims,
+        }
+        return jwt.encode(
+            payload,
+            self.keys[kid],
+            algorithm="RS256",
+            headers={"kid": kid},
+        )
+
+
+@pytest.fixture()
+def issuer() -> TokenIssuer:
+    """Token issuer with one published key
+
+    Returns:
+        TokenIssuer: issuer
+    """
+    issuer = TokenIssuer()
+    issuer.add_key("key-1")
+    return issuer
+
+
+@pytest.fixture()
+def jwks_uri(issuer: TokenIssuer) -> Iterator[str]:
+    """Local JWKS endpoint of the issuer
+
+    Args:
+        issuer (TokenIssuer): issuer
+
+    Yields:
+        Iterator[str]: JWKS url
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:  # noqa: N802
+            issuer.jwks_requests += 1
+            body = json.dumps(issuer.jwks()).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://127.0.0.1:{server.server_port}/certs"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture()
+def verifier(jwks_uri: str) -> IDTokenVerifier:
+    """Verifier using the local JWKS
+
+    Args:
+        jwks_uri (str): JWKS url
+
+    Returns:
+        IDTokenVerifier: verifier
+    """
+    return IDTokenVerifier(
+        audience=AUDIENCE,
+        jwks_uri=jwks_uri,
+        refetch_cooldown=0,
+    )
+
+
+def test_valid_token(issuer: TokenIssuer, verifier: IDTokenVerifier) -> None:
+    """Claims of a valid token are returned, the JWKS is cached"""
+    for _ in range(2):
+        claims = verifier.verify(issuer.token("key-1"))
+        assert claims["sub"] == "user-1"
+        assert claims["email"] == "user@example.com"
+    assert issuer.jwks_requests == 1
+
+
+@pytest.mark.parametrize(
+    "claims",
+    [
+        {"aud": "another-client-id"},
+        {"iss": "https://accounts.example.com"},
+        {"iat": int(time.time()) - 7200, "exp": int(time.time()) - 3600},
+    ],
+    ids=["audience", "issuer", "expired"],
+)
+def test_rejected_token(
+    issuer: TokenIssuer,
+    verifier: IDTokenVerifier,
+    claims: dict[str, Any],
+) -> None:
+    """Tokens for another client, from another issuer or expired fail"""
+    with pytest.raises(InvalidIDTokenError):
+        verifier.verify(issuer.token("key-1", **claims))
+
+
+def test_unknown_kid_refetches_jwks(
+    issuer: TokenIssuer,
+    verifier: IDTokenVerifier,
+) -> None:
+    """A key published after the JWKS was cached is picked up"""
+    verifier.verify(issuer.token("key-1"))
+    issuer.add_key("key-2")
+
+    claims = verifier.verify(issuer.token("key-2"))
+    assert claims["sub"] == "user-1"
+    assert issuer.jwks_requests == 2
+
+
+def test_unpublished_kid(
+    issuer: TokenIssuer,
+    verifier: IDTokenVerifier,
+) -> None:
+    """A key missing even from the refetched JWKS fails"""
+    verifier.verify(issuer.token("key-1"))
+    issuer.add_key("forged", publish=False)
+
+    with pytest.raises(InvalidIDTokenError):
+        verifier.verify(issuer.token("forged"))
+    assert issuer.jwks_requests == 2
+
+
+def test_unknown_kid_refetch_cooldown(
+    issuer: TokenIssuer,
+    jwks_uri: str,
+) -> None:
+    """Unknown key ids do not refetch the JWKS within the cooldown"""
+    verifier = IDTokenVerifier(
+        audience=AUDIENCE,
+        jwks_uri=jwks_uri,
+        refetch_cooldown=60,
+    )
+    verifier.verify(issuer.token("key-1"))
+    issuer.add_key("forged", publish=False)
+
+    for _ in range(3):
+        with pytest.raises(InvalidIDTokenError):
+            verifier.verify(issuer.token("forged"))
+    assert issuer.jwks_requests == 1
@@ -0,0 +1,46 @@
+"""session_store tests"""
+
+import sqlite3
+import stat
+from pathlib import Path
+
+from cryptography.fernet import Fernet
+
+from streamlit_google_oauth.session_store import SQLiteSessionStore
+
+DATA = {
+    "token": {"access_token": "secret-access-token"},
+    "user_id": "user-1",
+    "user_email": "user@example.com",
+}
+
+
+def test_sqlite_store_encrypts_tokens(tmp_path: Path) -> None:
+    """Tokens round-trip but are not readable in the file"""
+    path = tmp_path / "sessions.sqlite3"
+    store = SQLiteSessionStore(path, Fernet.generate_key())
+    store.set("session-1", DATA, ttl=60)
+
+    assert store.get("session-1") == DATA
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
+    with sqlite3.connect(path) as conn:
+        (stored,) = conn.execute("SELECT data FROM oauth_sessions").fetchone()
+    assert b"secret-access-token" not in stored
+
+    store.delete("session-1")
+    assert store.get("session-1") is None
+
+
+def test_sqlite_store_ignores_other_keys(tmp_path: Path) -> None:
+    """Sessions written with another key are treated as missing"""
+    path = tmp_path / "sessions.sqlite3"
+    path.touch(mode=0o644)
+    SQLiteSessionStore(path, Fernet.generate_key()).set(
+        "session-1",
+        DATA,
+        ttl=60,
+    )
+
+    store = SQLiteSessionStore(path, Fernet.generate_key())
+    assert store.get("session-1") is None
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600